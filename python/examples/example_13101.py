@@ -1,12 +1,48 @@
 # 📖 Chapter: Chapter 9: Advanced MCP Patterns
 # 📖 Section: 9.4 Custom Protocol Extensions
 
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from mcp_server import MCPServer
+
 class ExtendedMCPServer(MCPServer):
     """MCP server with custom protocol extensions."""
+
+    # list_changed notification -> catalog whose cached count it invalidates
+    LIST_CHANGED = {
+        'notifications/resources/list_changed': 'resources',
+        'notifications/tools/list_changed': 'tools'
+    }
     
-    def __init__(self):
+    def __init__(self, max_batch_parallelism: int = 16, operation_timeout: float = 30.0,
+                 notification_sender: Callable[[Dict], None] = None):
         super().__init__()
         self.custom_methods: Dict[str, callable] = {}
+        # Upper bound on concurrent operations per batch; a batch may ask for fewer
+        self.max_batch_parallelism = max_batch_parallelism
+        self.operation_timeout = operation_timeout
+        # Sends a JSON-RPC notification to the client (used by streamed batches)
+        self.notification_sender = notification_sender
+        self.counters: Dict[str, int] = {
+            'requests_total': 0,
+            'requests_failed': 0,
+            'batch_operations_total': 0,
+            'batch_operations_failed': 0,
+            'batch_operations_timed_out': 0,
+            'batch_operations_deduplicated': 0
+        }
+        # 'resources' / 'tools' -> count, or None until listed once
+        self.catalog_counts: Dict[str, Optional[int]] = {'resources': None, 'tools': None}
+        self._counter_lock = threading.Lock()
+        # Shared by every batch, so max_batch_parallelism bounds the whole server
+        self._batch_executor = ThreadPoolExecutor(max_workers=max_batch_parallelism,
+                                                  thread_name_prefix='mcp-batch')
+        self._batch_slots = threading.BoundedSemaphore(max_batch_parallelism)
         self.register_custom_methods()
     
     def register_custom_methods(self):
@@ -20,6 +56,10 @@ class ExtendedMCPServer(MCPServer):
     def handle_request(self, request: Dict) -> Dict:
         """Handle requests including custom methods."""
         method = request.get('method')
+        self._count('requests_total')
+
+        if method in self.LIST_CHANGED:
+            self.on_catalog_changed(self.LIST_CHANGED[method])
         
         # Check for custom method
         if method in self.custom_methods:
@@ -34,6 +74,7 @@ class ExtendedMCPServer(MCPServer):
                     'result': result
                 }
             except Exception as e:
+                self._count('requests_failed')
                 return {
                     'jsonrpc': '2.0',
                     'id': request.get('id'),
@@ -56,38 +97,239 @@ class ExtendedMCPServer(MCPServer):
         }
     
     def _custom_metrics(self, params: Dict) -> Dict:
-        """Custom metrics endpoint."""
-        return {
-            'requests_total': self._get_request_count(),
-            'active_connections': self._get_active_connections(),
-            'resource_count': len(self.list_resources()),
-            'tool_count': len(self.list_tools())
-        }
-    
+        """Custom metrics endpoint.
+
+        Reads counters kept up to date as requests run; the catalog is only
+        listed the first time and again after it changed (on_catalog_changed,
+        or a list_changed notification received or sent).
+        """
+        with self._counter_lock:
+            metrics = dict(self.counters)
+        metrics['active_connections'] = self._get_active_connections()
+        metrics['resource_count'] = self._catalog_count('resources', self.list_resources)
+        metrics['tool_count'] = self._catalog_count('tools', self.list_tools)
+        return metrics
+
+    def on_catalog_changed(self, kind: str, delta: int = None):
+        """Record that resources or tools were added (delta > 0) or removed.
+
+        Without a delta (e.g. on a list_changed notification) the count is
+        re-listed at the next metrics scrape.
+        """
+        with self._counter_lock:
+            if delta is None or self.catalog_counts[kind] is None:
+                self.catalog_counts[kind] = None
+            else:
+                self.catalog_counts[kind] += delta
+
+    def send_notification(self, method: str, params: Dict = None):
+        """Send a notification to the client; list_changed also resets the count."""
+        if method in self.LIST_CHANGED:
+            self.on_catalog_changed(self.LIST_CHANGED[method])
+        if self.notification_sender is not None:
+            self.notification_sender({'jsonrpc': '2.0', 'method': method, 'params': params or {}})
+
     def _custom_batch(self, params: Dict) -> Dict:
-        """Custom batch operation endpoint."""
+        """Custom batch operation endpoint.
+
+        Operations run concurrently, at most max_parallel at a time (capped by
+        max_batch_parallelism). Each has a timeout (per operation "timeout",
+        else the batch "timeout", else operation_timeout); a timed-out
+        operation is reported as such, although its thread is not interrupted.
+        Identical read_resource operations run once. With "stream": true every
+        result is also sent as a notifications/custom/batch/result as soon as
+        it is ready. The response lists results in request order.
+        """
         operations = params.get('operations', [])
-        results = []
-        
-        for op in operations:
-            try:
-                if op['type'] == 'read_resource':
-                    result = self.read_resource(op['uri'])
-                elif op['type'] == 'call_tool':
-                    result = self.call_tool(op['tool'], op['arguments'])
-                else:
-                    result = {'error': 'Unknown operation type'}
-                
-                results.append({
-                    'operation_id': op.get('id'),
-                    'status': 'success',
-                    'result': result
-                })
-            except Exception as e:
-                results.append({
-                    'operation_id': op.get('id'),
-                    'status': 'error',
-                    'error': str(e)
-                })
-        
-        return {'results': results}
\ No newline at end of file
+        max_parallel = min(int(params.get('max_parallel', self.max_batch_parallelism)),
+                           self.max_batch_parallelism)
+        timeout = params.get('timeout', self.operation_timeout)
+        stream = params.get('stream', False) and self.notification_sender is not None
+        start = time.monotonic()
+
+        results: List[Optional[Dict]] = [None] * len(operations)
+        for index, result in self.iter_batch(operations, max_parallel, timeout):
+            results[index] = result
+            if stream:
+                self.send_notification('notifications/custom/batch/result',
+                                       dict(result, batch_id=params.get('batch_id'), index=index))
+
+        summary = {'success': 0, 'error': 0, 'timeout': 0}
+        for result in results:
+            summary[result['status']] += 1
+        summary['duration'] = time.monotonic() - start
+        return {'results': results, 'summary': summary}
+
+    def iter_batch(self, operations: List[Dict], max_parallel: int = None,
+                   timeout: float = None) -> Iterator[Tuple[int, Dict]]:
+        """Yield (index, result) for each operation in completion order.
+
+        Workers are shared server-wide: concurrent batches together never run
+        more than max_batch_parallelism operations.
+        """
+        max_parallel = max(1, max_parallel or self.max_batch_parallelism)
+        default_timeout = self.operation_timeout if timeout is None else timeout
+
+        # Unique work items; duplicates of a read share the first one's indices
+        pending = deque()
+        reads: Dict[str, List[int]] = {}
+        for index, op in enumerate(operations):
+            if op.get('type') == 'read_resource' and 'uri' in op:
+                if op['uri'] in reads:
+                    reads[op['uri']].append(index)
+                    continue
+                reads[op['uri']] = [index]
+                pending.append(reads[op['uri']])
+            else:
+                pending.append([index])
+        self._count('batch_operations_total', len(operations))
+        self._count('batch_operations_deduplicated', len(operations) - len(pending))
+
+        running: Dict[Future, Tuple[List[int], float, float]] = {}  # future -> (indices, deadline, timeout)
+        abandoned = set()  # timed out but still occupying a worker
+
+        def results_for(indices: List[int], outcome: Dict):
+            for index in indices:
+                yield index, dict(outcome, operation_id=operations[index].get('id'))
+
+        try:
+            while pending or running:
+                abandoned = {future for future in abandoned if not future.done()}
+                while pending and len(running) + len(abandoned) < max_parallel:
+                    # Block for a slot only when nothing of ours is in flight to wait on
+                    if not self._batch_slots.acquire(blocking=not (running or abandoned)):
+                        break
+                    indices = pending.popleft()
+                    op = operations[indices[0]]
+                    op_timeout = op.get('timeout', default_timeout)
+                    deadline = time.monotonic() + op_timeout if op_timeout else float('inf')
+                    future = self._batch_executor.submit(self._run_operation, op)
+                    future.add_done_callback(lambda _: self._batch_slots.release())
+                    running[future] = (indices, deadline, op_timeout)
+
+                nearest = min((entry[1] for entry in running.values()), default=float('inf'))
+                wait_for = None if nearest == float('inf') else max(0.0, nearest - time.monotonic())
+                done, _ = wait(list(running) + list(abandoned), timeout=wait_for,
+                               return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future in running:
+                        indices = running.pop(future)[0]
+                        outcome = future.result()
+                        if outcome['status'] == 'error':
+                            self._count('batch_operations_failed', len(indices))
+                        yield from results_for(indices, outcome)
+
+                now = time.monotonic()
+                for future, (indices, deadline, op_timeout) in list(running.items()):
+                    if now >= deadline:
+                        del running[future]
+                        if not future.cancel():
+                            abandoned.add(future)
+                        self._count('batch_operations_timed_out', len(indices))
+                        yield from results_for(indices, {
+                            'status': 'timeout',
+                            'error': f'Operation timed out after {op_timeout}s'
+                        })
+        finally:
+            # Consumer stopped early: drop whatever has not started yet
+            for future in running:
+                future.cancel()
+
+    def _run_operation(self, op: Dict) -> Dict:
+        try:
+            if op['type'] == 'read_resource':
+                result = self.read_resource(op['uri'])
+            elif op['type'] == 'call_tool':
+                result = self.call_tool(op['tool'], op['arguments'])
+            else:
+                return {'status': 'error', 'error': 'Unknown operation type'}
+            return {'status': 'success', 'result': result}
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._counter_lock:
+            self.counters[name] += amount
+
+    def _catalog_count(self, kind: str, list_catalog: Callable) -> int:
+        count = self.catalog_counts[kind]
+        if count is None:
+            count = len(list_catalog())
+            with self._counter_lock:
+                self.catalog_counts[kind] = count
+        return count
+
+
+def benchmark_batch(operations: int = 200, latency: float = 0.02, distinct_uris: int = 50,
+                    catalog_size: int = 10_000, parallelism_levels=(8, 32, 64)) -> Dict:
+    """200-operation batch: sequential vs concurrent, plus metrics scrape cost."""
+
+    class SimulatedServer(ExtendedMCPServer):
+        def read_resource(self, uri: str):
+            time.sleep(latency)
+            return {'contents': [{'uri': uri, 'text': uri * 8}]}
+
+        def call_tool(self, name: str, arguments: Dict):
+            time.sleep(latency * (50 if arguments.get('slow') else 2))
+            return {'content': [{'type': 'text', 'text': name}]}
+
+        def list_resources(self):
+            return [{'uri': f'doc://{i}', 'name': f'doc {i}'} for i in range(catalog_size)]
+
+        def list_tools(self):
+            return [{'name': f'tool_{i}'} for i in range(catalog_size // 10)]
+
+    # Three reads per tool call; reads repeat across distinct_uris
+    batch = []
+    for i in range(operations):
+        if i % 4 == 3:
+            batch.append({'id': i, 'type': 'call_tool', 'tool': 'transform',
+                          'arguments': {'n': i, 'slow': i == operations - 1}})
+        else:
+            batch.append({'id': i, 'type': 'read_resource', 'uri': f'doc://{i % distinct_uris}'})
+
+    server = SimulatedServer()
+    report = {'operations': operations}
+
+    # Previous behaviour: one operation at a time
+    start = time.perf_counter()
+    for op in batch:
+        server._run_operation(op)
+    report['sequential_s'] = round(time.perf_counter() - start, 3)
+
+    for level in parallelism_levels:
+        first = {}
+        start = time.perf_counter()
+
+        def on_result(message: Dict):
+            first.setdefault('at', time.perf_counter() - start)
+
+        server = SimulatedServer(max_batch_parallelism=level, notification_sender=on_result)
+        result = server.handle_request({'jsonrpc': '2.0', 'id': 1, 'method': 'custom/batch',
+                                        'params': {'operations': batch, 'stream': True,
+                                                   'timeout': 0.5}})['result']
+        report[f'parallel_{level}'] = {
+            'total_s': round(time.perf_counter() - start, 3),
+            'first_result_s': round(first['at'], 3),
+            'summary': {k: v for k, v in result['summary'].items() if k != 'duration'},
+            'deduplicated': server.counters['batch_operations_deduplicated']
+        }
+
+    # Metrics scrape: re-listing the catalog every time vs counters
+    scrapes = 200
+    start = time.perf_counter()
+    for _ in range(scrapes):
+        len(server.list_resources()), len(server.list_tools())
+    report['metrics_relist_us'] = round((time.perf_counter() - start) / scrapes * 1e6, 1)
+    server._custom_metrics({})
+    start = time.perf_counter()
+    for _ in range(scrapes):
+        server._custom_metrics({})
+    report['metrics_counters_us'] = round((time.perf_counter() - start) / scrapes * 1e6, 1)
+
+    return report
+
+
+if __name__ == "__main__":
+    print(benchmark_batch())
@@ -3,7 +3,13 @@
 
 from typing import Dict, List, Optional
 from enum import Enum
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import asyncio
+import heapq
+import itertools
+import random
+import threading
 import time
 
 class AgentRole(Enum):
@@ -14,57 +20,170 @@ class AgentRole(Enum):
 
 class MultiAgentOrchestrator:
     """Orchestrate multiple AI agents using MCP."""
-    
-    def __init__(self):
+
+    def __init__(self, max_workers: int = 32, latency_smoothing: float = 0.2,
+                 initial_latency: float = 1.0, client_factory=None):
         self.agents: Dict[str, Dict] = {}
         self.agent_connections: Dict[str, 'MCPClient'] = {}
         self.workflows: Dict[str, List[Dict]] = {}
-    
-    def register_agent(self, agent_id: str, role: AgentRole, 
-                       mcp_server_endpoint: str, capabilities: List[str]):
+        self.client_factory = client_factory or MCPClient
+        self.latency_smoothing = latency_smoothing
+        self.initial_latency = initial_latency
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        # Scheduler state, guarded by _lock
+        self._lock = threading.Lock()
+        self.capability_bits: Dict[str, int] = {}
+        # required capability mask -> heap of (score, seq, agent_id, version)
+        # over agents with that capability set and a free slot
+        self._candidate_heaps: Dict[int, List] = {}
+        self._heap_members: Dict[int, int] = {}
+        self._agent_heaps: Dict[str, List[int]] = {}  # agent_id -> heaps it belongs to
+        self._versions: Dict[str, int] = {}
+        # required capability mask -> FIFO of (seq, task, future) waiting for a slot
+        self._queued: Dict[int, deque] = {}
+        self._sequence = itertools.count()
+
+    def register_agent(self, agent_id: str, role: AgentRole,
+                       mcp_server_endpoint: str, capabilities: List[str],
+                       max_concurrent_tasks: int = 1):
         """Register an agent with the orchestrator."""
-        self.agents[agent_id] = {
-            "agent_id": agent_id,
-            "role": role.value,
-            "mcp_server_endpoint": mcp_server_endpoint,
-            "capabilities": capabilities,
-            "status": "available",
-            "registered_at": time.time()
-        }
-        
         # Connect to agent's MCP server
-        client = MCPClient(mcp_server_endpoint)
-        self.agent_connections[agent_id] = client
-    
+        client = self.client_factory(mcp_server_endpoint)
+
+        with self._lock:
+            previous = self.agents.get(agent_id)
+            if previous is not None:
+                # Re-registration: drop the old capability set's heap memberships
+                for required in self._agent_heaps[agent_id]:
+                    self._heap_members[required] -= 1
+
+            self.agents[agent_id] = {
+                "agent_id": agent_id,
+                "role": role.value,
+                "mcp_server_endpoint": mcp_server_endpoint,
+                "capabilities": capabilities,
+                "capability_mask": self._capability_mask(capabilities, register=True),
+                "max_concurrent_tasks": max_concurrent_tasks,
+                # Tasks already running on the agent still hold their slots
+                "in_flight": previous["in_flight"] if previous else 0,
+                "ewma_latency": self.initial_latency,
+                "status": "available",
+                "registered_at": time.time()
+            }
+            self._update_status(self.agents[agent_id])
+            self.agent_connections[agent_id] = client
+            # Never reset: heap entries from the old registration must stay stale
+            self._versions.setdefault(agent_id, 0)
+
+            mask = self.agents[agent_id]["capability_mask"]
+            self._agent_heaps[agent_id] = []
+            for required in self._candidate_heaps:
+                if mask & required == required:
+                    self._heap_members[required] += 1
+                    self._agent_heaps[agent_id].append(required)
+            self._publish(agent_id)
+            dispatch = self._dispatch_queued(agent_id)
+
+        self._start(dispatch)
+
     def assign_task(self, agent_id: str, task: Dict) -> Dict:
         """Assign task to specific agent."""
-        if agent_id not in self.agents:
-            raise ValueError(f"Agent {agent_id} not registered")
-        
-        agent = self.agents[agent_id]
-        if agent["status"] != "available":
-            return {"status": "error", "message": "Agent not available"}
-        
-        # Update agent status
-        agent["status"] = "busy"
-        
+        with self._lock:
+            if agent_id not in self.agents:
+                raise ValueError(f"Agent {agent_id} not registered")
+
+            agent = self.agents[agent_id]
+            if agent["in_flight"] >= agent["max_concurrent_tasks"]:
+                return {"status": "error", "message": "Agent not available"}
+            self._acquire_slot(agent_id)
+
+        return self._run_task(agent_id, task)
+
+    def submit_task(self, task: Dict) -> Future:
+        """Schedule a task on the least-loaded capable agent.
+
+        If every capable agent is at its concurrency limit the task waits in
+        a FIFO queue and starts when one of them frees a slot.
+        """
+        future: Future = Future()
+        with self._lock:
+            required = self._capability_mask(task.get("required_capabilities", []))
+            if required is None or not self._has_capable_agent(required):
+                future.set_exception(
+                    ValueError(f"No agent has capabilities for task: {task.get('id')}")
+                )
+                return future
+
+            agent_id = self._pop_candidate(required)
+            if agent_id is None:
+                self._queued.setdefault(required, deque()).append((next(self._sequence), task, future))
+                return future
+            self._acquire_slot(agent_id)
+
+        self._start([(agent_id, task, future)])
+        return future
+
+    def _run_task(self, agent_id: str, task: Dict) -> Dict:
+        """Execute on a reserved slot, then release it."""
         # Execute task via MCP
         client = self.agent_connections[agent_id]
+        start = time.perf_counter()
         try:
             result = client.call_tool("execute_task", {"task": task})
-            
-            # Update agent status
-            agent["status"] = "available"
-            
+
             return {
                 "status": "success",
                 "agent_id": agent_id,
                 "result": result
             }
         except Exception as e:
-            agent["status"] = "available"
             return {"status": "error", "message": str(e)}
-    
+        finally:
+            self.release_agent(agent_id, time.perf_counter() - start)
+
+    def reserve_agent(self, task: Dict) -> Optional[str]:
+        """Reserve a slot on the least-loaded capable agent, for callers that
+        run the task themselves; None if every capable agent is busy.
+
+        Pair each reservation with release_agent.
+        """
+        with self._lock:
+            required = self._capability_mask(task.get("required_capabilities", []))
+            if required is None:
+                return None
+            agent_id = self._pop_candidate(required)
+            if agent_id is not None:
+                self._acquire_slot(agent_id)
+            return agent_id
+
+    def release_agent(self, agent_id: str, duration: float):
+        """Free a reserved slot, recording how long the task took."""
+        with self._lock:
+            self._release_slot(agent_id, duration)
+            dispatch = self._dispatch_queued(agent_id)
+        self._start(dispatch)
+
+    def _start(self, dispatch: List):
+        for agent_id, task, future in dispatch:
+            if not future.set_running_or_notify_cancel():
+                self._cancel_reserved(agent_id)
+                continue
+            self.executor.submit(self._run_into, agent_id, task, future)
+
+    def _run_into(self, agent_id: str, task: Dict, future: Future):
+        future.set_result(self._run_task(agent_id, task))
+
+    def _cancel_reserved(self, agent_id: str):
+        """Give back a slot reserved for a task that was cancelled while queued."""
+        with self._lock:
+            agent = self.agents[agent_id]
+            agent["in_flight"] -= 1
+            self._update_status(agent)
+            self._publish(agent_id)
+            dispatch = self._dispatch_queued(agent_id)
+        self._start(dispatch)
+
     def coordinate_workflow(self, workflow_id: str, tasks: List[Dict]) -> Dict:
         """Coordinate workflow across multiple agents."""
         workflow_result = {
@@ -73,59 +192,218 @@ class MultiAgentOrchestrator:
             "overall_status": "pending",
             "start_time": time.time()
         }
-        
+
         # Assign tasks to appropriate agents
         for task in tasks:
-            # Select agent based on task requirements
-            agent_id = self._select_agent_for_task(task)
-            
-            if not agent_id:
+            # Waits for a slot when every capable agent is busy
+            try:
+                task_result = self.submit_task(task).result()
+            except ValueError:
                 workflow_result["overall_status"] = "error"
                 workflow_result["error"] = f"No suitable agent for task: {task['id']}"
                 break
-            
-            # Assign and execute task
-            task_result = self.assign_task(agent_id, task)
-            
+
             workflow_result["tasks"].append({
                 "task_id": task["id"],
-                "agent_id": agent_id,
+                "agent_id": task_result.get("agent_id"),
                 "status": task_result["status"],
                 "result": task_result.get("result")
             })
-            
+
             # Check if workflow should continue
             if task_result["status"] != "success":
                 workflow_result["overall_status"] = "failed"
                 break
-        
+
         if workflow_result["overall_status"] == "pending":
             workflow_result["overall_status"] = "completed"
-        
+
         workflow_result["duration"] = time.time() - workflow_result["start_time"]
-        
+
         self.workflows[workflow_id] = workflow_result
-        
+
         return workflow_result
-    
+
     def _select_agent_for_task(self, task: Dict) -> Optional[str]:
-        """Select appropriate agent for task."""
-        required_capabilities = task.get("required_capabilities", [])
-        
-        # Find agents with required capabilities
-        suitable_agents = []
-        for agent_id, agent in self.agents.items():
+        """Select the least-loaded capable agent with a free slot (without reserving it)."""
+        with self._lock:
+            required = self._capability_mask(task.get("required_capabilities", []))
+            if required is None:
+                return None
+            agent_id = self._pop_candidate(required)
+            if agent_id is not None:
+                # Peek only: put the agent back as it was
+                self._publish(agent_id)
+            return agent_id
+
+    # Scheduler internals; callers hold _lock
+
+    def _capability_mask(self, capabilities: List[str], register: bool = False) -> Optional[int]:
+        """Bitmask of capabilities; None if one is unknown (no agent can have it)."""
+        mask = 0
+        for capability in capabilities:
+            bit = self.capability_bits.get(capability)
+            if bit is None:
+                if not register:
+                    return None
+                bit = self.capability_bits[capability] = 1 << len(self.capability_bits)
+            mask |= bit
+        return mask
+
+    def _has_capable_agent(self, required: int) -> bool:
+        self._candidate_heap(required)
+        return self._heap_members[required] > 0
+
+    def _candidate_heap(self, required: int) -> List:
+        """Heap for a capability combination, built the first time it is requested."""
+        heap = self._candidate_heaps.get(required)
+        if heap is None:
+            heap = self._candidate_heaps[required] = []
+            members = 0
+            for agent_id, agent in self.agents.items():
+                if agent["capability_mask"] & required == required:
+                    members += 1
+                    self._agent_heaps[agent_id].append(required)
+                    if agent["in_flight"] < agent["max_concurrent_tasks"]:
+                        heap.append(self._heap_entry(agent_id))
+            heapq.heapify(heap)
+            self._heap_members[required] = members
+        return heap
+
+    def _heap_entry(self, agent_id: str):
+        agent = self.agents[agent_id]
+        # Expected completion time if this agent takes one more task
+        score = (agent["in_flight"] + 1) * agent["ewma_latency"] / agent["max_concurrent_tasks"]
+        return (score, next(self._sequence), agent_id, self._versions[agent_id])
+
+    def _publish(self, agent_id: str):
+        """Record an agent's new load in every heap it belongs to."""
+        agent = self.agents[agent_id]
+        self._versions[agent_id] += 1
+        if agent["in_flight"] >= agent["max_concurrent_tasks"]:
+            return  # full agents are not candidates; older entries are now stale
+
+        entry = self._heap_entry(agent_id)
+        for required in self._agent_heaps[agent_id]:
+            heap = self._candidate_heaps[required]
+            heapq.heappush(heap, entry)
+            if len(heap) > 4 * self._heap_members[required] + 64:
+                self._compact(required)
+
+    def _compact(self, required: int):
+        heap = self._candidate_heaps[required]
+        heap[:] = [entry for entry in heap if entry[3] == self._versions[entry[2]]]
+        heapq.heapify(heap)
+
+    def _pop_candidate(self, required: int) -> Optional[str]:
+        heap = self._candidate_heap(required)
+        while heap:
+            _, _, agent_id, version = heapq.heappop(heap)
+            if version == self._versions[agent_id]:
+                return agent_id
+        return None
+
+    def _acquire_slot(self, agent_id: str):
+        agent = self.agents[agent_id]
+        agent["in_flight"] += 1
+        self._update_status(agent)
+        self._publish(agent_id)
+
+    def _release_slot(self, agent_id: str, duration: float):
+        agent = self.agents[agent_id]
+        agent["in_flight"] -= 1
+        agent["ewma_latency"] += self.latency_smoothing * (duration - agent["ewma_latency"])
+        self._update_status(agent)
+        self._publish(agent_id)
+
+    def _update_status(self, agent: Dict):
+        agent["status"] = "available" if agent["in_flight"] < agent["max_concurrent_tasks"] else "busy"
+
+    def _dispatch_queued(self, agent_id: str) -> List:
+        """Hand queued tasks the agent can serve to its free slots, oldest first."""
+        agent = self.agents[agent_id]
+        mask = agent["capability_mask"]
+        dispatch = []
+        while agent["in_flight"] < agent["max_concurrent_tasks"]:
+            oldest = None
+            for required, queue in self._queued.items():
+                if queue and mask & required == required:
+                    if oldest is None or queue[0][0] < self._queued[oldest][0][0]:
+                        oldest = required
+            if oldest is None:
+                break
+            _, task, future = self._queued[oldest].popleft()
+            self._acquire_slot(agent_id)
+            dispatch.append((agent_id, task, future))
+        return dispatch
+
+
+def benchmark_scheduling(num_agents: int = 10_000, num_capabilities: int = 16,
+                         decisions: int = 100_000, seed: int = 7) -> Dict:
+    """Scheduling decisions per second: indexed scheduler vs the per-task scan."""
+    rng = random.Random(seed)
+    capabilities = [f"capability_{i}" for i in range(num_capabilities)]
+
+    class IdleClient:
+        def __init__(self, endpoint: str):
+            self.endpoint = endpoint
+
+        def call_tool(self, name: str, arguments: Dict) -> Dict:
+            return {}
+
+    orchestrator = MultiAgentOrchestrator(client_factory=IdleClient)
+    for i in range(num_agents):
+        orchestrator.register_agent(
+            f"agent-{i}", AgentRole.EXECUTOR, f"mcp://agent-{i}",
+            rng.sample(capabilities, rng.randint(3, 6)), max_concurrent_tasks=4
+        )
+
+    tasks = [
+        {"id": f"task-{i}", "required_capabilities": rng.sample(capabilities, rng.randint(1, 2))}
+        for i in range(decisions)
+    ]
+
+    # Reserve a slot for each task; release every task once 20k are in flight
+    in_flight = deque()
+    start = time.perf_counter()
+    for task in tasks:
+        agent_id = orchestrator.reserve_agent(task)
+        if agent_id is not None:
+            in_flight.append(agent_id)
+        if len(in_flight) > 20_000:
+            orchestrator.release_agent(in_flight.popleft(), rng.uniform(0.05, 0.5))
+    indexed_per_s = decisions / (time.perf_counter() - start)
+
+    # Previous selection: rebuild sets for every agent and take the first
+    # available match; one task per agent, half of the agents busy
+    def scan(task: Dict) -> Optional[str]:
+        for agent_id, agent in orchestrator.agents.items():
             if agent["status"] != "available":
                 continue
-            
-            agent_capabilities = set(agent["capabilities"])
-            required_set = set(required_capabilities)
-            
-            if required_set.issubset(agent_capabilities):
-                suitable_agents.append(agent_id)
-        
-        if not suitable_agents:
-            return None
-        
-        # Select agent based on load balancing or priority
-        return suitable_agents[0]
\ No newline at end of file
+            if set(task["required_capabilities"]).issubset(set(agent["capabilities"])):
+                return agent_id
+        return None
+
+    for agent in orchestrator.agents.values():
+        agent["status"] = "available"
+    busy = deque()
+    sample = tasks[:decisions // 20]
+    start = time.perf_counter()
+    for task in sample:
+        agent_id = scan(task)
+        if agent_id is not None:
+            orchestrator.agents[agent_id]["status"] = "busy"
+            busy.append(agent_id)
+        if len(busy) > num_agents // 2:
+            orchestrator.agents[busy.popleft()]["status"] = "available"
+    scan_per_s = len(sample) / (time.perf_counter() - start)
+
+    return {
+        "agents": num_agents,
+        "indexed_decisions_per_s": round(indexed_per_s),
+        "scan_decisions_per_s": round(scan_per_s)
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_scheduling())
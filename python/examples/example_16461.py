@@ -1,20 +1,128 @@
 # 📖 Chapter: Chapter 13: Multi-Agent Systems with MCP
 # 📖 Section: 13.2 Agent-to-Agent Communication via MCP
 
+import asyncio
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+from example_16260 import AgentRole, MultiAgentOrchestrator
+
+class AgentMailbox:
+    """Bounded per-agent mailbox: one FIFO per priority, highest priority first."""
+
+    PRIORITIES = ("high", "normal", "low")
+    OVERFLOW_POLICIES = ("drop_lowest", "reject", "error")
+
+    def __init__(self, max_size: int = 10_000, overflow_policy: str = "drop_lowest"):
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.queues = {priority: deque() for priority in self.PRIORITIES}
+        self.size = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        # Futures of get_messages() calls waiting for the mailbox to fill
+        self._waiters: List[asyncio.Future] = []
+
+    def put(self, message_entry: Dict) -> bool:
+        """Queue a message; returns whether the mailbox went from empty to non-empty."""
+        priority = message_entry["priority"]
+        if priority not in self.queues:
+            priority = message_entry["priority"] = "normal"
+
+        with self._lock:
+            if self.size >= self.max_size:
+                if self.overflow_policy == "error":
+                    raise OverflowError(f"Mailbox for {message_entry['to_agent_id']} is full")
+                victim = self._lowest_nonempty()
+                if (self.overflow_policy == "reject"
+                        or self.PRIORITIES.index(victim) < self.PRIORITIES.index(priority)):
+                    # Never evict a more urgent message for a less urgent one
+                    self.dropped += 1
+                    return False
+                self.queues[victim].popleft()
+                self.size -= 1
+                self.dropped += 1
+
+            self.queues[priority].append(message_entry)
+            self.size += 1
+            became_nonempty = self.size == 1
+            waiters, self._waiters = self._waiters, []
+
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+        return became_nonempty
+
+    def take(self, max_messages: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            limit = self.size if max_messages is None else min(max_messages, self.size)
+            messages = []
+            for priority in self.PRIORITIES:
+                queue = self.queues[priority]
+                while queue and len(messages) < limit:
+                    messages.append(queue.popleft())
+            self.size -= len(messages)
+            return messages
+
+    def add_waiter(self, waiter: asyncio.Future) -> bool:
+        """Register a waiter unless messages are already queued."""
+        with self._lock:
+            if self.size:
+                return False
+            self._waiters.append(waiter)
+            return True
+
+    def remove_waiter(self, waiter: asyncio.Future):
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _lowest_nonempty(self) -> str:
+        for priority in reversed(self.PRIORITIES):
+            if self.queues[priority]:
+                return priority
+        return self.PRIORITIES[-1]
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
 class AgentCommunicationManager:
     """Manage communication between agents via MCP."""
-    
-    def __init__(self, orchestrator: MultiAgentOrchestrator):
+
+    def __init__(self, orchestrator: MultiAgentOrchestrator, mailbox_size: int = 10_000,
+                 overflow_policy: str = "drop_lowest"):
         self.orchestrator = orchestrator
-        self.message_queue: Dict[str, List[Dict]] = {}  # agent_id -> messages
-        self.subscriptions: Dict[str, List[str]] = {}  # agent_id -> [subscribed_topics]
-    
-    def send_message(self, from_agent_id: str, to_agent_id: str, 
+        self.mailbox_size = mailbox_size
+        self.overflow_policy = overflow_policy
+        self.message_queue: Dict[str, AgentMailbox] = {}  # agent_id -> mailbox
+        self.subscriptions: Dict[str, Set[str]] = {}  # agent_id -> {subscribed_topics}
+        self.topic_subscribers: Dict[str, Set[str]] = {}  # topic -> {agent_ids}
+        self._mailbox_lock = threading.Lock()
+
+    def _mailbox(self, agent_id: str) -> AgentMailbox:
+        mailbox = self.message_queue.get(agent_id)
+        if mailbox is None:
+            with self._mailbox_lock:
+                mailbox = self.message_queue.setdefault(
+                    agent_id, AgentMailbox(self.mailbox_size, self.overflow_policy)
+                )
+        return mailbox
+
+    def send_message(self, from_agent_id: str, to_agent_id: str,
                     message: Dict, priority: str = "normal"):
         """Send message from one agent to another."""
-        if to_agent_id not in self.message_queue:
-            self.message_queue[to_agent_id] = []
-        
+        if self._deliver(from_agent_id, to_agent_id, message, priority):
+            self._notify([to_agent_id])
+
+    def _deliver(self, from_agent_id: str, to_agent_id: str, message: Dict,
+                 priority: str = "normal") -> bool:
+        """Queue without notifying; True if the recipient needs a notification."""
         message_entry = {
             "from_agent_id": from_agent_id,
             "to_agent_id": to_agent_id,
@@ -23,89 +131,239 @@ class AgentCommunicationManager:
             "timestamp": time.time(),
             "id": str(uuid.uuid4())
         }
-        
-        self.message_queue[to_agent_id].append(message_entry)
-        
-        # Sort by priority
-        priority_order = {"high": 0, "normal": 1, "low": 2}
-        self.message_queue[to_agent_id].sort(
-            key=lambda x: (priority_order.get(x["priority"], 1), x["timestamp"])
-        )
-        
-        # Notify receiving agent via MCP resource
-        if to_agent_id in self.orchestrator.agent_connections:
-            client = self.orchestrator.agent_connections[to_agent_id]
+        # Only the empty -> non-empty transition is signalled; an agent that
+        # has not drained its mailbox yet already knows there is mail
+        return self._mailbox(to_agent_id).put(message_entry)
+
+    def _notify(self, agent_ids: List[str]):
+        """Tell each recipient once that it has new messages."""
+        for agent_id in agent_ids:
+            # Notify receiving agent via MCP resource
+            client = self.orchestrator.agent_connections.get(agent_id)
+            if client is None:
+                continue
             try:
                 # Use MCP notification mechanism
-                client.notify_resource_change(f"message://{to_agent_id}/new")
-            except:
+                client.notify_resource_change(f"message://{agent_id}/new")
+            except Exception:
                 pass  # Agent may not support notifications
-    
-    def get_messages(self, agent_id: str, max_messages: int = None) -> List[Dict]:
-        """Get messages for agent."""
-        messages = self.message_queue.get(agent_id, [])
-        
-        if max_messages:
-            messages = messages[:max_messages]
-        
-        # Remove retrieved messages
-        if agent_id in self.message_queue:
-            if max_messages:
-                self.message_queue[agent_id] = self.message_queue[agent_id][max_messages:]
-            else:
-                self.message_queue[agent_id] = []
-        
-        return messages
-    
+
+    async def get_messages(self, agent_id: str, max_messages: int = None,
+                           timeout: float = None) -> List[Dict]:
+        """Get messages for agent, waiting for one to arrive if the mailbox is empty.
+
+        Returns an empty list if nothing arrives within timeout.
+        """
+        mailbox = self._mailbox(agent_id)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            messages = mailbox.take(max_messages)
+            if messages:
+                return messages
+
+            waiter = asyncio.get_running_loop().create_future()
+            if not mailbox.add_waiter(waiter):
+                continue  # a message arrived in between
+            remaining = None if deadline is None else deadline - time.monotonic()
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                return mailbox.take(max_messages)
+            finally:
+                mailbox.remove_waiter(waiter)
+
+    def get_messages_nowait(self, agent_id: str, max_messages: int = None) -> List[Dict]:
+        """Get whatever messages are queued for agent, without waiting."""
+        return self._mailbox(agent_id).take(max_messages)
+
     def subscribe_to_topic(self, agent_id: str, topic: str):
         """Subscribe agent to topic for pub/sub communication."""
-        if agent_id not in self.subscriptions:
-            self.subscriptions[agent_id] = []
-        
-        if topic not in self.subscriptions[agent_id]:
-            self.subscriptions[agent_id].append(topic)
-    
-    def publish_to_topic(self, from_agent_id: str, topic: str, message: Dict):
+        self.subscriptions.setdefault(agent_id, set()).add(topic)
+        self.topic_subscribers.setdefault(topic, set()).add(agent_id)
+
+    def unsubscribe_from_topic(self, agent_id: str, topic: str):
+        """Remove a topic subscription."""
+        self.subscriptions.get(agent_id, set()).discard(topic)
+        subscribers = self.topic_subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(agent_id)
+            if not subscribers:
+                del self.topic_subscribers[topic]
+
+    def publish_to_topic(self, from_agent_id: str, topic: str, message: Dict,
+                         priority: str = "normal"):
         """Publish message to topic (pub/sub pattern)."""
-        subscribers = [
-            agent_id for agent_id, topics in self.subscriptions.items()
-            if topic in topics
-        ]
-        
-        for subscriber_id in subscribers:
-            if subscriber_id != from_agent_id:
-                self.send_message(from_agent_id, subscriber_id, message)
-    
+        subscribers = self.topic_subscribers.get(topic, ())
+        self._deliver_all(from_agent_id, subscribers, message, priority)
+
     def broadcast_message(self, from_agent_id: str, message: Dict,
                          filter_capabilities: List[str] = None):
         """Broadcast message to multiple agents."""
-        recipients = []
-        
-        for agent_id, agent in self.orchestrator.agents.items():
-            if agent_id == from_agent_id:
-                continue
-            
-            if filter_capabilities:
-                agent_capabilities = set(agent["capabilities"])
-                required_set = set(filter_capabilities)
-                if not required_set.issubset(agent_capabilities):
-                    continue
-            
-            recipients.append(agent_id)
-        
+        required = 0
+        if filter_capabilities:
+            required = self.orchestrator._capability_mask(filter_capabilities)
+            if required is None:
+                return  # no agent has an unknown capability
+
+        recipients = [
+            agent_id for agent_id, agent in self.orchestrator.agents.items()
+            if agent["capability_mask"] & required == required
+        ]
+
         # Send to all recipients
-        for recipient_id in recipients:
-            self.send_message(from_agent_id, recipient_id, message)
-    
+        self._deliver_all(from_agent_id, recipients, message)
+
+    def _deliver_all(self, from_agent_id: str, recipients, message: Dict,
+                     priority: str = "normal"):
+        """Queue for every recipient first, then send the notifications as one batch."""
+        to_notify = [
+            recipient_id for recipient_id in list(recipients)
+            if recipient_id != from_agent_id
+            and self._deliver(from_agent_id, recipient_id, message, priority)
+        ]
+        self._notify(to_notify)
+
     def establish_direct_communication(self, agent1_id: str, agent2_id: str) -> Dict:
         """Establish direct communication channel between two agents."""
         # Create shared resource for communication
         channel_id = f"{agent1_id}_{agent2_id}"
-        
+
         # Both agents can read/write to this channel
         return {
             "channel_id": channel_id,
             "resource_uri": f"agent://channel/{channel_id}",
             "agents": [agent1_id, agent2_id],
             "established_at": time.time()
-        }
\ No newline at end of file
+        }
+
+
+async def benchmark_messaging(num_agents: int = 1_000, num_topics: int = 100,
+                              messages: int = 200_000, topics_per_agent: int = 5,
+                              seed: int = 11) -> Dict:
+    """Messages/sec for direct sends and topic publishes; sort-on-send for comparison."""
+    rng = random.Random(seed)
+
+    class CountingClient:
+        notifications = 0
+
+        def __init__(self, endpoint: str):
+            self.endpoint = endpoint
+
+        def notify_resource_change(self, uri: str):
+            CountingClient.notifications += 1
+
+    orchestrator = MultiAgentOrchestrator(client_factory=CountingClient)
+    agent_ids = [f"agent-{i}" for i in range(num_agents)]
+    for agent_id in agent_ids:
+        orchestrator.register_agent(agent_id, AgentRole.EXECUTOR, f"mcp://{agent_id}", ["chat"])
+
+    manager = AgentCommunicationManager(orchestrator)
+    topics = [f"topic-{t}" for t in range(num_topics)]
+    for agent_id in agent_ids:
+        for topic in rng.sample(topics, topics_per_agent):
+            manager.subscribe_to_topic(agent_id, topic)
+
+    priorities = ("high", "normal", "normal", "low")
+    sends = [(rng.choice(agent_ids), rng.choice(agent_ids), rng.choice(priorities))
+             for _ in range(messages)]
+
+    # Consumers drain their mailboxes as messages arrive
+    received = {"count": 0}
+
+    async def consume(agent_id: str):
+        while True:
+            batch = await manager.get_messages(agent_id, max_messages=256)
+            received["count"] += len(batch)
+
+    consumers = [asyncio.create_task(consume(agent_id)) for agent_id in agent_ids]
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    for i, (sender, recipient, priority) in enumerate(sends):
+        manager.send_message(sender, recipient, {"seq": i}, priority)
+        if i % 1000 == 999:
+            await asyncio.sleep(0)  # let consumers run
+    while received["count"] < messages:
+        await asyncio.sleep(0.001)
+    direct_per_s = messages / (time.perf_counter() - start)
+    direct_notifications = CountingClient.notifications
+
+    publishes = messages // 100
+    delivered_before = received["count"]
+    start = time.perf_counter()
+    expected = 0
+    for i in range(publishes):
+        sender = rng.choice(agent_ids)
+        topic = rng.choice(topics)
+        subscribers = manager.topic_subscribers.get(topic, ())
+        expected += len(subscribers) - (sender in subscribers)
+        manager.publish_to_topic(sender, topic, {"seq": i})
+        if i % 20 == 19:
+            await asyncio.sleep(0)
+    while received["count"] - delivered_before < expected:
+        await asyncio.sleep(0.001)
+    fan_out_per_s = expected / (time.perf_counter() - start)
+
+    for consumer in consumers:
+        consumer.cancel()
+
+    # Send cost with a backlog (consumers falling behind), against the
+    # previous append-and-re-sort on every message
+    class LegacyManager(AgentCommunicationManager):
+        def _deliver(self, from_agent_id, to_agent_id, message, priority="normal"):
+            queue = self.legacy_queues.setdefault(to_agent_id, [])
+            queue.append({
+                "from_agent_id": from_agent_id,
+                "to_agent_id": to_agent_id,
+                "message": message,
+                "priority": priority,
+                "timestamp": time.time(),
+                "id": str(uuid.uuid4())
+            })
+            queue.sort(key=lambda x: (priority_order.get(x["priority"], 1), x["timestamp"]))
+            return True
+
+    priority_order = {"high": 0, "normal": 1, "low": 2}
+    backlog_agents = agent_ids[:100]
+    report = {
+        "agents": num_agents,
+        "topics": num_topics,
+        "async_direct_messages_per_s": round(direct_per_s),
+        "async_topic_deliveries_per_s": round(fan_out_per_s),
+        "notifications_per_message": round(direct_notifications / messages, 2)
+    }
+
+    for backlog in (10, 1_000):
+        timings = {}
+        for name, cls in (("mailbox", AgentCommunicationManager), ("legacy", LegacyManager)):
+            sender = cls(orchestrator)
+            sender.legacy_queues = {}
+            for agent_id in backlog_agents:
+                for i in range(backlog):
+                    sender._deliver("seed", agent_id, {"seq": i}, priorities[i % 4])
+            sample = [(rng.choice(agent_ids), rng.choice(backlog_agents), rng.choice(priorities))
+                      for _ in range(10_000)]
+            start = time.perf_counter()
+            for from_id, to_id, priority in sample:
+                sender.send_message(from_id, to_id, {}, priority)
+            timings[name] = round(len(sample) / (time.perf_counter() - start))
+        report[f"send_per_s_backlog_{backlog}"] = timings
+
+    # Topic publish: subscriber lookup only, index vs scanning every agent's list
+    legacy_subscriptions = {agent_id: list(topics_) for agent_id, topics_ in manager.subscriptions.items()}
+    sample = [rng.choice(topics) for _ in range(2_000)]
+    start = time.perf_counter()
+    for topic in sample:
+        [agent_id for agent_id, subscribed in legacy_subscriptions.items() if topic in subscribed]
+    scan_us = (time.perf_counter() - start) / len(sample) * 1e6
+    start = time.perf_counter()
+    for topic in sample:
+        list(manager.topic_subscribers.get(topic, ()))
+    index_us = (time.perf_counter() - start) / len(sample) * 1e6
+    report["subscriber_lookup_us"] = {"index": round(index_us, 2), "scan": round(scan_us, 1)}
+
+    return report
+
+
+if __name__ == "__main__":
+    print(asyncio.run(benchmark_messaging()))
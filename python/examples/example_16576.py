@@ -1,75 +1,408 @@
 # 📖 Chapter: Chapter 13: Multi-Agent Systems with MCP
 # 📖 Section: 13.2 Agent-to-Agent Communication via MCP
 
+import copy
+import json
+import threading
+import time
+from collections import deque
+from threading import Lock
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from example_16260 import MultiAgentOrchestrator
+
+class StateSnapshot:
+    """Immutable view of one version of a shared state."""
+
+    __slots__ = ("state_id", "value", "version", "updated_at")
+
+    def __init__(self, state_id: str, value: Dict, version: int, updated_at: float):
+        self.state_id = state_id
+        # Read-only view; writers build a new dict instead of mutating this one
+        self.value = MappingProxyType(value)
+        self.version = version
+        self.updated_at = updated_at
+
+def apply_patch(target: Mapping, patch: Dict, deleted: List[List[str]] = ()) -> Dict:
+    """Apply a state patch: remove each key path in deleted, then merge patch.
+
+    Dicts in patch merge recursively; any other value, None included, is
+    set as is. Returns a new dict; target is not modified.
+    """
+    # dict() copies a mappingproxy item by item; .copy() copies the dict behind it
+    result = target.copy() if isinstance(target, (dict, MappingProxyType)) else dict(target)
+    nested_deleted: Dict[str, List[List[str]]] = {}
+    for path in deleted:
+        if len(path) == 1:
+            result.pop(path[0], None)
+        else:
+            nested_deleted.setdefault(path[0], []).append(path[1:])
+
+    for key, value in patch.items():
+        if isinstance(value, dict):
+            base = result.get(key)
+            result[key] = apply_patch(base if isinstance(base, Mapping) else {}, value,
+                                      nested_deleted.pop(key, ()))
+        else:
+            result[key] = value
+    for key, paths in nested_deleted.items():
+        base = result.get(key)
+        if isinstance(base, Mapping):
+            result[key] = apply_patch(base, {}, paths)
+    return result
+
+def diff_patch(old: Mapping, new: Mapping) -> Tuple[Dict, List[List[str]]]:
+    """(patch, deleted) that turns old into new under apply_patch.
+
+    Values shared by both (the same object) are skipped, so diffing two
+    versions that share structure only walks what changed.
+    """
+    patch: Dict = {}
+    deleted = [[key] for key in old if key not in new]
+    for key, value in new.items():
+        previous = old.get(key, _MISSING)
+        if previous is value:
+            continue
+        if isinstance(value, Mapping) and isinstance(previous, Mapping):
+            nested_patch, nested_deleted = diff_patch(previous, value)
+            if nested_patch:
+                patch[key] = nested_patch
+            deleted.extend([key] + path for path in nested_deleted)
+        elif isinstance(value, Mapping):
+            # Sent whole: a dict patch onto a non-dict starts from {}
+            patch[key] = dict(value)
+        elif previous is _MISSING or value != previous:
+            patch[key] = value
+    return patch, deleted
+
+def split_merge_patch(merge_patch: Dict) -> Tuple[Dict, List[List[str]]]:
+    """(patch, deleted) for a JSON merge patch (RFC 7386), where None deletes."""
+    patch: Dict = {}
+    deleted: List[List[str]] = []
+    for key, value in merge_patch.items():
+        if value is None:
+            deleted.append([key])
+        elif isinstance(value, dict):
+            nested_patch, nested_deleted = split_merge_patch(value)
+            # Kept even when empty: merging {} still turns a non-dict into {}
+            patch[key] = nested_patch
+            deleted.extend([key] + path for path in nested_deleted)
+        else:
+            patch[key] = value
+    return patch, deleted
+
+_MISSING = object()
+
 class SharedStateManager:
     """Manage shared state between agents via MCP resources."""
-    
-    def __init__(self, orchestrator: MultiAgentOrchestrator):
+
+    def __init__(self, orchestrator: MultiAgentOrchestrator, history_size: int = 256):
         self.orchestrator = orchestrator
         self.shared_state: Dict[str, Dict] = {}  # state_id -> state_data
         self.state_locks: Dict[str, 'Lock'] = {}  # state_id -> lock
-    
+        # state_id -> recent (version, patch, deleted, previous value) for get_changes_since
+        self.history_size = history_size
+        self.state_history: Dict[str, deque] = {}
+        self.state_subscribers: Dict[str, List[Callable[[Dict], None]]] = {}
+
     def create_shared_state(self, state_id: str, initial_value: Dict,
                            access_policy: str = "read_write"):
         """Create shared state resource."""
+        now = time.time()
         self.shared_state[state_id] = {
             "state_id": state_id,
-            "value": initial_value,
+            "snapshot": StateSnapshot(state_id, copy.deepcopy(initial_value), 0, now),
             "access_policy": access_policy,
-            "created_at": time.time(),
-            "updated_at": time.time(),
-            "version": 0
+            "created_at": now
         }
-        
+
         # Create lock for state
         self.state_locks[state_id] = Lock()
-        
+        self.state_history[state_id] = deque(maxlen=self.history_size)
+
         # Register as MCP resource
         resource_uri = f"state://{state_id}"
         return resource_uri
-    
-    def read_shared_state(self, state_id: str, agent_id: str) -> Dict:
-        """Read shared state."""
-        if state_id not in self.shared_state:
-            raise ValueError(f"State {state_id} not found")
-        
-        state = self.shared_state[state_id]
-        
+
+    def read_shared_state(self, state_id: str, agent_id: str,
+                          if_version_newer: int = None,
+                          keys: List[str] = None) -> Optional[Dict]:
+        """Read shared state without locking.
+
+        The value is a read-only view of one version, so it never changes
+        under the reader and nothing is copied. Nested values are shared with
+        the stored version; copy one before modifying it. With if_version_newer,
+        returns None when the state is still at that version. keys limits the
+        view to those top-level keys.
+        """
+        state = self._state(state_id)
+
         # Check access policy
         if state["access_policy"] == "write_only":
             raise PermissionError(f"Agent {agent_id} cannot read state {state_id}")
-        
+
+        snapshot = state["snapshot"]
+        if if_version_newer is not None and snapshot.version <= if_version_newer:
+            return None
+
+        return {
+            "state_id": state_id,
+            "value": snapshot.value if keys is None else MappingProxyType(
+                {key: snapshot.value[key] for key in keys if key in snapshot.value}
+            ),
+            "version": snapshot.version,
+            "updated_at": snapshot.updated_at
+        }
+
+    def get_changes_since(self, state_id: str, agent_id: str, version: int) -> Optional[Dict]:
+        """Patch and deleted key paths from version to the current version.
+
+        Returns None when version is older than the retained history; the
+        caller should read the full state instead.
+        """
+        state = self._state(state_id)
+        if state["access_policy"] == "write_only":
+            raise PermissionError(f"Agent {agent_id} cannot read state {state_id}")
+
+        snapshot = state["snapshot"]
+        history = list(self.state_history[state_id])
+        if version >= snapshot.version:
+            return {"state_id": state_id, "base_version": version,
+                    "version": snapshot.version, "patch": {}, "deleted": []}
+        if not history or history[0][0] > version + 1:
+            return None
+
+        # Diff against the kept base value: composing patches cannot express
+        # "replace this object" once a key was deleted and set again
+        base = next(previous for patch_version, _, _, previous in history
+                    if patch_version == version + 1)
+        patch, deleted = diff_patch(base, snapshot.value)
+        return {"state_id": state_id, "base_version": version,
+                "version": snapshot.version, "patch": patch, "deleted": deleted}
+
+    def subscribe_to_state(self, state_id: str, callback: Callable[[Dict], None]):
+        """Call callback with {state_id, base_version, version, patch, deleted}
+        after each update; apply_patch(value, patch, deleted) brings a copy up to date.
+        """
+        self._state(state_id)
+        self.state_subscribers.setdefault(state_id, []).append(callback)
+
+    def update_shared_state(self, state_id: str, agent_id: str,
+                          updates: Dict, merge: bool = True,
+                          expected_version: int = None) -> Dict:
+        """Update shared state.
+
+        merge=True sets the given top-level keys (None is stored, not
+        deleted); merge=False replaces the value. With expected_version this is a
+        compare-and-swap: nothing is written unless the state is still at that
+        version, and the result has "applied": False with the current version.
+        """
+        mode = "merge" if merge else "replace"
+        return self._commit(state_id, agent_id, updates, expected_version, mode)
+
+    def patch_shared_state(self, state_id: str, agent_id: str, patch: Dict,
+                           expected_version: int = None) -> Dict:
+        """Apply a JSON merge patch; nested objects merge and None deletes."""
+        return self._commit(state_id, agent_id, patch, expected_version, "patch")
+
+    def compare_and_swap(self, state_id: str, agent_id: str, expected_version: int,
+                         updates: Dict) -> Dict:
+        """Merge updates only if nobody has written since expected_version."""
+        return self.update_shared_state(state_id, agent_id, updates,
+                                        expected_version=expected_version)
+
+    def _commit(self, state_id: str, agent_id: str, changes: Dict,
+                expected_version: Optional[int], mode: str) -> Dict:
+        state = self._state(state_id)
+
+        # Check access policy
+        if state["access_policy"] == "read_only":
+            raise PermissionError(f"Agent {agent_id} cannot write to state {state_id}")
+
+        # Copied once; the changes and the values built from them are never mutated
+        changes = copy.deepcopy(changes)
+        while True:
+            # Build the new value without holding the lock ...
+            snapshot = state["snapshot"]
+            if expected_version is not None and snapshot.version != expected_version:
+                return self._conflict(snapshot)
+
+            # Every mode is expressed as a patch plus deleted key paths, kept
+            # apart so stored None values survive; the new value is that patch
+            # applied, so replaying the history gives the live state
+            if mode == "merge":
+                # Given keys are replaced whole, not merged into
+                patch, deleted = {}, []
+                for key, item in changes.items():
+                    key_patch, key_deleted = diff_patch(
+                        {key: snapshot.value[key]} if key in snapshot.value else {},
+                        {key: item}
+                    )
+                    patch.update(key_patch)
+                    deleted.extend(key_deleted)
+            elif mode == "replace":
+                patch, deleted = diff_patch(snapshot.value, changes)
+            else:
+                patch, deleted = split_merge_patch(changes)
+            value = apply_patch(snapshot.value, patch, deleted)
+
+            # ... and hold it only to check nobody committed meanwhile and swap
+            with self.state_locks[state_id]:
+                if state["snapshot"] is not snapshot:
+                    if expected_version is not None:
+                        return self._conflict(state["snapshot"])
+                    continue  # lost the race: rebuild on the newer version
+                new_snapshot = StateSnapshot(state_id, value, snapshot.version + 1, time.time())
+                state["snapshot"] = new_snapshot
+                self.state_history[state_id].append(
+                    (new_snapshot.version, patch, deleted, snapshot.value)
+                )
+            break
+
+        change = {
+            "state_id": state_id,
+            "base_version": snapshot.version,
+            "version": new_snapshot.version,
+            "patch": patch,
+            "deleted": deleted
+        }
+        for callback in self.state_subscribers.get(state_id, ()):
+            callback(change)
+
         return {
             "state_id": state_id,
-            "value": state["value"],
-            "version": state["version"],
-            "updated_at": state["updated_at"]
+            "applied": True,
+            "version": new_snapshot.version,
+            "updated_at": new_snapshot.updated_at
+        }
+
+    def _conflict(self, snapshot: StateSnapshot) -> Dict:
+        return {
+            "state_id": snapshot.state_id,
+            "applied": False,
+            "version": snapshot.version,
+            "updated_at": snapshot.updated_at
         }
-    
-    def update_shared_state(self, state_id: str, agent_id: str, 
-                          updates: Dict, merge: bool = True) -> Dict:
-        """Update shared state."""
-        if state_id not in self.shared_state:
+
+    def _state(self, state_id: str) -> Dict:
+        state = self.shared_state.get(state_id)
+        if state is None:
             raise ValueError(f"State {state_id} not found")
-        
-        with self.state_locks[state_id]:
-            state = self.shared_state[state_id]
-            
-            # Check access policy
-            if state["access_policy"] == "read_only":
-                raise PermissionError(f"Agent {agent_id} cannot write to state {state_id}")
-            
-            # Update state
-            if merge:
-                state["value"].update(updates)
+        return state
+
+
+def benchmark_contention(writers: int = 64, updates_per_writer: int = 500,
+                         state_keys: int = 1_000, readers: int = 4) -> Dict:
+    """Write throughput, CAS retries and read cost with 64 concurrent writers."""
+    manager = SharedStateManager(orchestrator=None)
+    manager.create_shared_state(
+        "board", {f"key_{i}": {"owner": None, "count": 0} for i in range(state_keys)}
+    )
+    notified_bytes = {"patch": 0, "full": 0}
+
+    def on_change(change: Dict):
+        notified_bytes["patch"] += len(json.dumps([change["patch"], change["deleted"]]))
+
+    manager.subscribe_to_state("board", on_change)
+    stop = threading.Event()
+    reads = {"count": 0, "unchanged": 0, "full": 0}
+    replicas: Dict[int, Dict] = {}
+    conflicts = {"count": 0}
+
+    def writer(index: int):
+        for n in range(updates_per_writer):
+            key = f"key_{(index * 7 + n) % state_keys}"
+            # Optimistic read-modify-write: retry on conflict
+            while True:
+                current = manager.read_shared_state("board", f"writer-{index}", keys=[key])
+                entry = current["value"][key]
+                result = manager.compare_and_swap(
+                    "board", f"writer-{index}", current["version"],
+                    {key: {"owner": f"writer-{index}", "count": entry["count"] + 1}}
+                )
+                if result["applied"]:
+                    break
+                conflicts["count"] += 1
+
+    def reader(index: int):
+        # Follow the state with patches, falling back to a full read when behind
+        replica = manager.read_shared_state("board", f"reader-{index}")
+        reads["full"] += 1
+        while True:
+            stopping = stop.is_set()
+            changes = manager.get_changes_since("board", f"reader-{index}", replica["version"])
+            reads["count"] += 1
+            if changes is None:
+                replica = manager.read_shared_state("board", f"reader-{index}")
+                reads["full"] += 1
+            elif not changes["patch"] and not changes["deleted"]:
+                reads["unchanged"] += 1
             else:
-                state["value"] = updates
-            
-            state["version"] += 1
-            state["updated_at"] = time.time()
-            
-            return {
-                "state_id": state_id,
-                "version": state["version"],
-                "updated_at": state["updated_at"]
-            }
\ No newline at end of file
+                replica = {"version": changes["version"],
+                           "value": apply_patch(replica["value"], changes["patch"],
+                                                changes["deleted"])}
+            if stopping:
+                break
+            time.sleep(0.001)
+        replicas[index] = replica["value"]
+
+    reader_threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    writer_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in reader_threads:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+
+    total = writers * updates_per_writer
+    final = manager.read_shared_state("board", "check")["value"]
+    counted = sum(entry["count"] for entry in final.values())
+    full_state_bytes = len(json.dumps(dict(final)))
+
+    # Previous behaviour: lock and mutate the live dict (no lost updates, but
+    # readers share the dict being written and every change ships whole)
+    legacy_value = {f"key_{i}": {"owner": None, "count": 0} for i in range(state_keys)}
+    legacy_lock = Lock()
+
+    def legacy_writer(index: int):
+        for n in range(updates_per_writer):
+            key = f"key_{(index * 7 + n) % state_keys}"
+            with legacy_lock:
+                legacy_value[key] = {"owner": f"writer-{index}",
+                                     "count": legacy_value[key]["count"] + 1}
+
+    legacy_threads = [threading.Thread(target=legacy_writer, args=(i,)) for i in range(writers)]
+    start = time.perf_counter()
+    for thread in legacy_threads:
+        thread.start()
+    for thread in legacy_threads:
+        thread.join()
+    legacy_elapsed = time.perf_counter() - start
+
+    return {
+        "writers": writers,
+        "updates": total,
+        "lost_updates": total - counted,
+        "cas_updates_per_s": round(total / elapsed),
+        "cas_conflicts_per_update": round(conflicts["count"] / total, 2),
+        "locked_in_place_updates_per_s": round(total / legacy_elapsed),
+        "reads": reads["count"],
+        "reads_unchanged": reads["unchanged"],
+        "full_reads": reads["full"],
+        "replicas_match": all(replica == dict(final) for replica in replicas.values()),
+        "notification_bytes_per_update": {
+            "patch": round(notified_bytes["patch"] / total),
+            "full_state": full_state_bytes
+        }
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_contention())
@@ -1,67 +1,429 @@
 # 📖 Chapter: Chapter 13: Multi-Agent Systems with MCP
 # 📖 Section: 13.4 Resource Sharing and Isolation
 
+import asyncio
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+class DeadlockError(RuntimeError):
+    """Raised to the requester whose wait would close a cycle of waiting agents."""
+
+class LockRequest:
+    """One acquire call: the lock it wants plus intention locks on every ancestor."""
+
+    def __init__(self, agent_id: str, resource_uri: str, mode: str,
+                 claims: List[Tuple[str, str]], lease: Optional[float], sequence: int):
+        self.agent_id = agent_id
+        self.resource_uri = resource_uri
+        self.mode = mode
+        self.claims = claims
+        self.claim_map = dict(claims)
+        self.lease = lease
+        self.sequence = sequence
+        self.expires_at: Optional[float] = None
+        self.waiter: Optional[asyncio.Future] = None
+        self.granted = False
+
 class ResourceIsolationManager:
-    """Manage resource isolation between agents."""
-    
-    def __init__(self):
+    """Manage resource isolation between agents.
+
+    Locks are taken on URI hierarchies: a lock on "file://a/" covers
+    "file://a/b.txt". Shared locks are compatible with each other; an
+    exclusive lock excludes every other lock on the node, its ancestors'
+    exclusive holders and its descendants. Waiters are served in FIFO order.
+    """
+
+    # Requested mode -> (mode on the node itself, intention mode on ancestors)
+    MODES = {"shared": ("S", "IS"), "exclusive": ("X", "IX")}
+    COMPATIBLE = {
+        "IS": {"IS", "IX", "S"},
+        "IX": {"IS", "IX"},
+        "S": {"IS", "S"},
+        "X": set()
+    }
+
+    def __init__(self, default_lease: Optional[float] = None, clock=time.monotonic):
         self.agent_resources: Dict[str, set] = {}  # agent_id -> resource_uris
-        self.shared_resources: set = set()
-        self.resource_locks: Dict[str, str] = {}  # resource_uri -> agent_id
         self.isolation_policies: Dict[str, str] = {}  # agent_id -> policy
-    
-    def allocate_resource(self, agent_id: str, resource_uri: str, 
+        # None: locks are held until released, as allocate_resource callers expect
+        self.default_lease = default_lease
+        self.clock = clock
+        self._lock = threading.Lock()
+        # node -> agent_id -> Counter of granted modes
+        self._granted: Dict[str, Dict[str, Counter]] = {}
+        self._held: Dict[str, List[LockRequest]] = {}  # agent_id -> granted requests
+        self._waiting: List[LockRequest] = []  # arrival order
+        self._sequence = 0
+        self.stats = {"granted": 0, "waited": 0, "timeouts": 0, "deadlocks": 0, "expired": 0}
+
+    @property
+    def resource_locks(self) -> Dict[str, str]:
+        """resource_uri -> agent_id for exclusive locks."""
+        with self._lock:
+            return {
+                request.resource_uri: agent_id
+                for agent_id, requests in self._held.items()
+                for request in requests if request.mode == "exclusive"
+            }
+
+    def allocate_resource(self, agent_id: str, resource_uri: str,
                         shared: bool = False, exclusive: bool = False) -> bool:
-        """Allocate resource to agent."""
-        # Check if resource is already allocated exclusively
-        if resource_uri in self.resource_locks:
-            lock_holder = self.resource_locks[resource_uri]
-            if lock_holder != agent_id and exclusive:
-                return False  # Resource locked by another agent
-        
-        # Check if resource is shared
-        if resource_uri in self.shared_resources and exclusive:
-            return False  # Cannot exclusively lock shared resource
-        
-        # Allocate resource
-        if agent_id not in self.agent_resources:
-            self.agent_resources[agent_id] = set()
-        
-        self.agent_resources[agent_id].add(resource_uri)
-        
-        if shared:
-            self.shared_resources.add(resource_uri)
-        else:
-            # Exclusive lock
-            self.resource_locks[resource_uri] = agent_id
-        
-        return True
-    
+        """Allocate resource to agent without waiting; False if it is locked."""
+        mode = "exclusive" if exclusive or not shared else "shared"
+        return self.try_acquire(agent_id, resource_uri, mode)
+
+    def try_acquire(self, agent_id: str, resource_uri: str, mode: str = "exclusive",
+                    lease: float = None) -> bool:
+        """Take the lock if it is free and nobody is queued ahead; never waits."""
+        with self._lock:
+            self._expire_leases_locked()
+            request = self._new_request(agent_id, resource_uri, mode, lease)
+            if self._blocked_by(request, self._waiting) or not self._grantable(request):
+                return False
+            self._grant(request)
+            return True
+
+    async def acquire(self, agent_id: str, resource_uri: str, mode: str = "exclusive",
+                      timeout: float = None, lease: float = None) -> bool:
+        """Wait in FIFO order for the lock; False on timeout.
+
+        Raises DeadlockError if this wait would complete a cycle of agents
+        waiting on each other. With a lease (or default_lease) a granted lock
+        expires unless renew_leases is called, so a crashed agent cannot hold
+        it forever.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else self.clock() + timeout
+
+        with self._lock:
+            self._expire_leases_locked()
+            request = self._new_request(agent_id, resource_uri, mode, lease)
+            if not self._blocked_by(request, self._waiting) and self._grantable(request):
+                self._grant(request)
+                return True
+
+            if self._would_deadlock(request):
+                self.stats["deadlocks"] += 1
+                raise DeadlockError(
+                    f"Agent {agent_id} waiting for {resource_uri} would deadlock"
+                )
+            request.waiter = loop.create_future()
+            self._waiting.append(request)
+            self.stats["waited"] += 1
+
+        while True:
+            now = self.clock()
+            wait = None if deadline is None else deadline - now
+            next_expiry = self._next_expiry()
+            if next_expiry is not None:
+                # Wake up to reclaim locks of holders whose lease ran out
+                until_expiry = max(0.0, next_expiry - now)
+                wait = until_expiry if wait is None else min(wait, until_expiry)
+
+            try:
+                await asyncio.wait_for(asyncio.shield(request.waiter), wait)
+                return True
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                self._abandon(request)
+                raise
+
+            with self._lock:
+                self._expire_leases_locked()
+                if request.granted:
+                    return True
+                if deadline is not None and self.clock() >= deadline:
+                    self._waiting.remove(request)
+                    self.stats["timeouts"] += 1
+                    # Requests queued behind this one may now be grantable
+                    self._grant_waiters()
+                    return False
+
     def release_resource(self, agent_id: str, resource_uri: str):
         """Release resource from agent."""
-        if agent_id in self.agent_resources:
-            self.agent_resources[agent_id].discard(resource_uri)
-        
-        if resource_uri in self.resource_locks:
-            if self.resource_locks[resource_uri] == agent_id:
-                del self.resource_locks[resource_uri]
-        
-        self.shared_resources.discard(resource_uri)
-    
+        with self._lock:
+            for request in self._held.get(agent_id, []):
+                if request.resource_uri == resource_uri:
+                    self._release(request)
+                    break
+            self._grant_waiters()
+
+    def release_all(self, agent_id: str):
+        """Release every lock an agent holds."""
+        with self._lock:
+            for request in list(self._held.get(agent_id, [])):
+                self._release(request)
+            self._grant_waiters()
+
+    def renew_leases(self, agent_id: str):
+        """Extend the leases of every lock the agent holds (a heartbeat)."""
+        with self._lock:
+            now = self.clock()
+            for request in self._held.get(agent_id, []):
+                if request.lease is not None:
+                    request.expires_at = now + request.lease
+
+    def expire_leases(self):
+        """Release locks whose lease has run out."""
+        with self._lock:
+            self._expire_leases_locked()
+
     def check_resource_access(self, agent_id: str, resource_uri: str) -> bool:
-        """Check if agent has access to resource."""
-        # Check if resource is shared
-        if resource_uri in self.shared_resources:
-            return True
-        
-        # Check if agent owns resource
-        if agent_id in self.agent_resources:
-            if resource_uri in self.agent_resources[agent_id]:
-                return True
-        
-        return False
-    
+        """Check if agent holds a lock on the resource or one of its ancestors."""
+        path = set(self._path(resource_uri))
+        with self._lock:
+            return any(
+                request.resource_uri in path
+                for request in self._held.get(agent_id, [])
+            )
+
     def set_isolation_policy(self, agent_id: str, policy: str):
         """Set isolation policy for agent."""
         # Policies: "strict", "moderate", "relaxed"
-        self.isolation_policies[agent_id] = policy
\ No newline at end of file
+        self.isolation_policies[agent_id] = policy
+
+    # Internals; callers hold _lock
+
+    @staticmethod
+    def _path(resource_uri: str) -> List[str]:
+        """Nodes from the root to the resource: file://a/b.txt -> file://, file://a/, file://a/b.txt."""
+        scheme, separator, rest = resource_uri.partition("://")
+        if not separator:
+            scheme, rest = "", resource_uri
+        node = scheme + separator
+        nodes = [node]
+        parts = rest.split("/")
+        for index, part in enumerate(parts):
+            if not part and index == len(parts) - 1:
+                break  # trailing slash: the directory node is already in the path
+            node += part if index == len(parts) - 1 else part + "/"
+            nodes.append(node)
+        return nodes
+
+    def _new_request(self, agent_id: str, resource_uri: str, mode: str,
+                     lease: Optional[float]) -> LockRequest:
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown lock mode: {mode}")
+        own, intention = self.MODES[mode]
+        path = self._path(resource_uri)
+        if path[-1] != resource_uri:
+            path.append(resource_uri)
+        claims = [(node, intention) for node in path[:-1]] + [(path[-1], own)]
+        self._sequence += 1
+        return LockRequest(agent_id, resource_uri, mode, claims,
+                           self.default_lease if lease is None else lease, self._sequence)
+
+    def _grantable(self, request: LockRequest) -> bool:
+        for node, mode in request.claims:
+            holders = self._granted.get(node)
+            if not holders:
+                continue
+            allowed = self.COMPATIBLE[mode]
+            for agent_id, modes in holders.items():
+                if agent_id != request.agent_id and any(m not in allowed for m in modes):
+                    return False
+        return True
+
+    def _conflicts(self, first: LockRequest, second: LockRequest) -> bool:
+        if first.agent_id == second.agent_id:
+            return False
+        second_claims = second.claim_map
+        for node, mode in first.claims:
+            other = second_claims.get(node)
+            if other is not None and other not in self.COMPATIBLE[mode]:
+                return True
+        return False
+
+    def _blocked_by(self, request: LockRequest, queue: List[LockRequest]) -> bool:
+        """True if an earlier queued request conflicts (no barging past the queue)."""
+        return any(self._conflicts(request, earlier) for earlier in queue)
+
+    def _grant(self, request: LockRequest):
+        request.granted = True
+        if request.lease is not None:
+            request.expires_at = self.clock() + request.lease
+        for node, mode in request.claims:
+            self._granted.setdefault(node, {}).setdefault(request.agent_id, Counter())[mode] += 1
+        self._held.setdefault(request.agent_id, []).append(request)
+        self.agent_resources.setdefault(request.agent_id, set()).add(request.resource_uri)
+        self.stats["granted"] += 1
+        if request.waiter is not None and not request.waiter.done():
+            request.waiter.get_loop().call_soon_threadsafe(_resolve, request.waiter)
+
+    def _release(self, request: LockRequest):
+        held = self._held[request.agent_id]
+        held.remove(request)
+        for node, mode in request.claims:
+            holders = self._granted[node]
+            modes = holders[request.agent_id]
+            modes[mode] -= 1
+            if not modes[mode]:
+                del modes[mode]
+            if not modes:
+                del holders[request.agent_id]
+            if not holders:
+                del self._granted[node]
+        if not any(r.resource_uri == request.resource_uri for r in held):
+            self.agent_resources[request.agent_id].discard(request.resource_uri)
+        if not held:
+            del self._held[request.agent_id]
+
+    def _grant_waiters(self):
+        """Grant queued requests in arrival order; a blocked one blocks later conflicting ones."""
+        still_waiting: List[LockRequest] = []
+        for request in self._waiting:
+            if not self._blocked_by(request, still_waiting) and self._grantable(request):
+                self._grant(request)
+            else:
+                still_waiting.append(request)
+        self._waiting = still_waiting
+
+    def _abandon(self, request: LockRequest):
+        with self._lock:
+            if request.granted:
+                self._release(request)
+            elif request in self._waiting:
+                self._waiting.remove(request)
+            self._grant_waiters()
+
+    def _expire_leases_locked(self):
+        now = self.clock()
+        expired = [
+            request for requests in self._held.values() for request in requests
+            if request.expires_at is not None and request.expires_at <= now
+        ]
+        for request in expired:
+            self._release(request)
+            self.stats["expired"] += 1
+        if expired:
+            self._grant_waiters()
+
+    def _next_expiry(self) -> Optional[float]:
+        with self._lock:
+            expiries = [
+                request.expires_at for requests in self._held.values()
+                for request in requests if request.expires_at is not None
+            ]
+        return min(expiries) if expiries else None
+
+    def _waits_for(self, request: LockRequest, queue: List[LockRequest]) -> Set[str]:
+        """Agents the request would wait on: conflicting holders and earlier waiters."""
+        blockers = set()
+        for node, mode in request.claims:
+            allowed = self.COMPATIBLE[mode]
+            for agent_id, modes in self._granted.get(node, {}).items():
+                if agent_id != request.agent_id and any(m not in allowed for m in modes):
+                    blockers.add(agent_id)
+        for earlier in queue:
+            if earlier.sequence < request.sequence and self._conflicts(request, earlier):
+                blockers.add(earlier.agent_id)
+        return blockers
+
+    def _would_deadlock(self, request: LockRequest) -> bool:
+        """Does anything the requester waits on (transitively) wait on the requester?"""
+        queue = self._waiting + [request]
+        waiting_by_agent: Dict[str, List[LockRequest]] = {}
+        for waiting in queue:
+            waiting_by_agent.setdefault(waiting.agent_id, []).append(waiting)
+
+        # Wait-for edges are only computed for agents reached from the requester
+        stack = list(self._waits_for(request, queue))
+        seen = set()
+        while stack:
+            agent_id = stack.pop()
+            if agent_id == request.agent_id:
+                return True
+            if agent_id in seen:
+                continue
+            seen.add(agent_id)
+            for waiting in waiting_by_agent.get(agent_id, ()):
+                stack.extend(self._waits_for(waiting, queue))
+        return False
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(True)
+
+
+async def benchmark_locking(agents: int = 32, directories: int = 10, files_per_directory: int = 100,
+                            duration: float = 2.0, hold: float = 0.0005, seed: int = 5) -> Dict:
+    """Lock throughput on a URI tree, and fairness on one hot resource vs spin-retry."""
+    rng = random.Random(seed)
+    report = {}
+
+    # Throughput: mostly file locks, some directory locks, 20% exclusive
+    manager = ResourceIsolationManager()
+    acquired = Counter()
+
+    async def tree_worker(agent_id: str, stop_at: float):
+        while time.monotonic() < stop_at:
+            directory = rng.randrange(directories)
+            if rng.random() < 0.1:
+                uri = f"file://data/{directory}/"
+            else:
+                uri = f"file://data/{directory}/{rng.randrange(files_per_directory)}.json"
+            mode = "exclusive" if rng.random() < 0.2 else "shared"
+            if await manager.acquire(agent_id, uri, mode, timeout=1.0):
+                await asyncio.sleep(hold)
+                manager.release_resource(agent_id, uri)
+                acquired[agent_id] += 1
+
+    stop_at = time.monotonic() + duration
+    await asyncio.gather(*(tree_worker(f"agent-{i}", stop_at) for i in range(agents)))
+    report["tree_locks_per_s"] = round(sum(acquired.values()) / duration)
+    report["tree_stats"] = dict(manager.stats)
+
+    # Fairness: every agent wants the same exclusive lock
+    def jain(counts: List[int]) -> float:
+        return round(sum(counts) ** 2 / (len(counts) * sum(c * c for c in counts)), 3)
+
+    async def hot_worker(agent_id: str, stop_at: float, take, give, waits: List[float], counts: Counter):
+        while time.monotonic() < stop_at:
+            start = time.monotonic()
+            if not await take(agent_id):
+                continue
+            waits.append(time.monotonic() - start)
+            counts[agent_id] += 1
+            await asyncio.sleep(hold)
+            give(agent_id)
+
+    for name in ("fifo", "spin_retry"):
+        manager = ResourceIsolationManager()
+        uri = "db://orders/hot_row"
+
+        if name == "fifo":
+            async def take(agent_id):
+                return await manager.acquire(agent_id, uri, "exclusive", timeout=5.0)
+        else:
+            # Previous pattern: try, and on False sleep a little and try again
+            async def take(agent_id):
+                while not manager.try_acquire(agent_id, uri, "exclusive"):
+                    await asyncio.sleep(0.001 * rng.random())
+                return True
+
+        waits: List[float] = []
+        counts = Counter()
+        stop_at = time.monotonic() + duration
+        await asyncio.gather(*(
+            hot_worker(f"agent-{i}", stop_at, take,
+                       lambda agent_id: manager.release_resource(agent_id, uri), waits, counts)
+            for i in range(agents)
+        ))
+        ordered = sorted(waits)
+        report[f"hot_{name}"] = {
+            "locks_per_s": round(len(waits) / duration),
+            "jain_fairness": jain([counts[f"agent-{i}"] for i in range(agents)]),
+            "p50_wait_ms": round(statistics.median(ordered) * 1000, 2),
+            "max_wait_ms": round(ordered[-1] * 1000, 1)
+        }
+
+    return report
+
+
+if __name__ == "__main__":
+    print(asyncio.run(benchmark_locking()))
@@ -1,57 +1,323 @@
 # 📖 Chapter: Chapter 13: Multi-Agent Systems with MCP
 # 📖 Section: 13.5 Case Studies: Complex Multi-Agent Systems
 
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional
+
+from example_16260 import AgentRole, MultiAgentOrchestrator
+from example_16461 import AgentCommunicationManager
+from example_16576 import SharedStateManager
+
 class DocumentProcessingMultiAgentSystem:
     """Multi-agent system for document processing."""
-    
-    def __init__(self, orchestrator: MultiAgentOrchestrator):
+
+    def __init__(self, orchestrator: MultiAgentOrchestrator, cache_size: int = 10_000):
         self.orchestrator = orchestrator
         self.communication = AgentCommunicationManager(orchestrator)
         self.shared_state = SharedStateManager(orchestrator)
-    
+        # content hash -> results of the content stages (everything but store)
+        self.cache_size = cache_size
+        self.result_cache: "OrderedDict[str, Dict]" = OrderedDict()
+        # content hash -> Future of the run computing it, so duplicates wait
+        self._in_progress: Dict[str, Future] = {}
+        # document_id -> content hash last stored for it
+        self._stored: Dict[str, str] = {}
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {"hits": 0, "misses": 0, "joined": 0}
+
+    def _workflow_tasks(self, document_id: str, document_path: str) -> List[Dict]:
+        """Stage graph: analyze and summarize both depend only on extract."""
+        return [
+            {
+                "id": "extract",
+                "type": "extraction",
+                "required_capabilities": ["text_extraction"],
+                "input": {"document_path": document_path},
+                "depends_on": []
+            },
+            {
+                "id": "analyze",
+                "type": "analysis",
+                "required_capabilities": ["content_analysis"],
+                "input": {"document_id": document_id},
+                "depends_on": ["extract"]
+            },
+            {
+                "id": "summarize",
+                "type": "summarization",
+                "required_capabilities": ["summarization"],
+                "input": {"document_id": document_id},
+                "depends_on": ["extract"]
+            },
+            {
+                "id": "validate",
+                "type": "validation",
+                "required_capabilities": ["validation"],
+                "input": {"document_id": document_id},
+                "depends_on": ["analyze", "summarize"]
+            },
+            {
+                "id": "store",
+                "type": "storage",
+                "required_capabilities": ["data_storage"],
+                "input": {"document_id": document_id},
+                "depends_on": ["validate"]
+            }
+        ]
+
+    # Stages whose output depends only on the document content
+    CONTENT_STAGES = ("extract", "analyze", "summarize", "validate")
+
     def process_document(self, document_id: str, document_path: str) -> Dict:
         """Process document through multi-agent pipeline."""
-        # Define workflow
-        workflow = {
-            "workflow_id": f"doc_process_{document_id}",
-            "tasks": [
-                {
-                    "id": "extract",
-                    "type": "extraction",
-                    "required_capabilities": ["text_extraction"],
-                    "input": {"document_path": document_path}
-                },
-                {
-                    "id": "analyze",
-                    "type": "analysis",
-                    "required_capabilities": ["content_analysis"],
-                    "input": {"document_id": document_id}
-                },
-                {
-                    "id": "summarize",
-                    "type": "summarization",
-                    "required_capabilities": ["summarization"],
-                    "input": {"document_id": document_id}
-                },
-                {
-                    "id": "validate",
-                    "type": "validation",
-                    "required_capabilities": ["validation"],
-                    "input": {"document_id": document_id}
-                },
-                {
-                    "id": "store",
-                    "type": "storage",
-                    "required_capabilities": ["data_storage"],
-                    "input": {"document_id": document_id}
+        return self.process_documents([
+            {"document_id": document_id, "document_path": document_path}
+        ])["documents"][document_id]
+
+    def process_documents(self, documents: List[Dict], max_concurrent_documents: int = 8) -> Dict:
+        """Process many documents, pipelined across documents.
+
+        Each document is {"document_id", "document_path"} with optional
+        "content" (otherwise a local file is read to hash it). A remote path
+        such as s3://... is cached only when the document carries an "etag"
+        or "version" identifying its content; otherwise it always runs. Up to
+        max_concurrent_documents are in flight; a document whose content was
+        already processed reuses the cached stage results.
+        """
+        start = time.time()
+        results: Dict[str, Dict] = {}
+
+        with ThreadPoolExecutor(max_workers=max_concurrent_documents) as runner:
+            futures = {
+                runner.submit(self._process_one, document): document["document_id"]
+                for document in documents
+            }
+            for future, document_id in futures.items():
+                results[document_id] = future.result()
+
+        return {
+            "documents": results,
+            "completed": sum(r["overall_status"] == "completed" for r in results.values()),
+            "failed": sum(r["overall_status"] != "completed" for r in results.values()),
+            "duration": time.time() - start
+        }
+
+    def _process_one(self, document: Dict) -> Dict:
+        document_id = document["document_id"]
+        document_path = document["document_path"]
+        workflow_id = f"doc_process_{document_id}"
+        start = time.time()
+
+        content_hash = self._content_hash(document)
+        tasks = {task["id"]: task for task in self._workflow_tasks(document_id, document_path)}
+
+        cached = None
+        while content_hash is not None:
+            action, cached = self._claim(content_hash)
+            if action != "wait":
+                break
+            # The same content is being processed for another document
+            cached = cached.result()
+            if cached is not None:
+                break
+            # That run failed; claim again and try ourselves
+
+        if cached is not None:
+            task_results = dict(cached)
+            if self._stored.get(document_id) != content_hash:
+                # New document id for known content: only the store stage runs
+                task_results.update(self._run_graph({"store": tasks["store"]}, upstream=task_results))
+            else:
+                # Already stored unchanged: nothing to do, which is not a failure
+                task_results["store"] = {
+                    "task_id": "store",
+                    "agent_id": None,
+                    "status": "skipped",
+                    "result": None
                 }
-            ]
+        else:
+            try:
+                task_results = self._run_graph(tasks)
+            except BaseException:
+                if content_hash is not None:
+                    self._release(content_hash, None)
+                raise
+            content_results = {
+                task_id: task_results[task_id] for task_id in self.CONTENT_STAGES
+                if task_id in task_results
+            }
+            succeeded = all(
+                content_results.get(task_id, {}).get("status") == "success"
+                for task_id in self.CONTENT_STAGES
+            )
+            if content_hash is not None:
+                self._release(content_hash, content_results if succeeded else None)
+
+        if task_results.get("store", {}).get("status") == "success":
+            self._stored[document_id] = content_hash
+
+        ordered = [task_results[task_id] for task_id in tasks if task_id in task_results]
+        status = "completed" if len(ordered) == len(tasks) and \
+            all(task["status"] in ("success", "skipped") for task in ordered) else "failed"
+        workflow_result = {
+            "workflow_id": workflow_id,
+            "tasks": ordered,
+            "overall_status": status,
+            "cached": cached is not None,
+            "start_time": start,
+            "duration": time.time() - start
         }
-        
-        # Execute workflow
-        result = self.orchestrator.coordinate_workflow(
-            workflow["workflow_id"],
-            workflow["tasks"]
-        )
-        
-        return result
\ No newline at end of file
+        self.orchestrator.workflows[workflow_id] = workflow_result
+        return workflow_result
+
+    def _run_graph(self, tasks: Dict[str, Dict], upstream: Dict[str, Dict] = None) -> Dict[str, Dict]:
+        """Submit each task as soon as its dependencies succeed."""
+        done_results: Dict[str, Dict] = dict(upstream or {})
+        waiting = dict(tasks)
+        running: Dict[Future, str] = {}
+        results: Dict[str, Dict] = {}
+
+        while waiting or running:
+            for task_id, task in list(waiting.items()):
+                if all(dep in done_results for dep in task["depends_on"]):
+                    del waiting[task_id]
+                    submitted = dict(task)
+                    submitted["input"] = dict(task["input"], upstream={
+                        dep: done_results[dep]["result"] for dep in task["depends_on"]
+                    })
+                    running[self.orchestrator.submit_task(submitted)] = task_id
+
+            if not running:
+                break  # remaining tasks depend on a failed one
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                task_id = running.pop(future)
+                try:
+                    outcome = future.result()
+                except ValueError as e:
+                    outcome = {"status": "error", "message": str(e)}
+                results[task_id] = {
+                    "task_id": task_id,
+                    "agent_id": outcome.get("agent_id"),
+                    "status": outcome["status"],
+                    "result": outcome.get("result")
+                }
+                if outcome["status"] == "success":
+                    done_results[task_id] = results[task_id]
+
+        return results
+
+    def _content_hash(self, document: Dict) -> Optional[str]:
+        """Cache key for the document's content; None if it cannot be identified."""
+        digest = hashlib.sha256()
+        content = document.get("content")
+        path = document["document_path"]
+        if content is not None:
+            digest.update(content if isinstance(content, bytes) else content.encode())
+        elif os.path.isfile(path):
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        else:
+            # Not readable here (s3://, http://, ...): the path alone would keep
+            # serving old results after the document changes
+            revision = document.get("etag") or document.get("version")
+            if revision is None:
+                return None
+            digest.update(f"path:{path}\nrevision:{revision}".encode())
+        return digest.hexdigest()
+
+    def _claim(self, content_hash: str):
+        """("hit", results), ("wait", future of the run in progress) or ("compute", None)."""
+        with self._cache_lock:
+            cached = self.result_cache.get(content_hash)
+            if cached is not None:
+                self.result_cache.move_to_end(content_hash)
+                self.cache_stats["hits"] += 1
+                return "hit", cached
+            in_progress = self._in_progress.get(content_hash)
+            if in_progress is not None:
+                self.cache_stats["joined"] += 1
+                return "wait", in_progress
+            self._in_progress[content_hash] = Future()
+            self.cache_stats["misses"] += 1
+            return "compute", None
+
+    def _release(self, content_hash: str, content_results: Optional[Dict]):
+        with self._cache_lock:
+            future = self._in_progress.pop(content_hash)
+            if content_results is not None:
+                self.result_cache[content_hash] = content_results
+                if len(self.result_cache) > self.cache_size:
+                    self.result_cache.popitem(last=False)
+        future.set_result(content_results)
+
+
+def benchmark_documents(documents: int = 128, concurrency_levels=(1, 8, 64),
+                        latencies: Dict[str, float] = None) -> Dict:
+    """Documents/minute with stubbed agents, against the sequential workflow."""
+    latencies = latencies or {
+        "extraction": 0.040, "analysis": 0.060, "summarization": 0.080,
+        "validation": 0.020, "storage": 0.010
+    }
+
+    class StubAgentClient:
+        def __init__(self, endpoint: str):
+            self.endpoint = endpoint
+
+        def call_tool(self, name: str, arguments: Dict) -> Dict:
+            task = arguments["task"]
+            time.sleep(latencies[task["type"]])
+            return {"type": task["type"], "document": task["input"].get("document_id")}
+
+    def build_system() -> DocumentProcessingMultiAgentSystem:
+        orchestrator = MultiAgentOrchestrator(max_workers=256, client_factory=StubAgentClient)
+        for capability in ("text_extraction", "content_analysis", "summarization",
+                           "validation", "data_storage"):
+            for i in range(4):
+                orchestrator.register_agent(f"{capability}-{i}", AgentRole.EXECUTOR,
+                                            f"mcp://{capability}-{i}", [capability],
+                                            max_concurrent_tasks=16)
+        return DocumentProcessingMultiAgentSystem(orchestrator)
+
+    batch = [
+        {"document_id": f"doc-{i}", "document_path": f"/docs/{i}.pdf", "content": f"document {i}"}
+        for i in range(documents)
+    ]
+    report = {}
+
+    # Previous behaviour: five stages in sequence through coordinate_workflow
+    system = build_system()
+    sample = 4
+    start = time.perf_counter()
+    for document in batch[:sample]:
+        tasks = system._workflow_tasks(document["document_id"], document["document_path"])
+        system.orchestrator.coordinate_workflow(f"doc_process_{document['document_id']}", tasks)
+    report["sequential_docs_per_min"] = round(sample / (time.perf_counter() - start) * 60)
+
+    for level in concurrency_levels:
+        system = build_system()
+        count = documents if level > 1 else 8
+        start = time.perf_counter()
+        result = system.process_documents(batch[:count], max_concurrent_documents=level)
+        assert result["completed"] == count, result
+        report[f"concurrent_{level}_docs_per_min"] = round(count / (time.perf_counter() - start) * 60)
+
+    # Same batch again: unchanged content skips straight to the cached results
+    start = time.perf_counter()
+    result = system.process_documents(batch, max_concurrent_documents=64)
+    assert result["completed"] == documents, result
+    report["rerun_unchanged_docs_per_min"] = round(documents / (time.perf_counter() - start) * 60)
+    report["cache"] = dict(system.cache_stats)
+
+    return report
+
+
+if __name__ == "__main__":
+    print(benchmark_documents())
@@ -1,68 +1,331 @@
 # 📖 Chapter: Chapter 13: Multi-Agent Systems with MCP
 # 📖 Section: 13.5 Case Studies: Complex Multi-Agent Systems
 
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterable, Callable, Dict, Iterable, List, Optional, Union
+
+from example_16260 import AgentRole, MultiAgentOrchestrator
+
+class PipelineStage:
+    """One pipeline stage: an agent, its worker count and batching limits."""
+
+    def __init__(self, name: str, agent_id: str, action: str, workers: int = 4,
+                 max_batch_size: int = 1, max_batch_wait: float = 0.005,
+                 queue_size: int = 256):
+        self.name = name
+        self.agent_id = agent_id
+        self.action = action
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.metrics = {
+            "processed": 0,
+            "errors": 0,
+            "calls": 0,
+            "avg_batch_size": 0.0,
+            "avg_latency_ms": 0.0,
+            "max_latency_ms": 0.0
+        }
+
+    def record_call(self, batch_size: int, latency: float, failed: bool):
+        metrics = self.metrics
+        metrics["calls"] += 1
+        metrics["processed" if not failed else "errors"] += batch_size
+        calls = metrics["calls"]
+        latency_ms = latency * 1000
+        metrics["avg_latency_ms"] += (latency_ms - metrics["avg_latency_ms"]) / calls
+        metrics["avg_batch_size"] += (batch_size - metrics["avg_batch_size"]) / calls
+        metrics["max_latency_ms"] = max(metrics["max_latency_ms"], latency_ms)
+
 class RealTimeAnalyticsMultiAgentSystem:
     """Multi-agent system for real-time analytics."""
-    
-    def __init__(self, orchestrator: MultiAgentOrchestrator):
+
+    # Agents advertising this capability accept a list of data points per call
+    BATCH_CAPABILITY = "batch_processing"
+
+    def __init__(self, orchestrator: MultiAgentOrchestrator, workers_per_stage: int = 4,
+                 max_batch_size: int = 32, queue_size: int = 256):
         self.orchestrator = orchestrator
         self.analytics_agents = []
         self.data_agents = []
         self.visualization_agents = []
-    
+        self.workers_per_stage = workers_per_stage
+        self.max_batch_size = max_batch_size
+        self.queue_size = queue_size
+        self.stages: List[PipelineStage] = []
+        self.executor = ThreadPoolExecutor(max_workers=workers_per_stage * 3)
+
     def setup_analytics_pipeline(self):
-        """Setup analytics pipeline with multiple specialized agents."""
+        """Setup analytics pipeline with multiple specialized agents.
+
+        Agents registered beforehand keep the capabilities they advertise;
+        only a stage whose agent lists batch_processing is sent batches.
+        """
         # Data collection agents
-        data_agent = self.orchestrator.register_agent(
+        self._ensure_agent(
             "data_collector",
             AgentRole.EXECUTOR,
             "mcp://data-server",
             ["data_collection", "streaming"]
         )
-        
+
         # Analysis agents
-        analysis_agent = self.orchestrator.register_agent(
+        self._ensure_agent(
             "analyzer",
             AgentRole.ANALYZER,
             "mcp://analysis-server",
             ["statistical_analysis", "machine_learning"]
         )
-        
+
         # Visualization agents
-        viz_agent = self.orchestrator.register_agent(
+        self._ensure_agent(
             "visualizer",
             AgentRole.EXECUTOR,
             "mcp://viz-server",
             ["visualization", "dashboard"]
         )
-    
-    def process_data_stream(self, data_stream: List[Dict]) -> Dict:
-        """Process data stream through analytics pipeline."""
-        results = []
-        
-        for data_point in data_stream:
-            # Collect data
-            collect_result = self.orchestrator.assign_task(
-                "data_collector",
-                {"action": "collect", "data": data_point}
-            )
-            
-            # Analyze data
-            analysis_result = self.orchestrator.assign_task(
-                "analyzer",
-                {"action": "analyze", "data": collect_result["result"]}
+
+        self.stages = [
+            self._stage("collect", "data_collector"),
+            self._stage("analyze", "analyzer"),
+            self._stage("visualize", "visualizer")
+        ]
+
+    def _ensure_agent(self, agent_id: str, role: AgentRole, endpoint: str,
+                      capabilities: List[str]):
+        if agent_id not in self.orchestrator.agents:
+            self.orchestrator.register_agent(
+                agent_id, role, endpoint, capabilities,
+                max_concurrent_tasks=self.workers_per_stage
             )
-            
-            # Visualize results
-            viz_result = self.orchestrator.assign_task(
-                "visualizer",
-                {"action": "visualize", "data": analysis_result["result"]}
+
+    def _stage(self, action: str, agent_id: str) -> PipelineStage:
+        agent = self.orchestrator.agents[agent_id]
+        batching = self.BATCH_CAPABILITY in agent["capabilities"]
+        return PipelineStage(
+            action, agent_id, action,
+            # A pre-registered agent may accept fewer concurrent tasks
+            workers=min(self.workers_per_stage, agent["max_concurrent_tasks"]),
+            max_batch_size=self.max_batch_size if batching else 1,
+            queue_size=self.queue_size
+        )
+
+    def get_pipeline_metrics(self) -> Dict[str, Dict]:
+        """Queue depth and latency per stage."""
+        return {
+            stage.name: {
+                **stage.metrics,
+                "queue_depth": stage.queue.qsize() if stage.queue is not None else 0
+            }
+            for stage in self.stages
+        }
+
+    async def process_data_stream(self, data_stream: Union[AsyncIterable[Dict], Iterable[Dict]],
+                                  on_result: Callable[[Dict], None] = None) -> Dict:
+        """Process data stream through analytics pipeline.
+
+        Stages run concurrently with bounded queues between them, so a slow
+        stage applies backpressure to the source. Results are returned in
+        input order, unless on_result is given: it then receives each record
+        as soon as it is complete and nothing is retained.
+        """
+        if not self.stages:
+            self.setup_analytics_pipeline()
+
+        for stage in self.stages:
+            stage.queue = asyncio.Queue(maxsize=stage.queue_size)
+        results: Dict[int, Dict] = {}
+
+        async def feed():
+            sequence = 0
+            if hasattr(data_stream, "__aiter__"):
+                async for data_point in data_stream:
+                    await self.stages[0].queue.put((sequence, data_point, data_point))
+                    sequence += 1
+            else:
+                for data_point in data_stream:
+                    await self.stages[0].queue.put((sequence, data_point, data_point))
+                    sequence += 1
+            for _ in range(self.stages[0].workers):
+                await self.stages[0].queue.put(None)
+
+        async def run_stage(index: int):
+            stage = self.stages[index]
+            downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            await _gather_or_cancel(*(
+                self._stage_worker(stage, downstream, results, on_result)
+                for _ in range(stage.workers)
+            ))
+            if downstream is not None:
+                for _ in range(downstream.workers):
+                    await downstream.queue.put(None)
+
+        await _gather_or_cancel(feed(), *(run_stage(i) for i in range(len(self.stages))))
+
+        return {"results": [results[sequence] for sequence in sorted(results)]}
+
+    async def _stage_worker(self, stage: PipelineStage, downstream: Optional[PipelineStage],
+                            results: Dict[int, Dict], on_result: Optional[Callable]):
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            batch, finished = await self._next_batch(stage)
+            if not batch:
+                continue
+
+            inputs = [data for _, _, data in batch]
+            if stage.max_batch_size > 1:
+                task = {"action": stage.action, "data": inputs, "batch": True}
+            else:
+                task = {"action": stage.action, "data": inputs[0]}
+
+            start = time.perf_counter()
+            response = await loop.run_in_executor(
+                self.executor, self.orchestrator.assign_task, stage.agent_id, task
             )
-            
-            results.append({
-                "data_point": data_point,
-                "analysis": analysis_result["result"],
-                "visualization": viz_result["result"]
-            })
-        
-        return {"results": results}
\ No newline at end of file
+            error = None
+            if response["status"] != "success":
+                error = response.get("message")
+            elif stage.max_batch_size > 1:
+                outputs = response["result"]
+                if not isinstance(outputs, list) or len(outputs) != len(batch):
+                    # zip() would silently drop or misalign items
+                    error = f"Agent {stage.agent_id} returned a malformed batch result"
+            else:
+                outputs = [response["result"]]
+            stage.record_call(len(batch), time.perf_counter() - start, error is not None)
+
+            if error is not None:
+                for sequence, data_point, _ in batch:
+                    results[sequence] = {
+                        "data_point": data_point,
+                        "error": error,
+                        "stage": stage.name
+                    }
+                    self._deliver(sequence, results, on_result)
+                continue
+
+            for (sequence, data_point, previous), output in zip(batch, outputs):
+                if downstream is not None:
+                    if stage.name == "analyze":
+                        # Kept for the final record alongside the visualization
+                        results.setdefault(sequence, {})["analysis"] = output
+                    await downstream.queue.put((sequence, data_point, output))
+                    continue
+
+                record = results.setdefault(sequence, {})
+                record.update({"data_point": data_point, "visualization": output})
+                self._deliver(sequence, results, on_result)
+
+    def _deliver(self, sequence: int, results: Dict[int, Dict], on_result: Optional[Callable]):
+        # With a callback, records are handed over rather than kept, so long
+        # running streams do not accumulate results
+        if on_result is not None:
+            on_result(results.pop(sequence))
+
+    async def _next_batch(self, stage: PipelineStage):
+        """Up to max_batch_size queued items, waiting briefly for a batch to fill."""
+        item = await stage.queue.get()
+        if item is None:
+            return [], True
+
+        batch = [item]
+        deadline = time.perf_counter() + stage.max_batch_wait
+        while len(batch) < stage.max_batch_size:
+            try:
+                item = stage.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(stage.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+
+async def _gather_or_cancel(*coroutines):
+    """Run coroutines concurrently; if one raises, cancel the rest before re-raising."""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # gather() does not stop the other tasks when one raises
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def benchmark_stream(points: int = 2_000, latencies: Dict[str, float] = None,
+                           per_item_cost: float = 0.0005) -> Dict:
+    """Sustained points/sec: one-at-a-time loop vs staged, batched pipeline."""
+    latencies = latencies or {"collect": 0.010, "analyze": 0.030, "visualize": 0.015}
+
+    class SimulatedAgentClient:
+        def __init__(self, endpoint: str):
+            self.endpoint = endpoint
+
+        def call_tool(self, name: str, arguments: Dict) -> Dict:
+            task = arguments["task"]
+            items = task["data"] if task.get("batch") else [task["data"]]
+            # Fixed per-call overhead plus a small per-item cost
+            time.sleep(latencies[task["action"]] + per_item_cost * len(items))
+            outputs = [{"action": task["action"], "input": item} for item in items]
+            return outputs if task.get("batch") else outputs[0]
+
+    async def source(count: int):
+        for i in range(count):
+            yield {"sensor": i % 50, "value": i}
+
+    report = {"stage_latencies_ms": {k: v * 1000 for k, v in latencies.items()}}
+
+    # Previous behaviour: three blocking calls per point
+    orchestrator = MultiAgentOrchestrator(client_factory=SimulatedAgentClient)
+    system = RealTimeAnalyticsMultiAgentSystem(orchestrator, workers_per_stage=1, max_batch_size=1)
+    system.setup_analytics_pipeline()
+    sample = 50
+    start = time.perf_counter()
+    for i in range(sample):
+        point = {"sensor": i % 50, "value": i}
+        collected = orchestrator.assign_task("data_collector", {"action": "collect", "data": point})
+        analysis = orchestrator.assign_task("analyzer", {"action": "analyze", "data": collected["result"]})
+        orchestrator.assign_task("visualizer", {"action": "visualize", "data": analysis["result"]})
+    report["sequential_points_per_s"] = round(sample / (time.perf_counter() - start), 1)
+
+    for workers, batch in ((4, 1), (4, 32), (8, 64)):
+        orchestrator = MultiAgentOrchestrator(client_factory=SimulatedAgentClient)
+        # The simulated agents accept batches, so they advertise it
+        for agent_id, role, endpoint in (("data_collector", AgentRole.EXECUTOR, "mcp://data-server"),
+                                         ("analyzer", AgentRole.ANALYZER, "mcp://analysis-server"),
+                                         ("visualizer", AgentRole.EXECUTOR, "mcp://viz-server")):
+            orchestrator.register_agent(agent_id, role, endpoint,
+                                        [RealTimeAnalyticsMultiAgentSystem.BATCH_CAPABILITY],
+                                        max_concurrent_tasks=workers)
+        system = RealTimeAnalyticsMultiAgentSystem(orchestrator, workers_per_stage=workers,
+                                                   max_batch_size=batch)
+        system.setup_analytics_pipeline()
+        count = points if batch > 1 else points // 10
+        start = time.perf_counter()
+        result = await system.process_data_stream(source(count))
+        elapsed = time.perf_counter() - start
+        assert len(result["results"]) == count
+        metrics = system.get_pipeline_metrics()
+        report[f"pipelined_w{workers}_b{batch}"] = {
+            "points_per_s": round(count / elapsed, 1),
+            "avg_batch": {name: round(m["avg_batch_size"], 1) for name, m in metrics.items()},
+            "avg_call_ms": {name: round(m["avg_latency_ms"], 1) for name, m in metrics.items()}
+        }
+
+    return report
+
+
+if __name__ == "__main__":
+    print(asyncio.run(benchmark_stream()))
@@ -3,9 +3,162 @@
 
 import psycopg2
 from psycopg2 import pool
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+import base64
+import hashlib
+import io
+import itertools
 import json
-from datetime import datetime
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# format -> MIME type of an encoded page
+ROW_FORMATS = {
+    "json": "application/json",             # array of objects
+    "jsonl": "application/x-ndjson",        # one object per line
+    "columnar": "application/json"          # {"columns": [...], "rows": [[...], ...]}
+}
+
+_compact_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+def encode_rows(rows: Iterable[tuple], columns: List[str], out: TextIO, format: str = "json",
+                batch_size: int = 500):
+    """Write rows to out as they are produced, without building a list first.
+
+    Rows are encoded batch_size at a time so each batch is one encoder call.
+    """
+    rows = iter(rows)
+    batches = iter(lambda: list(itertools.islice(rows, batch_size)), [])
+
+    if format == "columnar":
+        # Column names once, then each row as a plain array
+        out.write('{"columns":')
+        out.write(_compact_encode(columns))
+        out.write(',"rows":[')
+        separator = ""
+        for batch in batches:
+            out.write(separator)
+            out.write(_compact_encode(batch)[1:-1])
+            separator = ","
+        out.write("]}")
+    elif format == "jsonl":
+        for batch in batches:
+            for row in batch:
+                out.write(_compact_encode(dict(zip(columns, row))))
+                out.write("\n")
+    else:
+        # Same text as json.dumps(list_of_dicts)
+        out.write("[")
+        separator = ""
+        for batch in batches:
+            out.write(separator)
+            out.write(json.dumps([dict(zip(columns, row)) for row in batch])[1:-1])
+            separator = ", "
+        out.write("]")
+
+class QueryResultCache:
+    """LRU cache of encoded query results, bounded by memory and TTL.
+
+    Values are the encoded response text (or a tuple holding it), stored
+    once and returned as-is.
+    Concurrent misses for the same key are coalesced: one caller loads, the
+    others wait for its result.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (value, size, expires_at), least recently used first
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.current_bytes = 0
+        self._in_progress: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0,
+                      "evictions": 0, "expirations": 0, "oversized": 0}
+
+    def get_or_load(self, key: str, loader: Callable[[], object]):
+        """Cached value for key, calling loader at most once per miss."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[2] > self.clock():
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[0]
+                self._remove(key)
+                self.stats["expirations"] += 1
+
+            in_progress = self._in_progress.get(key)
+            if in_progress is None:
+                self._in_progress[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if in_progress is not None:
+            return in_progress.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                future = self._in_progress.pop(key)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            future = self._in_progress.pop(key)
+            self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, prefix: str = ""):
+        """Drop every entry whose key starts with prefix (all by default)."""
+        with self._lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                self._remove(key)
+
+    def purge_expired(self) -> int:
+        now = self.clock()
+        with self._lock:
+            expired = [key for key, entry in self.entries.items() if entry[2] <= now]
+            for key in expired:
+                self._remove(key)
+            self.stats["expirations"] += len(expired)
+        return len(expired)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+            return dict(self.stats, entries=len(self.entries), bytes=self.current_bytes,
+                        max_bytes=self.max_bytes,
+                        hit_ratio=self.stats["hits"] / lookups if lookups else 0.0)
+
+    def _store(self, key: str, value):
+        size = sum(map(sys.getsizeof, value)) if isinstance(value, tuple) else sys.getsizeof(value)
+        if size > self.max_bytes:
+            self.stats["oversized"] += 1
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (value, size, self.clock() + self.ttl)
+        self.current_bytes += size
+
+        # Least recently used first; expired entries otherwise go on lookup
+        # or purge_expired()
+        now = self.clock()
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.stats["expirations" if self.entries[oldest][2] <= now else "evictions"] += 1
+            self._remove(oldest)
+
+    def _remove(self, key: str):
+        self.current_bytes -= self.entries.pop(key)[1]
 
 class EnterpriseDatabaseMCP:
     """MCP server for enterprise database integration."""
@@ -13,8 +166,17 @@ class EnterpriseDatabaseMCP:
     def __init__(self, db_config: Dict):
         self.db_config = db_config
         self.connection_pool = self._create_connection_pool()
-        self.query_cache: Dict[str, Dict] = {}
-        self.cache_ttl = 300  # 5 minutes
+        self.cache_ttl = db_config.get('cache_ttl', 300)  # 5 minutes
+        self.query_cache = QueryResultCache(
+            max_bytes=db_config.get('cache_max_bytes', 64 * 1024 * 1024),
+            ttl=self.cache_ttl
+        )
+        # table -> column used for keyset pagination (default "id" when the table has one)
+        self.key_columns: Dict[str, str] = db_config.get('key_columns', {})
+        # table -> "id" or None, for tables not in key_columns
+        self._default_key_columns: Dict[str, Optional[str]] = {}
+        self.max_page_size = db_config.get('max_page_size', 10000)
+        self.fetch_size = 500
     
     def _create_connection_pool(self):
         """Create database connection pool."""
@@ -59,8 +221,27 @@ class EnterpriseDatabaseMCP:
         
         return resources
     
-    def read_resource(self, uri: str, filters: Optional[Dict] = None) -> str:
-        """Read database table as resource with optional filters."""
+    def read_resource(self, uri: str, filters: Optional[Dict] = None, cursor: Optional[str] = None,
+                      limit: int = 1000, columns: Optional[List[str]] = None,
+                      format: str = "json") -> str:
+        """Read database table as resource with optional filters.
+
+        Returns the text of one page; use read_resource_page for nextCursor.
+        """
+        return self.read_resource_page(uri, filters, cursor, limit, columns, format)["contents"][0]["text"]
+    
+    def read_resource_page(self, uri: str, filters: Optional[Dict] = None, cursor: Optional[str] = None,
+                           limit: int = 1000, columns: Optional[List[str]] = None,
+                           format: str = "json") -> Dict:
+        """Read one page of a table, ordered by its key column.
+
+        Pages are keyset-based: nextCursor (present while rows remain) holds
+        the last key returned, so the next page is an index range scan rather
+        than an OFFSET. A table or view with no key column (none configured
+        and no "id") returns its first limit rows, unordered and without a
+        nextCursor. columns limits the columns selected; format is one of
+        ROW_FORMATS.
+        """
         if not uri.startswith("db://table/"):
             raise ValueError(f"Invalid resource URI: {uri}")
         
@@ -69,32 +250,96 @@ class EnterpriseDatabaseMCP:
         # Validate table name (prevent SQL injection)
         if not self._is_valid_table_name(table_name):
             raise ValueError(f"Invalid table name: {table_name}")
+        if format not in ROW_FORMATS:
+            raise ValueError(f"Unknown format: {format}")
+        if not 0 < limit <= self.max_page_size:
+            raise ValueError(f"limit must be between 1 and {self.max_page_size}")
+        for column in columns or ():
+            if not self._is_valid_column_name(column):
+                raise ValueError(f"Invalid column name: {column}")
+        
+        key_column = self._key_column(table_name)
+        if key_column is None and cursor is not None:
+            raise ValueError(f"Table {table_name} has no key column to page on")
+        # The key is selected even when not projected, to build the cursor
+        selected = list(columns) if columns else ["*"]
+        strip_key = bool(columns) and key_column is not None and key_column not in columns
+        if strip_key:
+            selected.append(key_column)
         
         # Build query with filters
-        query = f"SELECT * FROM {table_name}"
+        query = f"SELECT {', '.join(selected)} FROM {table_name}"
         params = []
+        where_clauses = []
         
         if filters:
-            where_clauses = []
             for key, value in filters.items():
                 if self._is_valid_column_name(key):
                     where_clauses.append(f"{key} = %s")
                     params.append(value)
-            
-            if where_clauses:
-                query += " WHERE " + " AND ".join(where_clauses)
         
-        # Add limit
-        query += " LIMIT 1000"
+        # A cursor is only valid for the table and filters it was issued for
+        scope = hashlib.sha256(
+            f"{uri}:{key_column}:{json.dumps(filters or {}, sort_keys=True)}".encode()
+        ).hexdigest()[:16]
+        if cursor is not None:
+            where_clauses.append(f"{key_column} > %s")
+            params.append(self._decode_cursor(cursor, scope))
         
-        # Check cache
-        cache_key = f"{uri}:{json.dumps(filters or {})}"
-        if cache_key in self.query_cache:
-            cached = self.query_cache[cache_key]
-            if datetime.now().timestamp() - cached['timestamp'] < self.cache_ttl:
-                return cached['data']
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+        
+        if key_column is not None:
+            # One extra row tells whether there is a next page
+            query += f" ORDER BY {key_column} LIMIT {limit + 1}"
+        else:
+            query += f" LIMIT {limit}"
+        
+        # Check cache; identical concurrent misses run the query once
+        cache_key = f"{uri}:{json.dumps([filters or {}, cursor, limit, columns, format], sort_keys=True)}"
+        text, next_key = self.query_cache.get_or_load(
+            cache_key,
+            lambda: self._run_query(query, params, key_column, limit,
+                                    strip_key=strip_key, format=format)
+        )
         
-        # Execute query
+        page = {
+            "contents": [{
+                "uri": uri,
+                "mimeType": ROW_FORMATS[format],
+                "text": text
+            }]
+        }
+        if next_key is not None:
+            page["nextCursor"] = self._encode_cursor(next_key, scope)
+        return page
+    
+    def _key_column(self, table_name: str) -> Optional[str]:
+        """Configured key column, else "id" if the table has one, else None."""
+        if table_name in self.key_columns:
+            return self.key_columns[table_name]
+        if table_name not in self._default_key_columns:
+            conn = self.connection_pool.getconn()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = 'public' AND table_name = %s AND column_name = 'id'
+                """, (table_name,))
+                has_id = cursor.fetchone() is not None
+                cursor.close()
+            finally:
+                self.connection_pool.putconn(conn)
+            self._default_key_columns[table_name] = "id" if has_id else None
+        return self._default_key_columns[table_name]
+    
+    def _run_query(self, query: str, params: List, key_column: Optional[str], limit: int,
+                   strip_key: bool, format: str) -> Tuple[str, Optional[object]]:
+        """Execute query and encode up to limit rows as they are fetched.
+
+        Returns the encoded page and the last key if more rows follow
+        (never for a query without a key column).
+        """
         conn = self.connection_pool.getconn()
         try:
             cursor = conn.cursor()
@@ -102,22 +347,53 @@ class EnterpriseDatabaseMCP:
             
             # Get column names
             column_names = [desc[0] for desc in cursor.description]
+            key_index = column_names.index(key_column) if key_column is not None else None
+            if strip_key:
+                column_names.pop()
+            state = {"last_key": None, "more": False}
             
-            # Fetch results
-            rows = cursor.fetchall()
-            results = [dict(zip(column_names, row)) for row in rows]
+            def rows():
+                emitted = 0
+                while True:
+                    batch = cursor.fetchmany(self.fetch_size)
+                    if not batch:
+                        return
+                    for row in batch:
+                        if emitted == limit:
+                            state["more"] = True
+                            return
+                        emitted += 1
+                        if key_index is not None:
+                            state["last_key"] = row[key_index]
+                        yield row[:-1] if strip_key else row
             
-            # Cache result
-            self.query_cache[cache_key] = {
-                'data': json.dumps(results),
-                'timestamp': datetime.now().timestamp()
-            }
+            out = io.StringIO()
+            encode_rows(rows(), column_names, out, format)
             
             cursor.close()
-            return json.dumps(results)
+            return out.getvalue(), state["last_key"] if state["more"] else None
         finally:
             self.connection_pool.putconn(conn)
     
+    def _encode_cursor(self, key, scope: str) -> str:
+        payload = json.dumps({"after": key, "scope": scope}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode("ascii")
+    
+    def _decode_cursor(self, cursor: str, scope: str):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        if not isinstance(payload, dict) or "after" not in payload:
+            raise ValueError("Invalid cursor")
+        if payload.get("scope") != scope:
+            raise ValueError("Cursor does not belong to this resource and filter")
+        return payload["after"]
+    
+    def get_cache_metrics(self) -> Dict:
+        """Hit/miss/eviction counters and current size of the query cache."""
+        return self.query_cache.metrics()
+    
     def _is_valid_table_name(self, name: str) -> bool:
         """Validate table name to prevent SQL injection."""
         # Allow alphanumeric and underscores only
@@ -147,6 +423,24 @@ class EnterpriseDatabaseMCP:
                         "filters": {
                             "type": "object",
                             "description": "Filter criteria"
+                        },
+                        "columns": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Columns to return (default: all)"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "Rows per page (default 1000)"
+                        },
+                        "cursor": {
+                            "type": "string",
+                            "description": "nextCursor from the previous page"
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": list(ROW_FORMATS),
+                            "description": "Row encoding (default json)"
                         }
                     },
                     "required": ["table"]
@@ -187,16 +481,25 @@ class EnterpriseDatabaseMCP:
         filters = arguments.get("filters")
         
         uri = f"db://table/{table}"
-        data = self.read_resource(uri, filters)
+        page = self.read_resource_page(
+            uri, filters,
+            cursor=arguments.get("cursor"),
+            limit=arguments.get("limit", 1000),
+            columns=arguments.get("columns"),
+            format=arguments.get("format", "json")
+        )
         
-        return {
+        result = {
             "content": [
                 {
                     "type": "text",
-                    "text": data
+                    "text": page["contents"][0]["text"]
                 }
             ]
         }
+        if "nextCursor" in page:
+            result["nextCursor"] = page["nextCursor"]
+        return result
     
     def _execute_stored_procedure(self, arguments: Dict) -> Dict:
         """Execute stored procedure tool."""
@@ -238,4 +541,274 @@ class EnterpriseDatabaseMCP:
             conn.rollback()
             raise
         finally:
-            self.connection_pool.putconn(conn)
\ No newline at end of file
+            self.connection_pool.putconn(conn)
+
+
+class _SQLiteCursor:
+    """DB-API cursor adapter: psycopg2's %s placeholders on SQLite."""
+
+    def __init__(self, cursor, counter: Dict):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, query: str, params=()):
+        self._counter["queries"] += 1
+        return self._cursor.execute(query.replace("%s", "?"), list(params))
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _SQLiteConnection:
+    def __init__(self, connection, counter: Dict):
+        self._connection = connection
+        self._counter = counter
+
+    def cursor(self):
+        return _SQLiteCursor(self._connection.cursor(), self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+class SQLiteConnectionPool:
+    """Stand-in for ThreadedConnectionPool backed by one SQLite file."""
+
+    def __init__(self, path: str, maxconn: int = 20):
+        import queue
+        import sqlite3
+        self.counter = {"queries": 0}
+        self._idle = queue.LifoQueue()
+        for _ in range(maxconn):
+            connection = sqlite3.connect(path, check_same_thread=False)
+            self._idle.put(_SQLiteConnection(connection, self.counter))
+
+    def getconn(self):
+        return self._idle.get()
+
+    def putconn(self, conn):
+        self._idle.put(conn)
+
+def _create_orders_table(path: str, rows: int, customers: int):
+    import random
+    import sqlite3
+    rng = random.Random(7)
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER,
+                             region TEXT, status TEXT, amount REAL)
+    """)
+    connection.executemany(
+        "INSERT INTO orders VALUES (?, ?, ?, ?, ?)",
+        ((i, rng.randrange(customers), rng.choice(("emea", "amer", "apac")),
+          rng.choice(("open", "paid", "shipped")), round(rng.uniform(1, 500), 2))
+         for i in range(rows))
+    )
+    connection.execute("CREATE INDEX orders_customer ON orders (customer_id)")
+    connection.commit()
+    connection.close()
+
+def benchmark_query_cache(rows: int = 200_000, customers: int = 20_000, requests: int = 40_000,
+                          threads: int = 16, zipf_s: float = 1.1,
+                          cache_max_bytes: int = 4 * 1024 * 1024) -> Dict:
+    """Zipfian filter workload on SQLite: bounded cache vs the old dict cache."""
+    import bisect
+    import os
+    import random
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "orders.db")
+    _create_orders_table(path, rows, customers)
+
+    class SQLiteDatabaseMCP(EnterpriseDatabaseMCP):
+        def _create_connection_pool(self):
+            return SQLiteConnectionPool(path)
+
+    # Customer ids drawn with Zipfian popularity
+    weights = list(itertools.accumulate(1 / (rank + 1) ** zipf_s for rank in range(customers)))
+    rng = random.Random(11)
+    workload = [bisect.bisect(weights, rng.random() * weights[-1]) for _ in range(requests)]
+
+    def run(read: Callable[[str, Dict], str]) -> float:
+        chunks = [workload[i::threads] for i in range(threads)]
+
+        def worker(chunk):
+            for customer in chunk:
+                read("db://table/orders", {"customer_id": customer})
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(worker, chunks))
+        return time.perf_counter() - start
+
+    report = {"rows": rows, "requests": requests, "distinct_keys": len(set(workload))}
+
+    # SQLite has no information_schema, so the key column is configured
+    key_columns = {"orders": "id"}
+    server = SQLiteDatabaseMCP({"cache_max_bytes": cache_max_bytes, "key_columns": key_columns})
+    elapsed = run(server.read_resource)
+    metrics = server.get_cache_metrics()
+    report["bounded_lru"] = {
+        "requests_per_s": round(requests / elapsed),
+        "db_queries": server.connection_pool.counter["queries"],
+        "hit_ratio": round(metrics["hit_ratio"], 3),
+        "evictions": metrics["evictions"],
+        "coalesced": metrics["coalesced"],
+        "cache_mb": round(metrics["bytes"] / 2 ** 20, 2)
+    }
+
+    # Previous behaviour: unbounded dict, results encoded twice, no coalescing
+    legacy = SQLiteDatabaseMCP({})
+    legacy_cache: Dict[str, Dict] = {}
+
+    def legacy_read(uri: str, filters: Dict) -> str:
+        cache_key = f"{uri}:{json.dumps(filters or {})}"
+        if cache_key in legacy_cache:
+            cached = legacy_cache[cache_key]
+            if time.time() - cached['timestamp'] < legacy.cache_ttl:
+                return cached['data']
+        conn = legacy.connection_pool.getconn()
+        try:
+            cursor = conn.cursor()
+            where = " AND ".join(f"{key} = %s" for key in filters)
+            cursor.execute(f"SELECT * FROM orders WHERE {where} LIMIT 1000", list(filters.values()))
+            column_names = [desc[0] for desc in cursor.description]
+            results = [dict(zip(column_names, row)) for row in cursor.fetchall()]
+        finally:
+            legacy.connection_pool.putconn(conn)
+        legacy_cache[cache_key] = {'data': json.dumps(results), 'timestamp': time.time()}
+        return json.dumps(results)
+
+    elapsed = run(legacy_read)
+    report["legacy_dict"] = {
+        "requests_per_s": round(requests / elapsed),
+        "db_queries": legacy.connection_pool.counter["queries"],
+        "cache_mb": round(sum(sys.getsizeof(entry['data']) for entry in legacy_cache.values()) / 2 ** 20, 2)
+    }
+
+    # Thundering herd: 64 threads miss the same key at once
+    herd = SQLiteDatabaseMCP({"key_columns": key_columns})
+    barrier = threading.Barrier(64)
+
+    def herd_reader(_):
+        barrier.wait()
+        herd.read_resource("db://table/orders", {"region": "emea", "status": "paid", "amount": 1.0})
+
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        list(executor.map(herd_reader, range(64)))
+    report["herd_64_db_queries"] = herd.connection_pool.counter["queries"]
+
+    legacy_cache.clear()
+    legacy.connection_pool.counter["queries"] = 0
+    barrier = threading.Barrier(64)
+
+    def legacy_herd_reader(_):
+        barrier.wait()
+        legacy_read("db://table/orders", {"region": "emea", "status": "paid", "amount": 1.0})
+
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        list(executor.map(legacy_herd_reader, range(64)))
+    report["legacy_herd_64_db_queries"] = legacy.connection_pool.counter["queries"]
+
+    os.remove(path)
+    os.rmdir(tmpdir)
+    return report
+
+def benchmark_pagination(sizes=(1_000, 100_000, 1_000_000), repeats: int = 20) -> Dict:
+    """Page latency and memory on SQLite tables of 1k, 100k and 1M rows."""
+    import os
+    import statistics
+    import tempfile
+    import tracemalloc
+
+    def measure(read: Callable[[], object]) -> Dict:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            read()
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        read()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {"p50_ms": round(statistics.median(timings) * 1000, 2),
+                "peak_kb": round(peak / 1024)}
+
+    report = {}
+    for size in sizes:
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "orders.db")
+        _create_orders_table(path, size, max(1, size // 10))
+
+        class SQLiteDatabaseMCP(EnterpriseDatabaseMCP):
+            def _create_connection_pool(self):
+                return SQLiteConnectionPool(path, maxconn=2)
+
+        # No caching: every read goes to the database
+        server = SQLiteDatabaseMCP({"cache_max_bytes": 0, "max_page_size": 100_000,
+                                    "key_columns": {"orders": "id"}})
+        uri = "db://table/orders"
+
+        def legacy_read():
+            # Previous behaviour: SELECT * LIMIT 1000, list of dicts, json.dumps
+            conn = server.connection_pool.getconn()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT * FROM orders LIMIT 1000")
+                column_names = [desc[0] for desc in cursor.description]
+                results = [dict(zip(column_names, row)) for row in cursor.fetchall()]
+                return json.dumps(results)
+            finally:
+                server.connection_pool.putconn(conn)
+
+        result = {
+            "legacy_1000_rows": measure(legacy_read),
+            "page_1000_json": measure(lambda: server.read_resource_page(uri, limit=1000)),
+            "page_1000_columnar": measure(
+                lambda: server.read_resource_page(uri, limit=1000, format="columnar")),
+            "page_50_two_columns": measure(
+                lambda: server.read_resource_page(uri, limit=50, columns=["id", "amount"],
+                                                  format="columnar")),
+        }
+
+        # Whole table in 10k-row JSONL pages
+        start = time.perf_counter()
+        cursor, rows, encoded = None, 0, 0
+        while True:
+            page = server.read_resource_page(uri, cursor=cursor, limit=10_000, format="jsonl")
+            text = page["contents"][0]["text"]
+            rows += text.count("\n")
+            encoded += len(text)
+            cursor = page.get("nextCursor")
+            if cursor is None:
+                break
+        elapsed = time.perf_counter() - start
+        result["full_scan_jsonl"] = {"rows": rows, "seconds": round(elapsed, 2),
+                                     "rows_per_s": round(rows / elapsed),
+                                     "mb": round(encoded / 2 ** 20, 1)}
+
+        # Last page by SQL alone: keyset seek vs OFFSET
+        def fetch(sql: str, params: List):
+            conn = server.connection_pool.getconn()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+            finally:
+                server.connection_pool.putconn(conn)
+
+        result["last_page_sql_keyset"] = measure(
+            lambda: fetch("SELECT * FROM orders WHERE id > %s ORDER BY id LIMIT 1000", [size - 1001]))
+        result["last_page_sql_offset"] = measure(
+            lambda: fetch("SELECT * FROM orders ORDER BY id LIMIT 1000 OFFSET %s", [max(0, size - 1000)]))
+
+        report[f"{size}_rows"] = result
+        os.remove(path)
+        os.rmdir(tmpdir)
+
+    return report
+
+
+if __name__ == "__main__":
+    print(benchmark_query_cache())
+    print(benchmark_pagination())
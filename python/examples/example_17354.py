@@ -1,10 +1,19 @@
 # 📖 Chapter: Chapter 14: MCP and Enterprise Integration
 # 📖 Section: 14.1 Connecting to Enterprise Systems
 
+import asyncio
+import hashlib
+import json
+import os
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Dict, Hashable, List, Optional, Tuple
 
 class EnterpriseAPIMCP:
     """MCP server for enterprise REST API integration."""
@@ -15,8 +24,23 @@ class EnterpriseAPIMCP:
         self.api_key = api_config.get('api_key')
         self.session = self._create_session()
         self.rate_limiter = RateLimiter(
-            calls_per_minute=api_config.get('rate_limit', 60)
+            calls_per_minute=api_config.get('rate_limit', 60),
+            burst=api_config.get('rate_limit_burst'),
+            endpoint_limits={
+                endpoint['path']: endpoint['rate_limit']
+                for endpoint in api_config.get('endpoints', [])
+                if 'rate_limit' in endpoint
+            },
+            tenant_calls_per_minute=api_config.get('tenant_rate_limit')
         )
+        self.http_cache = HTTPResponseCache(
+            directory=api_config.get('cache_dir'),
+            max_bytes=api_config.get('cache_max_bytes', 32 * 1024 * 1024)
+        ) if api_config.get('cache_enabled', True) else None
+        # Background stale-while-revalidate refreshes, one per URL at a time
+        self._revalidator = ThreadPoolExecutor(max_workers=4, thread_name_prefix='api-revalidate')
+        self._revalidating = set()
+        self._revalidating_lock = Lock()
     
     def _create_session(self):
         """Create HTTP session with retry strategy."""
@@ -55,48 +79,674 @@ class EnterpriseAPIMCP:
             for endpoint in endpoints
         ]
     
-    def read_resource(self, uri: str) -> str:
-        """Read resource from API endpoint."""
+    def read_resource(self, uri: str, tenant: Optional[str] = None) -> str:
+        """Read resource from API endpoint.
+
+        Fresh cached responses are served without an upstream call or a rate
+        limit token. Stale ones are revalidated with If-None-Match /
+        If-Modified-Since (a 304 gives its token back), or served as-is while
+        a background refresh runs if stale-while-revalidate allows it.
+        """
         if not uri.startswith("api://"):
             raise ValueError(f"Invalid resource URI: {uri}")
         
         path = uri.replace("api://", "")
         url = f"{self.base_url}/{path}"
+        endpoint = path.split("?")[0]
+        
+        entry = self.http_cache.get(url) if self.http_cache else None
+        if entry is not None:
+            now = time.time()
+            if entry.is_fresh(now):
+                return entry.body
+            if entry.can_serve_stale(now):
+                self._revalidate_in_background(url, entry, endpoint, tenant)
+                return entry.body
         
-        # Rate limiting
-        self.rate_limiter.wait_if_needed()
+        return self._fetch(url, entry, endpoint, tenant)
+    
+    def _fetch(self, url: str, entry: Optional['CachedResponse'], endpoint: str,
+               tenant: Optional[str]) -> str:
+        """GET url (conditionally when a cached entry has validators)."""
+        # Rate limiting: waits only on this caller's buckets, without a lock held
+        self.rate_limiter.wait_if_needed(endpoint=endpoint, tenant=tenant)
         
+        headers = entry.conditional_headers() if entry is not None else {}
         try:
-            response = self.session.get(url, timeout=10)
+            response = self.session.get(url, headers=headers, timeout=10)
+            if response.status_code == 304 and entry is not None:
+                # Not modified: no body transferred, so the call is not counted
+                self.rate_limiter.refund(endpoint=endpoint, tenant=tenant)
+                return self.http_cache.refresh(url, entry, response.headers).body
             response.raise_for_status()
-            return response.text
         except requests.RequestException as e:
             raise Exception(f"API request failed: {e}")
+        
+        if self.http_cache is not None:
+            self.http_cache.store(url, response.text, response.headers)
+        return response.text
+    
+    def _revalidate_in_background(self, url: str, entry: 'CachedResponse', endpoint: str,
+                                  tenant: Optional[str]):
+        with self._revalidating_lock:
+            if url in self._revalidating:
+                return
+            self._revalidating.add(url)
+        
+        def revalidate():
+            try:
+                self._fetch(url, entry, endpoint, tenant)
+            except Exception:
+                pass  # keep serving the stale copy until its window closes
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(url)
+        
+        self._revalidator.submit(revalidate)
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """'max-age=60, no-cache' -> {'max-age': '60', 'no-cache': None}."""
+    directives = {}
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+def _seconds(directives: Dict[str, Optional[str]], name: str) -> Optional[float]:
+    try:
+        return float(directives[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+class CachedResponse:
+    """Body and validators of one cached response, with its freshness window."""
+    
+    __slots__ = ("url", "body", "etag", "last_modified", "cache_control", "expires",
+                 "stored_at", "fresh_for", "stale_for", "size")
+    
+    def __init__(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str],
+                 stored_at: float, fresh_for: float, stale_for: float,
+                 cache_control: str = "", expires: Optional[str] = None):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        # Kept so a 304 that omits them does not reset the freshness rules
+        self.cache_control = cache_control
+        self.expires = expires
+        self.stored_at = stored_at
+        # Seconds after stored_at the response is fresh, then may be served stale
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+        self.size = len(body.encode("utf-8")) + len(url)
+    
+    @classmethod
+    def from_headers(cls, url: str, body: str, headers, now: float) -> Optional['CachedResponse']:
+        """Entry for a 200 response, or None if it must not be stored."""
+        cache_control = headers.get("Cache-Control") or ""
+        directives = parse_cache_control(cache_control)
+        if "no-store" in directives or headers.get("Vary") == "*":
+            return None
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        fresh_for, stale_for = cls._freshness(directives, headers, last_modified, now)
+        if fresh_for <= 0 and stale_for <= 0 and not (etag or last_modified):
+            return None  # could never be served or revalidated
+        return cls(url, body, etag, last_modified, now, fresh_for, stale_for,
+                   cache_control, headers.get("Expires"))
+    
+    @staticmethod
+    def _freshness(directives: Dict, headers, last_modified: Optional[str],
+                   now: float) -> Tuple[float, float]:
+        if "no-cache" in directives:
+            return 0.0, 0.0
+        age = _seconds({"age": headers.get("Age")}, "age") or 0.0
+        max_age = _seconds(directives, "max-age")
+        if max_age is None:
+            expires = _http_date(headers.get("Expires"))
+            date = _http_date(headers.get("Date")) or now
+            if expires is not None:
+                max_age = expires - date
+            elif last_modified is not None:
+                # Heuristic freshness: 10% of the time since last modification
+                modified = _http_date(last_modified)
+                max_age = min(0.1 * (date - modified), 86400) if modified else 0.0
+            else:
+                max_age = 0.0
+        fresh_for = max(0.0, max_age - age)
+        stale_for = 0.0
+        if "must-revalidate" not in directives:
+            stale_for = _seconds(directives, "stale-while-revalidate") or 0.0
+        return fresh_for, stale_for
+    
+    def is_fresh(self, now: float) -> bool:
+        return now - self.stored_at < self.fresh_for
+    
+    def can_serve_stale(self, now: float) -> bool:
+        return now - self.stored_at < self.fresh_for + self.stale_for
+    
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+    
+    def to_record(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot != "size"}
+
+class HTTPResponseCache:
+    """Private HTTP cache keyed by URL: LRU in memory, mirrored to disk.
+
+    With a directory, each entry is one JSON file (written atomically) and
+    the cache is reloaded from it on startup, so it stays warm across
+    restarts. Both copies are bounded by max_bytes of body.
+    """
+    
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 32 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.current_bytes = 0
+        self.lock = Lock()
+        self.stats = {"stores": 0, "refreshes": 0, "evictions": 0, "loaded": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+    
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                self.entries.move_to_end(url)
+            return entry
+    
+    def store(self, url: str, body: str, headers) -> Optional[CachedResponse]:
+        """Cache a 200 response if its headers allow it."""
+        entry = CachedResponse.from_headers(url, body, headers, time.time())
+        if entry is None:
+            self.remove(url)
+            return None
+        self._put(entry)
+        with self.lock:
+            self.stats["stores"] += 1
+        return entry
+    
+    def refresh(self, url: str, entry: CachedResponse, headers) -> CachedResponse:
+        """Apply a 304's headers to the cached body and restart its freshness.
+
+        Headers the 304 carries replace the stored ones; the others (such as
+        the original Cache-Control) still apply (RFC 9111 section 4.3.4).
+        """
+        merged = {
+            "Cache-Control": entry.cache_control,
+            "Expires": entry.expires,
+            "ETag": entry.etag,
+            "Last-Modified": entry.last_modified
+        }
+        for name in ("Cache-Control", "Expires", "ETag", "Last-Modified", "Date", "Age"):
+            if headers.get(name):
+                merged[name] = headers[name]
+        merged = {name: value for name, value in merged.items() if value}
+        refreshed = CachedResponse.from_headers(url, entry.body, merged, time.time()) or entry
+        self._put(refreshed)
+        with self.lock:
+            self.stats["refreshes"] += 1
+        return refreshed
+    
+    def remove(self, url: str):
+        with self.lock:
+            entry = self.entries.pop(url, None)
+            if entry is None:
+                return
+            self.current_bytes -= entry.size
+        self._delete_file(url)
+    
+    def _put(self, entry: CachedResponse):
+        if entry.size > self.max_bytes:
+            return
+        evicted = []
+        with self.lock:
+            previous = self.entries.pop(entry.url, None)
+            if previous is not None:
+                self.current_bytes -= previous.size
+            self.entries[entry.url] = entry
+            self.current_bytes += entry.size
+            while self.current_bytes > self.max_bytes:
+                _, oldest = self.entries.popitem(last=False)
+                self.current_bytes -= oldest.size
+                evicted.append(oldest.url)
+            self.stats["evictions"] += len(evicted)
+        if self.directory:
+            self._write_file(entry)
+            for url in evicted:
+                self._delete_file(url)
+    
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + ".json")
+    
+    def _write_file(self, entry: CachedResponse):
+        path = self._path(entry.url)
+        temporary = f"{path}.{os.getpid()}.{id(entry)}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(entry.to_record(), f)
+        os.replace(temporary, path)
+    
+    def _delete_file(self, url: str):
+        if self.directory:
+            try:
+                os.remove(self._path(url))
+            except FileNotFoundError:
+                pass
+    
+    def _load(self):
+        """Rebuild the index from disk, least recently written first.
+
+        Files that are not readable cache entries are skipped and left alone:
+        the directory may be shared, and a later store overwrites a torn one.
+        """
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith(".json")]
+        for path in sorted(paths, key=os.path.getmtime):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = CachedResponse(**json.load(f))
+                if self._path(entry.url) != path:
+                    continue  # not written by this cache
+            except (OSError, ValueError, TypeError, AttributeError):
+                continue
+            self._put_loaded(entry)
+        self.stats["loaded"] = len(self.entries)
+    
+    def _put_loaded(self, entry: CachedResponse):
+        self.entries[entry.url] = entry
+        self.current_bytes += entry.size
+        while self.current_bytes > self.max_bytes:
+            _, oldest = self.entries.popitem(last=False)
+            self.current_bytes -= oldest.size
+            self._delete_file(oldest.url)
+
+class TokenBucket:
+    """Token bucket as GCRA: one theoretical arrival time, O(1) per check.
+
+    A call conforms when it is no earlier than the theoretical arrival time
+    minus the burst tolerance; each call pushes that time forward by one
+    interval. The burst defaults to a minute's worth of calls, as a plain
+    calls-per-minute window would allow. Callers hold the owning
+    RateLimiter's lock.
+    """
+    
+    def __init__(self, calls_per_minute: float, burst: Optional[int] = None):
+        self.interval = 60.0 / calls_per_minute
+        if burst is None:
+            burst = int(calls_per_minute)
+        self.tolerance = (max(1, burst) - 1) * self.interval
+        self.theoretical_arrival = 0.0
+    
+    def delay(self, now: float, tokens: int = 1) -> float:
+        """Seconds until tokens can be taken (0 if now)."""
+        return max(0.0, self.theoretical_arrival + (tokens - 1) * self.interval - self.tolerance - now)
+    
+    def take(self, at: float, tokens: int = 1):
+        self.theoretical_arrival = max(self.theoretical_arrival, at) + tokens * self.interval
+    
+    def give_back(self, now: float, tokens: int = 1):
+        self.theoretical_arrival = max(self.theoretical_arrival - tokens * self.interval, now)
 
 class RateLimiter:
-    """Simple rate limiter for API calls."""
+    """Rate limiter for API calls: a global bucket plus per-endpoint and per-tenant ones.
+
+    A call takes a token from every bucket that applies to it. Throttled
+    callers reserve their slot and sleep outside the lock, so callers on
+    other endpoints or tenants are not held up.
+    """
+    
+    # Endpoint/tenant bucket count that triggers dropping the idle ones
+    SWEEP_THRESHOLD = 1024
     
-    def __init__(self, calls_per_minute: int):
+    def __init__(self, calls_per_minute: int, burst: Optional[int] = None,
+                 endpoint_limits: Optional[Dict[str, int]] = None,
+                 tenant_calls_per_minute: Optional[int] = None, tenant_burst: Optional[int] = None):
         self.calls_per_minute = calls_per_minute
-        self.call_times: List[float] = []
+        # None: each bucket allows a minute's worth of its own limit
+        self.burst = burst
+        # endpoint path -> calls per minute (same burst as the global bucket)
+        self.endpoint_limits = endpoint_limits or {}
+        self.tenant_calls_per_minute = tenant_calls_per_minute
+        self.tenant_burst = tenant_burst
+        self.buckets: Dict[Hashable, TokenBucket] = {
+            None: TokenBucket(calls_per_minute, burst)
+        }
+        self._sweep_at = self.SWEEP_THRESHOLD
         self.lock = Lock()
     
-    def wait_if_needed(self):
+    def try_acquire(self, endpoint: str = None, tenant: str = None, tokens: int = 1) -> bool:
+        """Take tokens now if every applicable bucket has them; never waits."""
+        with self.lock:
+            now = time.monotonic()
+            buckets = self._buckets_for(endpoint, tenant, now)
+            if any(bucket.delay(now, tokens) > 0 for bucket in buckets):
+                return False
+            for bucket in buckets:
+                bucket.take(now, tokens)
+            return True
+    
+    def reserve(self, endpoint: str = None, tenant: str = None, tokens: int = 1,
+                max_wait: float = None) -> Optional[float]:
+        """Reserve tokens and return how long to wait before using them.
+
+        Returns None, reserving nothing, if the wait would exceed max_wait.
+        """
+        with self.lock:
+            now = time.monotonic()
+            buckets = self._buckets_for(endpoint, tenant, now)
+            delay = max(bucket.delay(now, tokens) for bucket in buckets)
+            if max_wait is not None and delay > max_wait:
+                return None
+            # Taken now in every bucket: the slowest one's arrival time already
+            # covers the delay, and the others must not be pushed out with it
+            for bucket in buckets:
+                bucket.take(now, tokens)
+            return delay
+    
+    def wait_if_needed(self, endpoint: str = None, tenant: str = None, tokens: int = 1):
         """Wait if rate limit would be exceeded."""
+        delay = self.reserve(endpoint, tenant, tokens)
+        if delay > 0:
+            time.sleep(delay)
+    
+    async def acquire(self, endpoint: str = None, tenant: str = None, tokens: int = 1):
+        """asyncio counterpart of wait_if_needed."""
+        delay = self.reserve(endpoint, tenant, tokens)
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # The call will not happen; free the reserved slot
+                self.refund(endpoint, tenant, tokens)
+                raise
+    
+    def refund(self, endpoint: str = None, tenant: str = None, tokens: int = 1):
+        """Return tokens for a call that should not count against the limit."""
         with self.lock:
-            now = time.time()
-            
-            # Remove calls older than 1 minute
-            self.call_times = [t for t in self.call_times if now - t < 60]
-            
-            if len(self.call_times) >= self.calls_per_minute:
-                # Wait until oldest call expires
-                oldest = min(self.call_times)
-                wait_time = 60 - (now - oldest) + 0.1
-                if wait_time > 0:
-                    time.sleep(wait_time)
-                    # Recalculate after wait
-                    now = time.time()
-                    self.call_times = [t for t in self.call_times if now - t < 60]
-            
-            self.call_times.append(now)
\ No newline at end of file
+            now = time.monotonic()
+            for bucket in self._buckets_for(endpoint, tenant, now):
+                bucket.give_back(now, tokens)
+    
+    def _buckets_for(self, endpoint: Optional[str], tenant: Optional[str],
+                     now: float) -> List[TokenBucket]:
+        if len(self.buckets) > self._sweep_at:
+            self._drop_idle(now)
+        buckets = [self.buckets[None]]
+        if endpoint in self.endpoint_limits:
+            buckets.append(self._bucket(('endpoint', endpoint), self.endpoint_limits[endpoint], self.burst))
+        if tenant is not None and self.tenant_calls_per_minute:
+            buckets.append(self._bucket(('tenant', tenant), self.tenant_calls_per_minute, self.tenant_burst))
+        return buckets
+    
+    def _bucket(self, key: Tuple[str, str], calls_per_minute: int, burst: int) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(calls_per_minute, burst)
+        return bucket
+    
+    def _drop_idle(self, now: float):
+        """Forget endpoint/tenant buckets that have fully refilled.
+
+        A bucket whose theoretical arrival time has passed behaves exactly
+        like a new one, so dropping it changes nothing but memory.
+        """
+        idle = [key for key, bucket in self.buckets.items()
+                if key is not None and bucket.theoretical_arrival <= now]
+        for key in idle:
+            del self.buckets[key]
+        self._sweep_at = max(self.SWEEP_THRESHOLD, 2 * len(self.buckets))
+
+
+def benchmark_contention(threads: int = 64, calls_per_minute: int = 10_000, burst: int = 50,
+                         duration: float = 5.0, upstream_latency: float = 0.002) -> Dict:
+    """64 threads against a 10k calls/min limit: old sliding window vs GCRA buckets."""
+    import statistics
+    import threading
+
+    class LegacyRateLimiter:
+        """Previous implementation: list of call times, sleeps holding the lock."""
+
+        def __init__(self, calls_per_minute: int):
+            self.calls_per_minute = calls_per_minute
+            self.call_times: List[float] = []
+            self.lock = Lock()
+
+        def wait_if_needed(self):
+            with self.lock:
+                now = time.time()
+                self.call_times = [t for t in self.call_times if now - t < 60]
+                if len(self.call_times) >= self.calls_per_minute:
+                    oldest = min(self.call_times)
+                    wait_time = 60 - (now - oldest) + 0.1
+                    if wait_time > 0:
+                        time.sleep(wait_time)
+                        now = time.time()
+                        self.call_times = [t for t in self.call_times if now - t < 60]
+                self.call_times.append(now)
+
+    def run(acquire_for, workers: Dict[str, int]) -> Dict[str, Dict]:
+        """Each group's threads call acquire then "upstream" until the deadline."""
+        waits = {group: [] for group in workers}
+        deadline = time.monotonic() + duration
+
+        def worker(group: str):
+            acquire = acquire_for(group)
+            while time.monotonic() < deadline:
+                start = time.monotonic()
+                acquire()
+                if time.monotonic() > deadline:
+                    break
+                waits[group].append(time.monotonic() - start)
+                time.sleep(upstream_latency)
+
+        pool = [threading.Thread(target=worker, args=(group,), daemon=True)
+                for group, count in workers.items() for _ in range(count)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            # Old limiter: a thread can sleep close to a minute with the lock held
+            thread.join(timeout=max(0.0, deadline + 1.0 - time.monotonic()))
+        waiting = sum(thread.is_alive() for thread in pool)
+
+        report = {}
+        for group, samples in waits.items():
+            ordered = sorted(samples) or [0.0]
+            report[group] = {
+                "calls_per_min": round(len(samples) / duration * 60),
+                "p50_wait_ms": round(statistics.median(ordered) * 1000, 2),
+                "p99_wait_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2)
+            }
+        report["threads_waiting_at_end"] = waiting
+        return report
+
+    report = {}
+
+    # Cost of one check with ~9k calls in the last minute
+    legacy = LegacyRateLimiter(calls_per_minute)
+    legacy.call_times = [time.time()] * (calls_per_minute - 1000)
+    limiter = RateLimiter(calls_per_minute=10 ** 9)
+    checks = 500
+    start = time.perf_counter()
+    for _ in range(checks):
+        legacy.wait_if_needed()
+    report["legacy_check_us"] = round((time.perf_counter() - start) / checks * 1e6, 1)
+    start = time.perf_counter()
+    for _ in range(checks):
+        limiter.try_acquire(endpoint="orders", tenant="acme")
+    report["gcra_check_us"] = round((time.perf_counter() - start) / checks * 1e6, 2)
+
+    # Shared 10k/min limit, all threads on one pool, starting from a minute
+    # that was already running at the limit
+    legacy = LegacyRateLimiter(calls_per_minute)
+    legacy.call_times = [time.time() - 60 + 60 * i / calls_per_minute for i in range(calls_per_minute)]
+    report["legacy"] = run(lambda group: legacy.wait_if_needed, {"all": threads})
+    limiter = RateLimiter(calls_per_minute, burst=burst)
+    limiter.buckets[None].theoretical_arrival = time.monotonic()
+    report["gcra"] = run(lambda group: limiter.wait_if_needed, {"all": threads})
+
+    # Half the threads hit an endpoint capped at 600/min; the other half must not wait on them
+    limiter = RateLimiter(calls_per_minute, burst=burst, endpoint_limits={"reports": 600})
+    report["gcra_endpoints"] = run(
+        lambda group: (lambda: limiter.wait_if_needed(endpoint=group)),
+        {"reports": threads // 2, "orders": threads // 2}
+    )
+
+    # asyncio callers share the same buckets
+    async def async_calls(count: int) -> float:
+        async_limiter = RateLimiter(calls_per_minute, burst=burst)
+        start = time.perf_counter()
+        await asyncio.gather(*(async_limiter.acquire() for _ in range(count)))
+        return time.perf_counter() - start
+
+    report["async_300_acquires_s"] = round(asyncio.run(async_calls(300)), 2)
+    return report
+
+
+def benchmark_http_cache(reads: int = 600, threads: int = 8) -> Dict:
+    """Upstream calls and rate-limit tokens for cached reads against a local stub API."""
+    import shutil
+    import tempfile
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    # path -> (Cache-Control, body); the version bumps make ETags change
+    routes = {
+        "catalog": "max-age=1, stale-while-revalidate=30",
+        "config": "no-cache",
+        "orders": "no-store"
+    }
+    versions = {path: 1 for path in routes}
+    upstream = {"200": 0, "304": 0}
+    counter_lock = Lock()
+
+    class StubAPI(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path = self.path.strip("/")
+            body = json.dumps({"path": path, "version": versions[path], "items": list(range(200))})
+            etag = f'"{path}-{versions[path]}"'
+            if self.headers.get("If-None-Match") == etag:
+                with counter_lock:
+                    upstream["304"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", routes[path])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            with counter_lock:
+                upstream["200"] += 1
+            encoded = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", routes[path])
+            self.send_header("Content-Length", str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cache_dir = tempfile.mkdtemp()
+    config = {
+        "base_url": f"http://127.0.0.1:{server.server_address[1]}",
+        "rate_limit": 600_000,
+        "rate_limit_burst": 1000,
+        "cache_dir": cache_dir
+    }
+
+    class CountingRateLimiter(RateLimiter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.tokens = 0
+
+        def reserve(self, *args, **kwargs):
+            with counter_lock:
+                self.tokens += 1
+            return super().reserve(*args, **kwargs)
+
+        def refund(self, *args, **kwargs):
+            with counter_lock:
+                self.tokens -= 1
+            super().refund(*args, **kwargs)
+
+    def build(cached: bool) -> EnterpriseAPIMCP:
+        api = EnterpriseAPIMCP(dict(config, cache_enabled=cached))
+        api.rate_limiter = CountingRateLimiter(config["rate_limit"], burst=config["rate_limit_burst"])
+        return api
+
+    # 70% catalog, 20% config, 10% orders, spread over ~2.5s so max-age lapses
+    paths = ["catalog"] * 7 + ["config"] * 2 + ["orders"]
+    workload = [paths[i % len(paths)] for i in range(reads)]
+
+    def run(api: EnterpriseAPIMCP) -> Dict:
+        upstream["200"] = upstream["304"] = 0
+        chunks = [workload[i::threads] for i in range(threads)]
+
+        def worker(chunk):
+            for n, path in enumerate(chunk):
+                if n == len(chunk) // 2 and chunk is chunks[0]:
+                    versions["catalog"] += 1  # upstream changes mid-run
+                body = api.read_resource(f"api://{path}")
+                assert json.loads(body)["path"] == path
+                time.sleep(2.5 / len(chunk))
+
+        start = time.perf_counter()
+        pool = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        api._revalidator.shutdown(wait=True)
+        return {
+            "reads": reads,
+            "upstream_200": upstream["200"],
+            "upstream_304": upstream["304"],
+            "rate_limit_tokens": api.rate_limiter.tokens,
+            "seconds": round(time.perf_counter() - start, 2)
+        }
+
+    report = {"uncached": run(build(cached=False))}
+    api = build(cached=True)
+    report["cached"] = run(api)
+    cached_catalog = json.loads(api.http_cache.get(f"{config['base_url']}/catalog").body)
+    assert cached_catalog["version"] == versions["catalog"], "stale copy was never revalidated"
+
+    # A new process reuses the on-disk entries: config revalidates with a 304
+    upstream["200"] = upstream["304"] = 0
+    restarted = build(cached=True)
+    restarted.read_resource("api://config")
+    restarted.read_resource("api://catalog")
+    report["after_restart"] = {
+        "entries_loaded": restarted.http_cache.stats["loaded"],
+        "upstream_200": upstream["200"],
+        "upstream_304": upstream["304"]
+    }
+    assert upstream["200"] == 0
+
+    server.shutdown()
+    shutil.rmtree(cache_dir)
+    return report
+
+
+if __name__ == "__main__":
+    print(benchmark_contention())
+    print(benchmark_http_cache())
@@ -1,25 +1,116 @@
 # 📖 Chapter: Chapter 2: The Architecture of MCP
 # 📖 Section: 2.7 Advanced Architectural Patterns
 
+import threading
+import time
+from typing import Dict, Optional
+
+class RoutingTable:
+    """Immutable routing snapshot: tool name index plus URI prefix trie."""
+
+    def __init__(self, tools: Dict[str, str] = None, resource_prefixes: Dict[str, str] = None):
+        self.tools = tools or {}
+        self.resource_prefixes = resource_prefixes or {}
+        # Character trie of URI prefixes; the None key holds the owning server
+        self.resource_trie: Dict = {}
+        for prefix, server_id in self.resource_prefixes.items():
+            node = self.resource_trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[None] = server_id
+
+    def route_uri(self, uri: str) -> Optional[str]:
+        """Server owning the longest registered prefix of uri."""
+        node = self.resource_trie
+        match = node.get(None)
+        for char in uri:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return match
+
 class MultiServerHost:
     """Host managing multiple MCP servers."""
-    
-    def __init__(self):
+
+    CONFLICT_POLICIES = ("first", "last", "error")
+
+    def __init__(self, conflict_policy: str = "first"):
+        if conflict_policy not in self.CONFLICT_POLICIES:
+            raise ValueError(f"Unknown conflict policy: {conflict_policy}")
+
         self.servers: Dict[str, 'MCPServerConnection'] = {}
         self.server_capabilities: Dict[str, set] = {}
-    
+        self.conflict_policy = conflict_policy
+        # Readers take this reference once; writers build a new table and swap it
+        self._routes = RoutingTable()
+        self._write_lock = threading.Lock()
+
     def register_server(self, server_id: str, connection: 'MCPServerConnection'):
         """Register a new MCP server."""
-        self.servers[server_id] = connection
-        
         # Discover server capabilities
         capabilities = connection.discover_capabilities()
-        self.server_capabilities[server_id] = capabilities
-    
+
+        with self._write_lock:
+            if server_id in self.server_capabilities:
+                # Re-registration: drop the old entries, keeping this server's position
+                all_capabilities = dict(self.server_capabilities)
+                all_capabilities[server_id] = capabilities
+                routes = self._build_routes(all_capabilities)
+            else:
+                tools = dict(self._routes.tools)
+                resource_prefixes = dict(self._routes.resource_prefixes)
+                self._merge_routes(tools, resource_prefixes, server_id, capabilities)
+                routes = RoutingTable(tools, resource_prefixes)
+
+            self.servers[server_id] = connection
+            self.server_capabilities[server_id] = capabilities
+            self._routes = routes
+
+    def unregister_server(self, server_id: str):
+        """Remove a server; names it shadowed fall back to the remaining servers."""
+        with self._write_lock:
+            self.servers.pop(server_id, None)
+            self.server_capabilities.pop(server_id, None)
+
+            self._routes = self._build_routes(self.server_capabilities)
+
+    def _build_routes(self, server_capabilities: Dict[str, Dict]) -> RoutingTable:
+        """Replay servers in registration order under the conflict policy."""
+        tools: Dict[str, str] = {}
+        resource_prefixes: Dict[str, str] = {}
+        for server_id, capabilities in server_capabilities.items():
+            self._merge_routes(tools, resource_prefixes, server_id, capabilities)
+        return RoutingTable(tools, resource_prefixes)
+
+    def _merge_routes(self, tools: Dict[str, str], resource_prefixes: Dict[str, str],
+                      server_id: str, capabilities: Dict):
+        """Add one server's tools and URI prefixes, applying the conflict policy."""
+        tool_names = [
+            tool["name"] if isinstance(tool, dict) else tool
+            for tool in capabilities.get("tools", [])
+        ]
+        # Resources are advertised as URI prefixes ("file:///", "db://orders/")
+        prefixes = [
+            resource["uri"] if isinstance(resource, dict) else resource
+            for resource in capabilities.get("resources", [])
+        ]
+
+        for table, names, kind in ((tools, tool_names, "Tool"),
+                                   (resource_prefixes, prefixes, "Resource prefix")):
+            for name in names:
+                owner = table.get(name)
+                if owner is not None and owner != server_id:
+                    if self.conflict_policy == "error":
+                        raise ValueError(f"{kind} {name} on {server_id} conflicts with {owner}")
+                    if self.conflict_policy == "first":
+                        continue
+                table[name] = server_id
+
     def route_request(self, request: Dict) -> str:
         """Route request to appropriate server."""
         method = request.get("method")
-        
+
         # Route based on method namespace
         if method.startswith("tools/"):
             return self._route_tool_request(request)
@@ -27,14 +118,86 @@ class MultiServerHost:
             return self._route_resource_request(request)
         else:
             return self._route_general_request(request)
-    
+
     def _route_tool_request(self, request: Dict) -> str:
         """Route tool request to server with that tool."""
         tool_name = request.get("params", {}).get("name")
-        
-        # Find server with this tool
-        for server_id, capabilities in self.server_capabilities.items():
+
+        server_id = self._routes.tools.get(tool_name)
+        if server_id is None:
+            raise ValueError(f"No server found with tool: {tool_name}")
+        return server_id
+
+    def _route_resource_request(self, request: Dict) -> str:
+        """Route resource request by longest matching URI prefix."""
+        uri = request.get("params", {}).get("uri", "")
+
+        server_id = self._routes.route_uri(uri)
+        if server_id is None:
+            raise ValueError(f"No server found for resource: {uri}")
+        return server_id
+
+
+def benchmark_routing(num_servers: int = 40, tools_per_server: int = 100,
+                      requests: int = 200_000) -> Dict:
+    """Tool and resource routing cost against the previous list scan."""
+    class StandInConnection:
+        def __init__(self, index: int):
+            self.capabilities = {
+                "tools": [f"server{index}_tool_{t}" for t in range(tools_per_server)],
+                "resources": [f"file:///srv/{index}/", f"db://server{index}/"]
+            }
+
+        def discover_capabilities(self) -> Dict:
+            return self.capabilities
+
+    host = MultiServerHost()
+    start = time.perf_counter()
+    for i in range(num_servers):
+        host.register_server(f"server-{i}", StandInConnection(i))
+    register_ms = (time.perf_counter() - start) * 1000
+
+    tool_requests = [
+        {"method": "tools/call", "params": {"name": f"server{i % num_servers}_tool_{i % tools_per_server}"}}
+        for i in range(requests)
+    ]
+    resource_requests = [
+        {"method": "resources/read", "params": {"uri": f"file:///srv/{i % num_servers}/reports/{i}.csv"}}
+        for i in range(requests)
+    ]
+
+    start = time.perf_counter()
+    for request in tool_requests:
+        host.route_request(request)
+    tool_ns = (time.perf_counter() - start) / requests * 1e9
+
+    start = time.perf_counter()
+    for request in resource_requests:
+        host.route_request(request)
+    resource_ns = (time.perf_counter() - start) / requests * 1e9
+
+    # Previous behaviour: list membership test on every server
+    def scan(tool_name: str) -> str:
+        for server_id, capabilities in host.server_capabilities.items():
             if tool_name in capabilities.get("tools", []):
                 return server_id
-        
-        raise ValueError(f"No server found with tool: {tool_name}")
\ No newline at end of file
+        raise ValueError(tool_name)
+
+    sample = [request["params"]["name"] for request in tool_requests[:requests // 100]]
+    start = time.perf_counter()
+    for tool_name in sample:
+        scan(tool_name)
+    scan_ns = (time.perf_counter() - start) / len(sample) * 1e9
+
+    return {
+        "servers": num_servers,
+        "tools": num_servers * tools_per_server,
+        "register_all_ms": round(register_ms, 3),
+        "indexed_tool_route_ns": round(tool_ns),
+        "trie_resource_route_ns": round(resource_ns),
+        "scan_tool_route_ns": round(scan_ns)
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_routing())
@@ -1,24 +1,157 @@
 # 📖 Chapter: Chapter 2: The Architecture of MCP
 # 📖 Section: 2.7 Advanced Architectural Patterns
 
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
 class CascadingMCPServer:
     """MCP server that delegates to other servers."""
-    
-    def __init__(self):
-        self.upstream_servers: List['MCPClient'] = []
-    
+
+    def __init__(self, upstream_servers: List['MCPClient'] = None,
+                 refresh_timeout: float = 5.0, negative_ttl: float = 30.0):
+        self.upstream_servers: List['MCPClient'] = list(upstream_servers or [])
+        self.local_tools: Dict[str, Callable] = {}
+        self.refresh_timeout = refresh_timeout
+        self.negative_ttl = negative_ttl
+        # tool name -> owning upstream; replaced wholesale so readers never lock
+        self.tool_routes: Dict[str, 'MCPClient'] = {}
+        self._upstream_tools: Dict['MCPClient', Set[str]] = {}
+        # tool name -> time until which it is known not to exist anywhere
+        self._unknown_tools: Dict[str, float] = {}
+        self._refresh_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(4, len(self.upstream_servers)))
+
+    def start(self):
+        """Build the routing table before serving traffic."""
+        self.refresh_routes()
+
     def call_tool(self, name: str, arguments: Dict) -> Dict:
         """Call tool, delegating to upstream servers if needed."""
         # Check if we handle this tool
         if name in self.local_tools:
             return self._execute_local_tool(name, arguments)
-        
-        # Delegate to upstream servers
-        for server in self.upstream_servers:
-            try:
-                if name in server.list_tools():
-                    return server.call_tool(name, arguments)
-            except:
-                continue
-        
-        raise ValueError(f"Tool {name} not found")
\ No newline at end of file
+
+        server = self.tool_routes.get(name)
+        if server is None:
+            server = self._route_miss(name)
+
+        # Delegate to the owning upstream: one hop
+        return server.call_tool(name, arguments)
+
+    def handle_notification(self, server: 'MCPClient', notification: Dict):
+        """Refresh one upstream's tools on tools/list_changed."""
+        if notification.get('method') == 'notifications/tools/list_changed':
+            self.refresh_routes([server])
+
+    def refresh_routes(self, servers: List['MCPClient'] = None):
+        """Re-list tools on the given upstreams (default: all) concurrently."""
+        servers = servers if servers is not None else self.upstream_servers
+
+        futures = {self.executor.submit(server.list_tools): server for server in servers}
+        done, not_done = wait(futures, timeout=self.refresh_timeout)
+
+        with self._refresh_lock:
+            for future in done:
+                server = futures[future]
+                try:
+                    tools = future.result()
+                except Exception as e:
+                    logger.warning(f"Failed to list tools on upstream {server}: {e}")
+                    continue
+                self._upstream_tools[server] = {
+                    tool['name'] if isinstance(tool, dict) else tool
+                    for tool in tools
+                }
+
+            for future in not_done:
+                logger.warning(f"Upstream {futures[future]} did not list tools in time")
+
+            # Earlier upstreams win when several expose the same tool
+            routes = {}
+            for server in reversed(self.upstream_servers):
+                for tool_name in self._upstream_tools.get(server, ()):
+                    routes[tool_name] = server
+            self.tool_routes = routes
+
+            # Misses expire by TTL only; a refresh just drops the expired ones.
+            # Routed names are looked up before the negative cache anyway.
+            now = time.monotonic()
+            self._unknown_tools = {
+                name: expires for name, expires in self._unknown_tools.items()
+                if expires > now and name not in routes
+            }
+
+    def _route_miss(self, name: str) -> 'MCPClient':
+        """Refresh once on an unknown tool, then remember the miss for a while."""
+        expires = self._unknown_tools.get(name)
+        if expires is not None and expires > time.monotonic():
+            raise ValueError(f"Tool {name} not found")
+
+        self.refresh_routes()
+        server = self.tool_routes.get(name)
+        if server is None:
+            self._unknown_tools[name] = time.monotonic() + self.negative_ttl
+            raise ValueError(f"Tool {name} not found")
+
+        return server
+
+    def _execute_local_tool(self, name: str, arguments: Dict) -> Dict:
+        return self.local_tools[name](arguments)
+
+
+def benchmark_delegation(upstreams: int = 10, hop_latency: float = 0.002,
+                         calls: int = 50) -> Dict:
+    """Added latency of delegation: per-call list_tools scan vs routing table."""
+    class StandInUpstream:
+        def __init__(self, index: int):
+            self.tools = [{'name': f'upstream{index}_tool_{t}'} for t in range(20)]
+
+        def list_tools(self) -> List[Dict]:
+            time.sleep(hop_latency)
+            return self.tools
+
+        def call_tool(self, name: str, arguments: Dict) -> Dict:
+            time.sleep(hop_latency)
+            return {'content': [{'type': 'text', 'text': name}]}
+
+    servers = [StandInUpstream(i) for i in range(upstreams)]
+    # Worst case for the scan: the tool lives on the last upstream
+    tool_name = f'upstream{upstreams - 1}_tool_0'
+
+    def scan_and_call(name: str, arguments: Dict) -> Dict:
+        for server in servers:
+            if name in [tool['name'] for tool in server.list_tools()]:
+                return server.call_tool(name, arguments)
+        raise ValueError(f"Tool {name} not found")
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        scan_and_call(tool_name, {})
+    scan_ms = (time.perf_counter() - start) / calls * 1000
+
+    cascade = CascadingMCPServer(servers)
+    start = time.perf_counter()
+    cascade.start()
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        cascade.call_tool(tool_name, {})
+    routed_ms = (time.perf_counter() - start) / calls * 1000
+
+    hop_ms = hop_latency * 1000
+    return {
+        'upstreams': upstreams,
+        'scan_added_latency_ms': round(scan_ms - hop_ms, 3),
+        'routed_added_latency_ms': round(routed_ms - hop_ms, 3),
+        'concurrent_startup_ms': round(startup_ms, 3)
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_delegation())
@@ -1,28 +1,264 @@
 # 📖 Chapter: Chapter 2: The Architecture of MCP
 # 📖 Section: 2.7 Advanced Architectural Patterns
 
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class PrefixSubscriptionTrie:
+    """Character trie of URI prefixes ("file:///docs/*") to subscriber sets."""
+
+    def __init__(self):
+        self.root: Dict = {}
+
+    def add(self, prefix: str, client_id: str):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault(None, set()).add(client_id)
+
+    def remove(self, prefix: str, client_id: str):
+        path = []
+        node = self.root
+        for char in prefix:
+            if char not in node:
+                return
+            path.append((node, char))
+            node = node[char]
+
+        subscribers = node.get(None)
+        if subscribers is None:
+            return
+        subscribers.discard(client_id)
+        if not subscribers:
+            del node[None]
+
+        for parent, char in reversed(path):
+            if parent[char]:
+                break
+            del parent[char]
+
+    def match(self, uri: str) -> Set[str]:
+        """Subscribers of every prefix of uri, in one pass over its characters."""
+        matched: Set[str] = set()
+        node = self.root
+        for char in uri:
+            if None in node:
+                matched |= node[None]
+            node = node.get(char)
+            if node is None:
+                return matched
+        if None in node:
+            matched |= node[None]
+        return matched
+
+class ClientOutbox:
+    """Per-client queue of pending URIs; a URI already queued is not queued again."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending: Dict[str, None] = {}  # insertion-ordered set
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
 class EventDrivenMCPServer:
     """MCP server with event-driven architecture."""
-    
-    def __init__(self):
+
+    def __init__(self, send_notification: Callable[[str, Dict], Any],
+                 debounce_seconds: float = 0.05, max_pending_per_client: int = 10000,
+                 loop: asyncio.AbstractEventLoop = None):
+        # Transport hook: send_notification(client_id, notification), sync or async
+        if send_notification is None:
+            raise ValueError("send_notification is required to deliver notifications")
+        self.send_notification = send_notification
+        # Loop that owns the timers and outboxes; captured on first use if not given
+        self.loop = loop
         self.event_handlers: Dict[str, List[callable]] = {}
-        self.subscriptions: Dict[str, List[str]] = {}  # resource_uri -> [client_ids]
-    
+        self.subscriptions: Dict[str, Set[str]] = {}  # resource_uri -> {client_ids}
+        self.prefix_subscriptions = PrefixSubscriptionTrie()
+        self.client_subscriptions: Dict[str, Set[str]] = {}  # client_id -> {patterns}
+        self.debounce_seconds = debounce_seconds
+        # Per-URI override of the coalescing window
+        self.debounce_windows: Dict[str, float] = {}
+        self.max_pending_per_client = max_pending_per_client
+        self.outboxes: Dict[str, ClientOutbox] = {}
+        self._scheduled_flushes: Dict[str, asyncio.TimerHandle] = {}
+        self.stats = {
+            "changes": 0,
+            "flushes": 0,
+            "notifications_queued": 0,
+            "duplicates_dropped": 0,
+            "overflow_dropped": 0,
+            "notifications_sent": 0,
+            "send_errors": 0
+        }
+
     def subscribe_to_resource(self, client_id: str, resource_uri: str):
-        """Subscribe client to resource updates."""
-        if resource_uri not in self.subscriptions:
-            self.subscriptions[resource_uri] = []
-        
-        self.subscriptions[resource_uri].append(client_id)
-    
+        """Subscribe client to resource updates; a trailing * subscribes to a prefix."""
+        self.client_subscriptions.setdefault(client_id, set()).add(resource_uri)
+        if resource_uri.endswith("*"):
+            self.prefix_subscriptions.add(resource_uri[:-1], client_id)
+        else:
+            self.subscriptions.setdefault(resource_uri, set()).add(client_id)
+
+    def unsubscribe_from_resource(self, client_id: str, resource_uri: str):
+        """Remove a subscription made with subscribe_to_resource."""
+        self.client_subscriptions.get(client_id, set()).discard(resource_uri)
+        if resource_uri.endswith("*"):
+            self.prefix_subscriptions.remove(resource_uri[:-1], client_id)
+            return
+
+        subscribers = self.subscriptions.get(resource_uri)
+        if subscribers is not None:
+            subscribers.discard(client_id)
+            if not subscribers:
+                del self.subscriptions[resource_uri]
+
     def notify_resource_change(self, resource_uri: str):
-        """Notify subscribers of resource change."""
-        subscribers = self.subscriptions.get(resource_uri, [])
-        
+        """Record a change; subscribers are notified once per coalescing window.
+
+        Safe to call from any thread; the work is handed to the server's loop.
+        """
+        if self.loop is None:
+            try:
+                self.loop = asyncio.get_running_loop()
+            except RuntimeError:
+                raise RuntimeError(
+                    "No event loop: pass loop= or notify once from the loop's thread"
+                ) from None
+        self.loop.call_soon_threadsafe(self._schedule_flush, resource_uri)
+
+    def _schedule_flush(self, resource_uri: str):
+        self.stats["changes"] += 1
+        if resource_uri in self._scheduled_flushes:
+            return
+
+        window = self.debounce_windows.get(resource_uri, self.debounce_seconds)
+        self._scheduled_flushes[resource_uri] = self.loop.call_later(
+            window, self._flush_resource, resource_uri
+        )
+
+    def _flush_resource(self, resource_uri: str):
+        self._scheduled_flushes.pop(resource_uri, None)
+        self.stats["flushes"] += 1
+
+        subscribers = self.subscriptions.get(resource_uri, set()) | \
+            self.prefix_subscriptions.match(resource_uri)
         for client_id in subscribers:
-            self._send_notification(client_id, {
-                "method": "notifications/resources/updated",
-                "params": {
-                    "uri": resource_uri
-                }
-            })
\ No newline at end of file
+            self._enqueue(client_id, resource_uri)
+
+    def _enqueue(self, client_id: str, resource_uri: str):
+        outbox = self.outboxes.get(client_id)
+        if outbox is None:
+            outbox = self.outboxes[client_id] = ClientOutbox(self.max_pending_per_client)
+            outbox.task = self.loop.create_task(self._drain(client_id, outbox))
+
+        if resource_uri in outbox.pending:
+            self.stats["duplicates_dropped"] += 1
+            return
+        if len(outbox.pending) >= outbox.max_pending:
+            # Slow client: it will still see the oldest queued changes
+            self.stats["overflow_dropped"] += 1
+            return
+
+        outbox.pending[resource_uri] = None
+        outbox.ready.set()
+        self.stats["notifications_queued"] += 1
+
+    async def _drain(self, client_id: str, outbox: ClientOutbox):
+        """Deliver one client's notifications without blocking other clients."""
+        while True:
+            await outbox.ready.wait()
+            while outbox.pending:
+                resource_uri = next(iter(outbox.pending))
+                del outbox.pending[resource_uri]
+
+                try:
+                    result = self.send_notification(client_id, {
+                        "method": "notifications/resources/updated",
+                        "params": {
+                            "uri": resource_uri
+                        }
+                    })
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    # One failed write must not stop this client's later notifications
+                    self.stats["send_errors"] += 1
+                    logger.warning(f"Failed to notify {client_id} about {resource_uri}: {e}")
+                    continue
+                self.stats["notifications_sent"] += 1
+            outbox.ready.clear()
+
+    def remove_client(self, client_id: str):
+        """Drop a disconnected client's outbox and subscriptions."""
+        outbox = self.outboxes.pop(client_id, None)
+        if outbox is not None and outbox.task is not None:
+            outbox.task.cancel()
+
+        for resource_uri in self.client_subscriptions.pop(client_id, set()):
+            self.unsubscribe_from_resource(client_id, resource_uri)
+
+
+async def benchmark_fan_out(subscribers: int = 10_000, resources: int = 100,
+                            change_rate: float = 1000.0, duration: float = 2.0) -> Dict:
+    """Notification throughput with many subscribers and a high change rate."""
+    async def send_notification(client_id: str, notification: Dict):
+        pass
+
+    server = EventDrivenMCPServer(send_notification, debounce_seconds=0.05,
+                                  loop=asyncio.get_running_loop())
+    uris = [f"file:///data/{i}.json" for i in range(resources)]
+    rng = random.Random(1)
+
+    exact_subscribers = 0
+    for i in range(subscribers):
+        client_id = f"client-{i}"
+        if i % 100 == 0:
+            server.subscribe_to_resource(client_id, "file:///data/*")
+        else:
+            server.subscribe_to_resource(client_id, rng.choice(uris))
+            exact_subscribers += 1
+    prefix_subscribers = subscribers - exact_subscribers
+
+    # Zipf-skewed changes: a few hot resources change far more often than the rest
+    weights = [1.0 / (rank + 1) for rank in range(resources)]
+    changed = rng.choices(uris, weights, k=int(change_rate * duration))
+
+    changes = len(changed)
+    start = time.perf_counter()
+    for i, uri in enumerate(changed):
+        server.notify_resource_change(uri)
+        # Hold the change rate, yielding so flushes and deliveries run meanwhile
+        delay = start + (i + 1) / change_rate - time.perf_counter()
+        await asyncio.sleep(max(0.0, delay))
+
+    # Let the final windows flush and the outboxes drain
+    await asyncio.sleep(server.debounce_seconds * 2)
+    while any(outbox.pending for outbox in server.outboxes.values()):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    for outbox in server.outboxes.values():
+        outbox.task.cancel()
+
+    # One send per subscriber per change, as the list-based loop did
+    naive_sends = sum(len(server.subscriptions.get(uri, ())) + prefix_subscribers for uri in changed)
+
+    return {
+        "subscribers": subscribers,
+        "changes": changes,
+        "naive_notifications": naive_sends,
+        "notifications_sent": server.stats["notifications_sent"],
+        "duplicates_dropped": server.stats["duplicates_dropped"],
+        "delivered_per_second": round(server.stats["notifications_sent"] / elapsed),
+        "elapsed_s": round(elapsed, 3)
+    }
+
+
+if __name__ == "__main__":
+    print(asyncio.run(benchmark_fan_out()))
@@ -1,48 +1,240 @@
 # 📖 Chapter: Chapter 2: The Architecture of MCP
 # 📖 Section: 2.8 Performance and Scalability Considerations
 
+import random
+import statistics
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+class Backend:
+    """One server instance: a few client connections plus health state."""
+
+    def __init__(self, endpoint: str, connections: List['MCPClient'], added_at: float):
+        self.endpoint = endpoint
+        self.connections = connections
+        self.connection_in_flight = [0] * len(connections)
+        self.added_at = added_at
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.last_failure_at: Optional[float] = None
+        self.ejected_until: Optional[float] = None
+        self.current_weight = 0.0
+        self.metrics = {
+            "requests": 0,
+            "errors": 0,
+            "avg_duration": 0
+        }
+
 class LoadBalancedMCPHost:
     """Host with load balancing across server instances."""
-    
-    def __init__(self, server_endpoints: List[str]):
-        self.servers: List['MCPClient'] = [
-            MCPClient(endpoint) for endpoint in server_endpoints
-        ]
-        self.current_index = 0
-        self.server_metrics: Dict[int, Dict] = {}
-    
+
+    def __init__(self, server_endpoints: List[str], connections_per_backend: int = 2,
+                 max_consecutive_failures: int = 3, ejection_seconds: float = 10.0,
+                 max_ejection_seconds: float = 300.0, slow_start_seconds: float = 30.0,
+                 ejection_decay_seconds: float = 300.0,
+                 client_factory: Callable[[str], 'MCPClient'] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.connections_per_backend = connections_per_backend
+        self.max_consecutive_failures = max_consecutive_failures
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self.slow_start_seconds = slow_start_seconds
+        # Failure-free time it takes to forget one past ejection
+        self.ejection_decay_seconds = ejection_decay_seconds
+        self.client_factory = client_factory or MCPClient
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.backends: List[Backend] = []
+
+        for endpoint in server_endpoints:
+            # Initial backends take full traffic; slow start is for later additions
+            self.add_backend(endpoint, slow_start=False)
+
+    @property
+    def server_metrics(self) -> Dict[str, Dict]:
+        """Per-endpoint request metrics."""
+        return {backend.endpoint: dict(backend.metrics) for backend in self.backends}
+
+    def add_backend(self, endpoint: str, slow_start: bool = True):
+        """Add a server instance; it ramps up to full weight over slow_start_seconds."""
+        connections = [self.client_factory(endpoint) for _ in range(self.connections_per_backend)]
+        added_at = self.clock() if slow_start else float("-inf")
+        with self._lock:
+            self.backends.append(Backend(endpoint, connections, added_at))
+
+    def remove_backend(self, endpoint: str):
+        """Stop sending traffic to a server instance."""
+        with self._lock:
+            self.backends = [b for b in self.backends if b.endpoint != endpoint]
+
     def route_request(self, request: Dict) -> Dict:
-        """Route request using round-robin load balancing."""
-        server = self._select_server()
-        
-        start_time = time.time()
+        """Route request using health-aware weighted round-robin."""
+        backend, connection_index = self._select_server()
+        server = backend.connections[connection_index]
+
+        start_time = self.clock()
         try:
             result = server.handle_request(request)
-            self._record_success(server, time.time() - start_time)
-            return result
         except Exception as e:
-            self._record_error(server, e)
+            self._release(backend, connection_index)
+            self._record_error(backend, e)
             raise
-    
-    def _select_server(self) -> 'MCPClient':
-        """Select server using round-robin."""
-        server = self.servers[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.servers)
-        return server
-    
-    def _record_success(self, server: 'MCPClient', duration: float):
+
+        self._release(backend, connection_index)
+        self._record_success(backend, self.clock() - start_time)
+        return result
+
+    def _weight(self, backend: Backend, now: float) -> float:
+        """Effective weight: zero while ejected, ramping after (re)admission."""
+        if backend.ejected_until is not None:
+            if now < backend.ejected_until:
+                return 0.0
+            # Ejection expired: reinstate through slow start
+            backend.ejected_until = None
+            backend.added_at = now
+
+        if self.slow_start_seconds <= 0:
+            return 1.0
+        ramp = (now - backend.added_at) / self.slow_start_seconds
+        return min(1.0, max(0.1, ramp))
+
+    def _select_server(self):
+        """Pick a backend (smooth weighted round-robin) and its least-busy connection."""
+        with self._lock:
+            now = self.clock()
+            weights = [(backend, self._weight(backend, now)) for backend in self.backends]
+            candidates = [(backend, weight) for backend, weight in weights if weight > 0]
+            if not candidates:
+                # Everything is ejected: fail open rather than refuse all traffic
+                candidates = [(backend, 1.0) for backend in self.backends]
+            if not candidates:
+                raise RuntimeError("No backends configured")
+
+            total = 0.0
+            chosen = None
+            for backend, weight in candidates:
+                backend.current_weight += weight
+                total += weight
+                if chosen is None or backend.current_weight > chosen.current_weight:
+                    chosen = backend
+            chosen.current_weight -= total
+
+            connection_index = min(
+                range(len(chosen.connections)),
+                key=chosen.connection_in_flight.__getitem__
+            )
+            chosen.connection_in_flight[connection_index] += 1
+            chosen.in_flight += 1
+            return chosen, connection_index
+
+    def _release(self, backend: Backend, connection_index: int):
+        with self._lock:
+            backend.connection_in_flight[connection_index] -= 1
+            backend.in_flight -= 1
+
+    def _record_success(self, backend: Backend, duration: float):
         """Record successful request."""
-        server_id = id(server)
-        if server_id not in self.server_metrics:
-            self.server_metrics[server_id] = {
-                "requests": 0,
-                "errors": 0,
-                "avg_duration": 0
-            }
-        
-        metrics = self.server_metrics[server_id]
-        metrics["requests"] += 1
-        metrics["avg_duration"] = (
-            (metrics["avg_duration"] * (metrics["requests"] - 1) + duration) /
-            metrics["requests"]
-        )
\ No newline at end of file
+        with self._lock:
+            backend.consecutive_failures = 0
+            if backend.ejections:
+                # A flapping backend keeps its back-off; only sustained health decays it
+                now = self.clock()
+                if now - backend.last_failure_at >= self.ejection_decay_seconds:
+                    backend.ejections -= 1
+                    backend.last_failure_at = now
+            metrics = backend.metrics
+            metrics["requests"] += 1
+            metrics["avg_duration"] = (
+                (metrics["avg_duration"] * (metrics["requests"] - 1) + duration) /
+                metrics["requests"]
+            )
+
+    def _record_error(self, backend: Backend, error: Exception):
+        """Record failed request; eject the backend after repeated failures."""
+        with self._lock:
+            backend.metrics["requests"] += 1
+            backend.metrics["errors"] += 1
+            backend.consecutive_failures += 1
+            backend.last_failure_at = self.clock()
+
+            if (backend.consecutive_failures >= self.max_consecutive_failures
+                    and backend.ejected_until is None):
+                # Back off longer each time the same backend keeps failing
+                duration = min(
+                    self.ejection_seconds * (2 ** backend.ejections),
+                    self.max_ejection_seconds
+                )
+                backend.ejected_until = self.clock() + duration
+                backend.ejections += 1
+                backend.consecutive_failures = 0
+
+
+def simulate_flapping(duration: float = 600.0, request_rate: float = 50.0,
+                      backends: int = 5, seed: int = 3) -> Dict:
+    """Error rate and p99 latency while one backend flaps, against plain round-robin."""
+    class VirtualClock:
+        def __init__(self):
+            self.now = 0.0
+
+        def __call__(self) -> float:
+            return self.now
+
+    def run(balanced: bool) -> Dict:
+        rng = random.Random(seed)
+        clock = VirtualClock()
+
+        class SimulatedClient:
+            def __init__(self, endpoint: str):
+                self.endpoint = endpoint
+
+            def handle_request(self, request: Dict) -> Dict:
+                flapping = self.endpoint == "backend-0"
+                # backend-0 is down for 60s out of every 120s; timeouts cost 1s
+                if flapping and int(clock.now // 60) % 2 == 1:
+                    clock.now += 1.0
+                    raise TimeoutError(self.endpoint)
+                clock.now += rng.expovariate(1 / 0.02)
+                return {"result": {}}
+
+        endpoints = [f"backend-{i}" for i in range(backends)]
+        latencies = []
+        errors = 0
+        total = int(duration * request_rate)
+
+        if balanced:
+            host = LoadBalancedMCPHost(endpoints, client_factory=SimulatedClient, clock=clock)
+            send = host.route_request
+        else:
+            clients = [SimulatedClient(endpoint) for endpoint in endpoints]
+            index = {"next": 0}
+
+            def send(request: Dict) -> Dict:
+                client = clients[index["next"]]
+                index["next"] = (index["next"] + 1) % len(clients)
+                return client.handle_request(request)
+
+        for i in range(total):
+            # Each request starts on schedule; the clock only measures its own latency
+            clock.now = i / request_rate
+            started = clock.now
+            try:
+                send({"method": "tools/call"})
+            except TimeoutError:
+                errors += 1
+            latencies.append(clock.now - started)
+
+        return {
+            "error_rate": round(errors / total, 4),
+            "p99_latency_ms": round(statistics.quantiles(latencies, n=100)[98] * 1000, 1)
+        }
+
+    return {
+        "round_robin": run(balanced=False),
+        "health_aware": run(balanced=True)
+    }
+
+
+if __name__ == "__main__":
+    print(simulate_flapping())
@@ -1,29 +1,75 @@
 # 📖 Chapter: Chapter 2: The Architecture of MCP
 # 📖 Section: 2.9 Advanced Transport Mechanisms
 
+import asyncio
+import json
+import logging
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class MCPError(Exception):
+    """JSON-RPC error returned by the peer."""
+
+    def __init__(self, error: Dict):
+        self.error = error
+        super().__init__(f"{error.get('code')}: {error.get('message')}")
+
 class WebSocketMCPTransport:
     """WebSocket-based MCP transport."""
-    
-    def __init__(self, url: str):
+
+    def __init__(self, url: str, request_timeout: float = 30.0,
+                 max_queued_sends: int = 1024, ping_interval: float = 20.0,
+                 ping_timeout: float = 10.0):
         self.url = url
         self.ws = None
         self.connected = False
-        self.message_queue: List[Dict] = []
-        self.received_messages: Dict[int, Dict] = {}
+        self.request_timeout = request_timeout
+        self.max_queued_sends = max_queued_sends
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        # Outbound frames; put() blocks when full, pushing back on callers
+        self.send_queue: Optional[asyncio.Queue] = None
+        # request id -> future resolved by the receiver task
+        self.pending: Dict[int, asyncio.Future] = {}
         self.message_handlers: Dict[str, Callable] = {}
-    
+        self.request_id_counter = 0
+        self.max_in_flight = 0
+        self._tasks: List[asyncio.Task] = []
+
     async def connect(self):
         """Connect to WebSocket server."""
         import websockets
-        
-        self.ws = await websockets.connect(self.url)
+
+        # Keepalive is handled here so a dead peer also fails pending requests
+        self.ws = await websockets.connect(self.url, ping_interval=None)
         self.connected = True
-        
-        # Start message receiver
-        asyncio.create_task(self._receive_messages())
-    
-    async def send_request(self, method: str, params: Dict = None) -> Dict:
+        self.send_queue = asyncio.Queue(maxsize=self.max_queued_sends)
+
+        self._tasks = [
+            asyncio.create_task(self._receive_messages()),
+            asyncio.create_task(self._send_messages())
+        ]
+        if self.ping_interval:
+            self._tasks.append(asyncio.create_task(self._keepalive()))
+
+    async def close(self):
+        """Close the connection and fail outstanding requests."""
+        self.connected = False
+        for task in self._tasks:
+            task.cancel()
+        if self.ws is not None:
+            await self.ws.close()
+        self._fail_pending(ConnectionError("Transport closed"))
+
+    async def send_request(self, method: str, params: Dict = None,
+                           timeout: float = None) -> Dict:
         """Send request and wait for response."""
+        if not self.connected:
+            raise ConnectionError("Transport is not connected")
+
         request_id = self._get_next_request_id()
         request = {
             "jsonrpc": "2.0",
@@ -31,20 +77,33 @@ class WebSocketMCPTransport:
             "method": method,
             "params": params or {}
         }
-        
-        await self.ws.send(json.dumps(request))
-        
-        # Wait for response
-        while request_id not in self.received_messages:
-            await asyncio.sleep(0.01)
-        
-        response = self.received_messages.pop(request_id)
-        
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.max_in_flight = max(self.max_in_flight, len(self.pending))
+
+        # One deadline covers waiting for queue space and waiting for the reply
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout if timeout is not None else self.request_timeout)
+        sent = False
+        try:
+            await asyncio.wait_for(self.send_queue.put(json.dumps(request)),
+                                   max(0.0, deadline - loop.time()))
+            sent = True
+            response = await asyncio.wait_for(future, max(0.0, deadline - loop.time()))
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if sent:
+                # Tell the server to stop working on a request nobody awaits anymore
+                self._enqueue_cancel(request_id)
+            raise
+        finally:
+            self.pending.pop(request_id, None)
+
         if "error" in response:
             raise MCPError(response["error"])
-        
+
         return response.get("result")
-    
+
     async def send_notification(self, method: str, params: Dict = None):
         """Send notification (no response expected)."""
         notification = {
@@ -52,24 +111,148 @@ class WebSocketMCPTransport:
             "method": method,
             "params": params or {}
         }
-        
-        await self.ws.send(json.dumps(notification))
-    
+
+        await self.send_queue.put(json.dumps(notification))
+
+    def _enqueue_cancel(self, request_id: int):
+        if not self.connected:
+            return
+        notification = {
+            "jsonrpc": "2.0",
+            "method": "notifications/cancelled",
+            "params": {"requestId": request_id, "reason": "Request timed out or was cancelled"}
+        }
+        try:
+            self.send_queue.put_nowait(json.dumps(notification))
+        except asyncio.QueueFull:
+            logger.debug(f"Send queue full, dropping cancel for request {request_id}")
+
+    async def _send_messages(self):
+        """Drain the outbound queue onto the socket."""
+        while self.connected:
+            message = await self.send_queue.get()
+            try:
+                await self.ws.send(message)
+            except Exception as e:
+                logger.error(f"Error sending message: {e}")
+                await self._connection_lost(e)
+                return
+
     async def _receive_messages(self):
         """Receive and handle messages."""
+        import websockets
+
         while self.connected:
             try:
                 message_text = await self.ws.recv()
                 message = json.loads(message_text)
-                
-                if "id" in message:
+
+                if "id" in message and "method" not in message:
                     # Response to request
-                    self.received_messages[message["id"]] = message
+                    future = self.pending.get(message["id"])
+                    if future is not None and not future.done():
+                        future.set_result(message)
+                    # Late responses (timed out / cancelled) are dropped, not stored
                 elif "method" in message:
                     # Notification
                     await self._handle_notification(message)
-            except websockets.exceptions.ConnectionClosed:
-                self.connected = False
+            except websockets.exceptions.ConnectionClosed as e:
+                await self._connection_lost(e)
                 break
             except Exception as e:
-                logger.error(f"Error receiving message: {e}")
\ No newline at end of file
+                logger.error(f"Error receiving message: {e}")
+
+    async def _handle_notification(self, message: Dict):
+        handler = self.message_handlers.get(message["method"])
+        if handler is None:
+            return
+        result = handler(message.get("params", {}))
+        if asyncio.iscoroutine(result):
+            await result
+
+    async def _keepalive(self):
+        """Ping the server; a missed pong tears the connection down."""
+        while self.connected:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                pong_waiter = await self.ws.ping()
+                await asyncio.wait_for(pong_waiter, self.ping_timeout)
+            except Exception as e:
+                logger.warning(f"Keepalive failed for {self.url}: {e}")
+                await self._connection_lost(e)
+                return
+
+    async def _connection_lost(self, error: Exception):
+        if not self.connected:
+            return
+        self.connected = False
+        self._fail_pending(ConnectionError(f"Connection lost: {error}"))
+        for task in self._tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        await self.ws.close()
+
+    def _fail_pending(self, error: Exception):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _get_next_request_id(self) -> int:
+        self.request_id_counter += 1
+        return self.request_id_counter
+
+
+async def benchmark_rtt(requests: int = 5000, concurrency: int = 256,
+                        port: int = 8765) -> Dict:
+    """RTT distribution and peak in-flight requests against a local server."""
+    import websockets
+
+    async def echo_server(ws):
+        async for message_text in ws:
+            message = json.loads(message_text)
+            if "id" in message:
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": message["id"], "result": {}}))
+
+    async with websockets.serve(echo_server, "127.0.0.1", port):
+        transport = WebSocketMCPTransport(f"ws://127.0.0.1:{port}")
+        await transport.connect()
+
+        async def timed_request() -> float:
+            start = time.perf_counter()
+            await transport.send_request("ping")
+            return (time.perf_counter() - start) * 1000
+
+        # Sequential: pure round trip, no queueing
+        sequential = [await timed_request() for _ in range(requests // 10)]
+
+        # Concurrent: many outstanding requests on one socket
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded() -> float:
+            async with semaphore:
+                return await timed_request()
+
+        start = time.perf_counter()
+        concurrent = await asyncio.gather(*(bounded() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+        await transport.close()
+
+    def summary(samples: List[float]) -> Dict:
+        quantiles = statistics.quantiles(samples, n=100)
+        return {
+            "p50_ms": round(quantiles[49], 3),
+            "p99_ms": round(quantiles[98], 3),
+            "max_ms": round(max(samples), 3)
+        }
+
+    return {
+        "sequential_rtt": summary(sequential),
+        "concurrent_rtt": summary(concurrent),
+        "concurrent_requests_per_s": round(requests / elapsed),
+        "max_in_flight": transport.max_in_flight
+    }
+
+
+if __name__ == "__main__":
+    print(asyncio.run(benchmark_rtt()))
@@ -1,34 +1,242 @@
 # 📖 Chapter: Chapter 2: The Architecture of MCP
 # 📖 Section: 2.9 Advanced Transport Mechanisms
 
+import base64
+import json
+import os
+import struct
+import time
+from typing import Callable, Dict, List, Optional
+
+# Frames are a 4-byte big-endian payload length followed by the payload
+FRAME_HEADER = struct.Struct(">I")
+
+class JSONCodec:
+    """Baseline codec every peer supports; bytes are sent as base64."""
+
+    name = "json"
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    def encode(self, message: Dict) -> bytes:
+        return json.dumps(message, separators=(",", ":"), default=self._default).encode("utf-8")
+
+    def decode(self, data: bytes) -> Dict:
+        return json.loads(data)
+
+    @staticmethod
+    def _default(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return base64.b64encode(value).decode("ascii")
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class MessagePackCodec:
+    """MessagePack codec; bytes travel as native bin values."""
+
+    name = "msgpack"
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def __init__(self):
+        import msgpack
+        self._packer = msgpack.Packer(use_bin_type=True)
+        self._unpackb = msgpack.unpackb
+
+    def encode(self, message: Dict) -> bytes:
+        return self._packer.pack(message)
+
+    def decode(self, data: bytes) -> Dict:
+        return self._unpackb(data, raw=False)
+
+class CBORCodec:
+    """CBOR codec; bytes travel as native byte strings."""
+
+    name = "cbor"
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import cbor2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def __init__(self):
+        import cbor2
+        self._dumps = cbor2.dumps
+        self._loads = cbor2.loads
+
+    def encode(self, message: Dict) -> bytes:
+        return self._dumps(message)
+
+    def decode(self, data: bytes) -> Dict:
+        return self._loads(data)
+
+# Preference order used when offering and selecting codecs
+CODECS = {codec.name: codec for codec in (MessagePackCodec, CBORCodec, JSONCodec)}
+
 class CustomMCPTransport:
     """Custom transport implementation."""
-    
-    def __init__(self, connection_factory: Callable):
+
+    def __init__(self, connection_factory: Callable, preferred_codecs: List[str] = None,
+                 max_frame_size: int = 64 * 1024 * 1024):
         self.connection_factory = connection_factory
         self.connection = None
         self.request_id_counter = 0
-    
+        self.preferred_codecs = preferred_codecs or list(CODECS)
+        self.max_frame_size = max_frame_size
+        # initialize itself always goes over JSON; the codec switches afterwards
+        self.codec = JSONCodec()
+        self._buffer = bytearray()
+
     def connect(self):
         """Establish connection using custom method."""
         self.connection = self.connection_factory()
-    
+
+    def supported_codecs(self) -> List[str]:
+        """Codecs this peer can use, most preferred first."""
+        return [
+            name for name in self.preferred_codecs
+            if name in CODECS and CODECS[name].available()
+        ]
+
+    def offer_codecs(self, capabilities: Dict) -> Dict:
+        """Client side: advertise codecs in initialize capabilities."""
+        experimental = capabilities.setdefault("experimental", {})
+        experimental["framing"] = {"codecs": self.supported_codecs()}
+        return capabilities
+
+    def select_codec(self, client_capabilities: Dict, server_capabilities: Dict) -> Dict:
+        """Server side: pick the first mutually supported codec and announce it."""
+        offered = client_capabilities.get("experimental", {}).get("framing", {}).get("codecs", [])
+        chosen = next((name for name in self.supported_codecs() if name in offered), "json")
+
+        experimental = server_capabilities.setdefault("experimental", {})
+        experimental["framing"] = {"codec": chosen}
+        return server_capabilities
+
+    def apply_negotiated_codec(self, server_capabilities: Dict):
+        """Switch codecs once the initialize exchange has completed."""
+        name = server_capabilities.get("experimental", {}).get("framing", {}).get("codec", "json")
+        self.codec = CODECS[name]() if name in CODECS and CODECS[name].available() else JSONCodec()
+
     def send_message(self, message: Dict) -> bytes:
         """Serialize message for transport."""
-        # Custom serialization (e.g., MessagePack, Protocol Buffers)
         return self._serialize(message)
-    
+
     def receive_message(self, data: bytes) -> Dict:
         """Deserialize message from transport."""
-        # Custom deserialization
         return self._deserialize(data)
-    
+
+    def feed(self, data: bytes) -> List[Dict]:
+        """Buffer stream bytes and return every complete message received."""
+        self._buffer += data
+        messages = []
+
+        while len(self._buffer) >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(self._buffer)
+            if length > self.max_frame_size:
+                raise ValueError(f"Frame of {length} bytes exceeds limit of {self.max_frame_size}")
+
+            end = FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+
+            messages.append(self.codec.decode(bytes(self._buffer[FRAME_HEADER.size:end])))
+            del self._buffer[:end]
+
+        return messages
+
     def _serialize(self, message: Dict) -> bytes:
-        """Serialize to custom format."""
-        # Implementation depends on protocol choice
-        return json.dumps(message).encode('utf-8')
-    
+        """Serialize to a length-prefixed frame in the negotiated codec."""
+        payload = self.codec.encode(message)
+        if len(payload) > self.max_frame_size:
+            raise ValueError(f"Message of {len(payload)} bytes exceeds frame limit")
+        return FRAME_HEADER.pack(len(payload)) + payload
+
     def _deserialize(self, data: bytes) -> Dict:
-        """Deserialize from custom format."""
-        # Implementation depends on protocol choice
-        return json.loads(data.decode('utf-8'))
\ No newline at end of file
+        """Deserialize one complete frame."""
+        (length,) = FRAME_HEADER.unpack_from(data)
+        payload = memoryview(data)[FRAME_HEADER.size:FRAME_HEADER.size + length]
+        if len(payload) != length:
+            raise ValueError("Incomplete frame")
+        return self.codec.decode(bytes(payload))
+
+
+def sample_payloads() -> Dict[str, Dict]:
+    """Representative MCP messages: catalog listing, structured tool result, blob read."""
+    tools = [
+        {
+            "name": f"query_table_{i}",
+            "description": "Run a parameterised query against a reporting table",
+            "inputSchema": {
+                "type": "object",
+                "properties": {"filters": {"type": "object"}, "limit": {"type": "integer"}},
+                "required": ["filters"]
+            }
+        }
+        for i in range(200)
+    ]
+    rows = [
+        {"id": i, "customer": f"customer-{i % 97}", "amount": i * 1.25,
+         "status": "shipped" if i % 3 else "pending", "tags": ["priority", "eu"]}
+        for i in range(5000)
+    ]
+
+    return {
+        "tools/list": {"jsonrpc": "2.0", "id": 1, "result": {"tools": tools}},
+        "tools/call": {"jsonrpc": "2.0", "id": 2, "result": {
+            "content": [{"type": "text", "text": "5000 rows"}],
+            "structuredContent": {"rows": rows}
+        }},
+        # Binary codecs carry the blob as raw bytes; JSON falls back to base64
+        "resources/read": {"jsonrpc": "2.0", "id": 3, "result": {"contents": [{
+            "uri": "file:///data/report.pdf",
+            "mimeType": "application/pdf",
+            "blob": os.urandom(1024 * 1024)
+        }]}}
+    }
+
+
+def benchmark_codecs(iterations: int = 20) -> Dict[str, Dict]:
+    """Encoded size and encode/decode time per codec for each sample payload."""
+    report = {}
+    for name, message in sample_payloads().items():
+        report[name] = {}
+        for codec_name, codec_class in CODECS.items():
+            if not codec_class.available():
+                report[name][codec_name] = "unavailable"
+                continue
+
+            transport = CustomMCPTransport(lambda: None)
+            transport.codec = codec_class()
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                frame = transport.send_message(message)
+            encode_ms = (time.perf_counter() - start) / iterations * 1000
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                transport.receive_message(frame)
+            decode_ms = (time.perf_counter() - start) / iterations * 1000
+
+            report[name][codec_name] = {
+                "bytes": len(frame),
+                "encode_ms": round(encode_ms, 3),
+                "decode_ms": round(decode_ms, 3)
+            }
+
+    return report
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_codecs(), indent=2))
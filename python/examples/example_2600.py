@@ -1,34 +1,58 @@
 # 📖 Chapter: Chapter 2: The Architecture of MCP
 # 📖 Section: 2.10 Protocol Extension Mechanisms
 
+import base64
+import fcntl
+import itertools
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+from example_2560 import CODECS, CustomMCPTransport
+
 class ExtendedMCPServer:
     """MCP server with custom protocol extensions."""
-    
-    def __init__(self):
+
+    def __init__(self, send: Callable[[Dict], None] = None, transport: 'CustomMCPTransport' = None):
         self.extensions: Dict[str, Extension] = {}
         self.custom_methods: Dict[str, Callable] = {}
-    
+        # Writes one outgoing message (response or notification) to the client
+        self.send = send
+        # Framing transport whose negotiated codec decides how bytes travel
+        self.transport = transport
+        self._deferred: deque = deque()
+
+    @property
+    def binary_transport(self) -> bool:
+        """True when the negotiated codec carries bytes natively (not JSON)."""
+        return self.transport is not None and self.transport.codec.name != "json"
+
     def register_extension(self, extension_name: str, extension: 'Extension'):
         """Register protocol extension."""
         self.extensions[extension_name] = extension
         self.custom_methods.update(extension.get_methods())
-    
+        extension.attach(self)
+
     def initialize(self, request: Dict) -> Dict:
         """Initialize with extension capabilities."""
         client_capabilities = request.get("capabilities", {})
-        
+
         # Standard capabilities
         server_capabilities = {
             "tools": {},
             "resources": {},
             "prompts": {}
         }
-        
+
         # Add extension capabilities
         for ext_name, ext in self.extensions.items():
             if ext.is_supported_by_client(client_capabilities):
                 server_capabilities[ext_name] = ext.get_capabilities()
-        
+
         return {
             "protocolVersion": "2024-11-05",
             "capabilities": server_capabilities,
@@ -37,7 +61,7 @@ class ExtendedMCPServer:
                 "version": "1.0.0"
             }
         }
-    
+
     def handle_custom_method(self, method: str, params: Dict) -> Any:
         """Handle custom extension methods."""
         if method in self.custom_methods:
@@ -46,56 +70,306 @@ class ExtendedMCPServer:
         else:
             raise ValueError(f"Unknown method: {method}")
 
+    def handle_message(self, message: Dict):
+        """Dispatch one incoming JSON-RPC message and send the response.
+
+        Work an extension defers (such as the first chunks of a stream) runs
+        after the response has been sent.
+        """
+        method = message.get("method")
+        params = message.get("params", {})
+
+        if "id" not in message:
+            # Notification: no response
+            self.handle_custom_method(method, params)
+        else:
+            try:
+                response = {"jsonrpc": "2.0", "id": message["id"],
+                            "result": self.handle_custom_method(method, params)}
+            except Exception as e:
+                response = {"jsonrpc": "2.0", "id": message["id"],
+                            "error": {"code": -32603, "message": str(e)}}
+            self.send(response)
+
+        while self._deferred:
+            self._deferred.popleft()()
+
+    def defer(self, callback: Callable[[], None]):
+        """Run callback once the current message has been answered."""
+        self._deferred.append(callback)
+
+    def send_notification(self, method: str, params: Dict):
+        self.send({"jsonrpc": "2.0", "method": method, "params": params})
+
 class Extension:
     """Base class for protocol extensions."""
-    
+
+    server: Optional[ExtendedMCPServer] = None
+
+    def attach(self, server: ExtendedMCPServer):
+        """Called by register_extension with the owning server."""
+        self.server = server
+
     def get_capabilities(self) -> Dict:
         """Return extension capabilities."""
         raise NotImplementedError
-    
+
     def is_supported_by_client(self, client_capabilities: Dict) -> bool:
         """Check if client supports this extension."""
         raise NotImplementedError
-    
+
     def get_methods(self) -> Dict[str, Callable]:
         """Return extension methods."""
         raise NotImplementedError
 
+class ResourceStream:
+    """One open resources/stream: file position, sequence number and credit."""
+
+    def __init__(self, stream_id: str, file: BinaryIO, size: int, offset: int,
+                 chunk_size: int, encoding: str, credits: int):
+        self.stream_id = stream_id
+        self.file = file
+        self.size = size
+        self.offset = offset
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.credits = credits
+        self.seq = 0
+        self.lock = threading.Lock()
+
 # Example: Streaming Extension
 class StreamingExtension(Extension):
-    """Extension for streaming large data."""
-    
+    """Extension for streaming large data.
+
+    resources/stream answers with a stream id, then sends the resource as
+    notifications/resources/chunk messages. Each chunk spends one credit;
+    the client grants more with resources/stream/credit, so a slow client
+    holds at most window * chunkSize bytes in flight. A stream can be
+    restarted from any byte offset.
+    """
+
+    ENCODINGS = ("raw", "base64")
+
+    def __init__(self, chunk_size: int = 256 * 1024, max_chunk_size: int = 4 * 1024 * 1024,
+                 initial_window: int = 16, max_window: int = 256):
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.initial_window = initial_window
+        self.max_window = max_window
+        self.streams: Dict[str, ResourceStream] = {}
+        self._stream_ids = itertools.count(1)
+
     def get_capabilities(self) -> Dict:
         return {
             "streaming": {
                 "enabled": True,
-                "chunkSize": 1024
+                "chunkSize": self.chunk_size,
+                "maxChunkSize": self.max_chunk_size,
+                "encodings": list(self.ENCODINGS),
+                "flowControl": {"type": "credit", "initialWindow": self.initial_window}
             }
         }
-    
+
     def is_supported_by_client(self, client_capabilities: Dict) -> bool:
         return "streaming" in client_capabilities
-    
+
     def get_methods(self) -> Dict[str, Callable]:
         return {
-            "resources/stream": self.stream_resource
+            "resources/stream": self.stream_resource,
+            "resources/stream/credit": self.grant_credit,
+            "resources/stream/cancel": self.cancel_stream
         }
-    
-    def stream_resource(self, params: Dict) -> Iterator[Dict]:
-        """Stream resource in chunks."""
+
+    def stream_resource(self, params: Dict) -> Dict:
+        """Open a stream; chunks follow as notifications once this is answered."""
         uri = params["uri"]
-        chunk_size = params.get("chunkSize", 1024)
-        
-        # Stream resource data
-        with open(uri.replace("file://", ""), 'rb') as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                
-                yield {
-                    "chunk": chunk.hex(),  # Or base64, etc.
-                    "complete": False
-                }
-            
-            yield {"complete": True}
\ No newline at end of file
+        chunk_size = min(int(params.get("chunkSize", self.chunk_size)), self.max_chunk_size)
+        window = min(int(params.get("window", self.initial_window)), self.max_window)
+        offset = int(params.get("offset", 0))
+        if chunk_size <= 0 or window <= 0:
+            raise ValueError("chunkSize and window must be positive")
+
+        # Raw bytes only when the codec can carry them; JSON gets base64
+        encoding = params.get("encoding", "raw")
+        if encoding not in self.ENCODINGS:
+            raise ValueError(f"Unknown encoding: {encoding}")
+        if encoding == "raw" and not self.server.binary_transport:
+            encoding = "base64"
+
+        f = open(uri.replace("file://", ""), 'rb')
+        size = os.fstat(f.fileno()).st_size
+        if not 0 <= offset <= size:
+            f.close()
+            raise ValueError(f"Offset {offset} outside resource of {size} bytes")
+        f.seek(offset)
+
+        stream_id = f"stream-{next(self._stream_ids)}"
+        stream = ResourceStream(stream_id, f, size, offset, chunk_size, encoding, window)
+        self.streams[stream_id] = stream
+        self.server.defer(lambda: self._pump(stream))
+
+        return {
+            "streamId": stream_id,
+            "size": size,
+            "offset": offset,
+            "chunkSize": chunk_size,
+            "encoding": encoding,
+            "window": window
+        }
+
+    def grant_credit(self, params: Dict) -> Dict:
+        """Client acknowledges chunks and allows this many more."""
+        stream = self.streams.get(params["streamId"])
+        if stream is None:
+            return {"active": False}
+        with stream.lock:
+            stream.credits = min(stream.credits + int(params.get("credits", 1)), self.max_window)
+        self._pump(stream)
+        return {"active": params["streamId"] in self.streams}
+
+    def cancel_stream(self, params: Dict) -> Dict:
+        stream = self.streams.pop(params["streamId"], None)
+        if stream is not None:
+            with stream.lock:
+                stream.file.close()
+        return {"cancelled": stream is not None}
+
+    def _pump(self, stream: ResourceStream):
+        """Send chunks while the stream has credit."""
+        with stream.lock:
+            while stream.credits > 0 and not stream.file.closed:
+                chunk = stream.file.read(stream.chunk_size)
+                chunk_offset = stream.offset
+                stream.offset += len(chunk)
+                final = stream.offset >= stream.size
+
+                try:
+                    self.server.send_notification("notifications/resources/chunk", {
+                        "streamId": stream.stream_id,
+                        "seq": stream.seq,
+                        "offset": chunk_offset,
+                        "data": chunk if stream.encoding == "raw" else base64.b64encode(chunk).decode("ascii"),
+                        "final": final
+                    })
+                except Exception:
+                    # The client is gone or the write failed: don't leak the open file
+                    stream.file.close()
+                    self.streams.pop(stream.stream_id, None)
+                    raise
+                stream.seq += 1
+                stream.credits -= 1
+
+                if final:
+                    stream.file.close()
+                    self.streams.pop(stream.stream_id, None)
+
+
+def benchmark_pipe_stream(size_mb: int = 1024, chunk_size: int = 256 * 1024,
+                          window: int = 16, codec: str = "json") -> Dict:
+    """Stream a file over a local pipe: throughput and peak RSS growth."""
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "blob.bin")
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+    to_client_r, to_client_w = os.pipe()
+    to_server_r, to_server_w = os.pipe()
+    if hasattr(fcntl, "F_SETPIPE_SZ"):
+        # Linux: room for a whole chunk per write instead of the 64KB default
+        fcntl.fcntl(to_client_w, fcntl.F_SETPIPE_SZ, 1024 * 1024)
+
+    def framed(name: str) -> 'CustomMCPTransport':
+        transport = CustomMCPTransport(connection_factory=lambda: None)
+        transport.codec = CODECS[name]()
+        return transport
+
+    server_transport = framed(codec)
+    server = ExtendedMCPServer(
+        send=lambda message: _write_all(to_client_w, server_transport.send_message(message)),
+        transport=server_transport
+    )
+    server.register_extension("streaming", StreamingExtension(chunk_size=chunk_size))
+
+    def serve():
+        while True:
+            data = os.read(to_server_r, 65536)
+            if not data:
+                break
+            for message in server_transport.feed(data):
+                server.handle_message(message)
+
+    server_thread = threading.Thread(target=serve, daemon=True)
+    rss_before_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    client = framed(codec)
+    start = time.perf_counter()
+    _write_all(to_server_w, client.send_message({
+        "jsonrpc": "2.0", "id": 1, "method": "resources/stream",
+        "params": {"uri": f"file://{path}", "chunkSize": chunk_size, "window": window}
+    }))
+    server_thread.start()
+
+    received = 0
+    wire_bytes = 0
+    unacked = 0
+    done = False
+    while not done:
+        data = os.read(to_client_r, 4 * 1024 * 1024)
+        wire_bytes += len(data)
+        for message in client.feed(data):
+            if message.get("method") != "notifications/resources/chunk":
+                continue
+            params = message["params"]
+            chunk = params["data"]
+            received += len(chunk if isinstance(chunk, bytes) else base64.b64decode(chunk))
+            unacked += 1
+            done = params["final"]
+            # Return credit in batches of half a window
+            if unacked >= window // 2 and not done:
+                _write_all(to_server_w, client.send_message({
+                    "jsonrpc": "2.0", "method": "resources/stream/credit",
+                    "params": {"streamId": params["streamId"], "credits": unacked}
+                }))
+                unacked = 0
+    elapsed = time.perf_counter() - start
+    rss_after_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Previous behaviour: 1KB reads, hex-encoded (not even sent anywhere)
+    legacy_sample = min(size_mb, 64) * 1024 * 1024
+    legacy_start = time.perf_counter()
+    with open(path, "rb") as f:
+        while f.tell() < legacy_sample:
+            f.read(1024).hex()
+    legacy_mb_s = legacy_sample / 2 ** 20 / (time.perf_counter() - legacy_start)
+
+    os.close(to_server_w)
+    server_thread.join()
+    for fd in (to_client_r, to_client_w, to_server_r):
+        os.close(fd)
+    os.remove(path)
+    os.rmdir(tmpdir)
+
+    return {
+        "size_mb": size_mb,
+        "codec": codec,
+        "chunk_kb": chunk_size // 1024,
+        "window": window,
+        "received_mb": round(received / 2 ** 20),
+        "throughput_mb_s": round(received / 2 ** 20 / elapsed, 1),
+        "wire_overhead": round(wire_bytes / received, 3),
+        "legacy_hex_encode_mb_s": round(legacy_mb_s, 1),
+        "legacy_hex_overhead": 2.0,
+        "peak_rss_growth_mb": round((rss_after_kb - rss_before_kb) / 1024, 1)
+    }
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+if __name__ == "__main__":
+    print(benchmark_pipe_stream())
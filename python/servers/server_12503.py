@@ -1,93 +1,101 @@
 # 📖 Chapter: Chapter 9: Advanced MCP Patterns
 # 📖 Section: 9.1 Multi-Server Architectures
 
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Set
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Catalog kind -> (list method, key field, list_changed notification)
+CATALOG_KINDS = {
+    'tools': ('list_tools', 'name', 'notifications/tools/list_changed'),
+    'resources': ('list_resources', 'uri', 'notifications/resources/list_changed'),
+    'prompts': ('list_prompts', 'name', 'notifications/prompts/list_changed'),
+}
 
 class MultiServerMCPClient:
     """Client that aggregates multiple MCP servers."""
-    
-    def __init__(self, server_configs: List[Dict]):
-        self.servers: Dict[str, 'MCPClient'] = {}
-        self.executor = ThreadPoolExecutor(max_workers=10)
-        
-        # Initialize connections to all servers
-        for config in server_configs:
-            server_id = config['id']
-            endpoint = config['endpoint']
-            transport = config.get('transport', 'stdio')
-            
-            client = MCPClient(endpoint, transport=transport)
-            client.connect()
-            self.servers[server_id] = client
-    
-    def list_all_resources(self) -> Dict[str, List[Dict]]:
+
+    def __init__(self, server_configs: List[Dict] = None,
+                 clients: Dict[str, 'MCPClient'] = None,
+                 deadline: float = 5.0):
+        self.servers: Dict[str, 'MCPClient'] = dict(clients or {})
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=max(10, len(server_configs or []) + len(self.servers)))
+
+        # kind -> key -> {server_id: item}; lookups are a single dict access
+        self._index: Dict[str, Dict[str, Dict[str, Dict]]] = {kind: {} for kind in CATALOG_KINDS}
+        # kind -> server_id -> keys contributed, so one server can be replaced in place
+        self._owned: Dict[str, Dict[str, Set[str]]] = {kind: {} for kind in CATALOG_KINDS}
+        # kind -> server_ids whose cached catalog must be re-fetched
+        self._stale: Dict[str, Set[str]] = {kind: set() for kind in CATALOG_KINDS}
+        self._index_lock = threading.Lock()
+
+        # Initialize connections to all servers concurrently
+        pending = {}
+        for config in server_configs or []:
+            client = MCPClient(config['endpoint'], transport=config.get('transport', 'stdio'))
+            pending[config['id']] = client
+        self._fan_out(lambda client: client.connect(), pending, deadline=None)
+        self.servers.update(pending)
+        self._server_rank: Dict[str, int] = {sid: i for i, sid in enumerate(self.servers)}
+
+        for kind in CATALOG_KINDS:
+            self._stale[kind].update(self.servers)
+
+    def list_all_resources(self, deadline: float = None) -> Dict[str, List[Dict]]:
         """List resources from all servers."""
-        all_resources = {}
-        
-        for server_id, client in self.servers.items():
-            try:
-                resources = client.list_resources()
-                all_resources[server_id] = resources
-            except Exception as e:
-                print(f"Error listing resources from {server_id}: {e}")
-        
-        return all_resources
-    
-    def list_all_tools(self) -> Dict[str, List[Dict]]:
+        return self._list_all('resources', deadline)
+
+    def list_all_tools(self, deadline: float = None) -> Dict[str, List[Dict]]:
         """List tools from all servers."""
-        all_tools = {}
-        
-        for server_id, client in self.servers.items():
-            try:
-                tools = client.list_tools()
-                all_tools[server_id] = tools
-            except Exception as e:
-                print(f"Error listing tools from {server_id}: {e}")
-        
-        return all_tools
-    
+        return self._list_all('tools', deadline)
+
+    def list_all_prompts(self, deadline: float = None) -> Dict[str, List[Dict]]:
+        """List prompts from all servers."""
+        return self._list_all('prompts', deadline)
+
     def find_resource(self, uri: str) -> Optional[Dict]:
         """Find resource across all servers."""
-        for server_id, client in self.servers.items():
-            try:
-                resources = client.list_resources()
-                matching = [r for r in resources if r.get('uri') == uri]
-                if matching:
-                    return {
-                        'server_id': server_id,
-                        'resource': matching[0]
-                    }
-            except Exception:
-                continue
-        
-        return None
-    
+        return self._lookup('resources', uri, 'resource')
+
     def find_tool(self, tool_name: str) -> Optional[Dict]:
         """Find tool across all servers."""
-        for server_id, client in self.servers.items():
-            try:
-                tools = client.list_tools()
-                matching = [t for t in tools if t.get('name') == tool_name]
-                if matching:
-                    return {
-                        'server_id': server_id,
-                        'tool': matching[0]
-                    }
-            except Exception:
-                continue
-        
-        return None
-    
-    async def call_tool_async(self, server_id: str, tool_name: str, 
+        return self._lookup('tools', tool_name, 'tool')
+
+    def find_prompt(self, prompt_name: str) -> Optional[Dict]:
+        """Find prompt across all servers."""
+        return self._lookup('prompts', prompt_name, 'prompt')
+
+    def servers_with_tool(self, tool_name: str) -> List[str]:
+        """All servers exposing a tool name."""
+        self._refresh_stale('tools')
+        return list(self._index['tools'].get(tool_name, {}))
+
+    def handle_notification(self, server_id: str, notification: Dict):
+        """Invalidate cached catalogs on list_changed notifications."""
+        method = notification.get('method')
+        for kind, (_, _, changed_method) in CATALOG_KINDS.items():
+            if method == changed_method:
+                self.invalidate(server_id, kind)
+
+    def invalidate(self, server_id: str = None, kind: str = None):
+        """Mark cached catalogs stale; they are re-fetched on next lookup."""
+        server_ids = [server_id] if server_id else list(self.servers)
+        kinds = [kind] if kind else list(CATALOG_KINDS)
+        with self._index_lock:
+            for k in kinds:
+                self._stale[k].update(server_ids)
+
+    async def call_tool_async(self, server_id: str, tool_name: str,
                              arguments: Dict) -> Dict:
         """Call tool asynchronously."""
         if server_id not in self.servers:
             raise ValueError(f"Server {server_id} not found")
-        
+
         client = self.servers[server_id]
-        
+
         # Run in thread pool for async compatibility
         loop = asyncio.get_event_loop()
         result = await loop.run_in_executor(
@@ -96,31 +104,207 @@ class MultiServerMCPClient:
             tool_name,
             arguments
         )
-        
+
         return result
-    
-    def aggregate_search(self, query: str, servers: List[str] = None) -> List[Dict]:
+
+    def aggregate_search(self, query: str, servers: List[str] = None,
+                         deadline: float = None) -> List[Dict]:
         """Search across multiple servers and aggregate results."""
-        if servers is None:
-            servers = list(self.servers.keys())
-        
-        all_results = []
-        
-        for server_id in servers:
-            if server_id not in self.servers:
+        search_servers = set(self.servers_with_tool('search'))
+        if servers is not None:
+            search_servers &= set(servers)
+
+        targets = {sid: self.servers[sid] for sid in self.servers if sid in search_servers}
+        results = self._fan_out(
+            lambda client: client.call_tool('search', {'query': query}),
+            targets,
+            self.deadline if deadline is None else deadline
+        )
+
+        return [
+            {'server_id': server_id, 'results': result}
+            for server_id, result in results.items()
+        ]
+
+    def _lookup(self, kind: str, key: str, item_field: str) -> Optional[Dict]:
+        self._refresh_stale(kind)
+        owners = self._index[kind].get(key)
+        if not owners:
+            return None
+
+        # Duplicate names go to the first registered server, as a linear scan would
+        server_id = min(owners, key=self._rank)
+        return {'server_id': server_id, item_field: owners[server_id]}
+
+    def _rank(self, server_id: str) -> int:
+        """Registration position of a server (servers added later rank after)."""
+        rank = self._server_rank.get(server_id)
+        if rank is None:
+            self._server_rank = {sid: i for i, sid in enumerate(self.servers)}
+            rank = self._server_rank.get(server_id, len(self._server_rank))
+        return rank
+
+    def _list_all(self, kind: str, deadline: float = None) -> Dict[str, List[Dict]]:
+        list_method = CATALOG_KINDS[kind][0]
+        results = self._fan_out(
+            lambda client: getattr(client, list_method)(),
+            self.servers,
+            self.deadline if deadline is None else deadline
+        )
+
+        # A full listing is also a fresh catalog: reuse it for the index
+        for server_id, items in results.items():
+            self._store_catalog(server_id, kind, items)
+        with self._index_lock:
+            self._stale[kind].difference_update(results)
+
+        return results
+
+    def _refresh_stale(self, kind: str):
+        """Re-fetch only the catalogs invalidated since the last lookup."""
+        if not self._stale[kind]:
+            return
+
+        with self._index_lock:
+            stale = self._stale[kind]
+            self._stale[kind] = set()
+
+        list_method = CATALOG_KINDS[kind][0]
+        targets = {
+            server_id: self.servers[server_id]
+            for server_id in stale
+            if hasattr(self.servers.get(server_id), list_method)
+        }
+
+        results = self._fan_out(
+            lambda client: getattr(client, list_method)(),
+            targets,
+            self.deadline
+        )
+        for server_id, items in results.items():
+            self._store_catalog(server_id, kind, items)
+
+        # Servers that missed the deadline or failed stay stale and are retried
+        with self._index_lock:
+            self._stale[kind].update(sid for sid in targets if sid not in results)
+
+    def _store_catalog(self, server_id: str, kind: str, items: List[Dict]):
+        key_field = CATALOG_KINDS[kind][1]
+        index = self._index[kind]
+
+        with self._index_lock:
+            for key in self._owned[kind].get(server_id, ()):
+                owners = index.get(key)
+                if owners is not None:
+                    owners.pop(server_id, None)
+                    if not owners:
+                        del index[key]
+
+            keys = set()
+            for item in items or []:
+                key = item.get(key_field)
+                if key is None:
+                    continue
+                index.setdefault(key, {})[server_id] = item
+                keys.add(key)
+            self._owned[kind][server_id] = keys
+
+    def _fan_out(self, call: Callable, targets: Dict, deadline: Optional[float]) -> Dict:
+        """Run call(target) for every target concurrently, bounded by a deadline."""
+        futures = {
+            self.executor.submit(call, target): target_id
+            for target_id, target in targets.items()
+        }
+        done, not_done = wait(futures, timeout=deadline)
+
+        # Walk futures in submission (server) order, not completion order
+        results = {}
+        for future, target_id in futures.items():
+            if future not in done:
                 continue
-            
-            # Check if server has search tool
-            tool_info = self.find_tool('search')
-            if tool_info and tool_info['server_id'] == server_id:
-                try:
-                    client = self.servers[server_id]
-                    result = client.call_tool('search', {'query': query})
-                    all_results.append({
-                        'server_id': server_id,
-                        'results': result
-                    })
-                except Exception as e:
-                    print(f"Error searching {server_id}: {e}")
-        
-        return all_results
\ No newline at end of file
+            try:
+                results[target_id] = future.result()
+            except Exception as e:
+                print(f"Error from {target_id}: {e}")
+
+        for future in not_done:
+            future.cancel()
+            print(f"Deadline exceeded for {futures[future]}")
+
+        return results
+
+
+class StandInMCPClient:
+    """Local stand-in server with a fixed per-request latency."""
+
+    def __init__(self, server_id: str, num_tools: int = 50, latency: float = 0.005):
+        self.latency = latency
+        self.tools = [{'name': f'{server_id}_tool_{i}'} for i in range(num_tools)]
+        self.resources = [{'uri': f'{server_id}://doc/{i}'} for i in range(num_tools)]
+        self.prompts = [{'name': f'{server_id}_prompt'}]
+        if server_id.endswith('0'):
+            self.tools.append({'name': 'search'})
+
+    def list_tools(self) -> List[Dict]:
+        time.sleep(self.latency)
+        return list(self.tools)
+
+    def list_resources(self) -> List[Dict]:
+        time.sleep(self.latency)
+        return list(self.resources)
+
+    def list_prompts(self) -> List[Dict]:
+        time.sleep(self.latency)
+        return list(self.prompts)
+
+    def call_tool(self, name: str, arguments: Dict) -> Dict:
+        time.sleep(self.latency)
+        return {'content': [{'type': 'text', 'text': f'{name}: {arguments}'}]}
+
+
+def benchmark_lookups(num_servers: int = 20, lookups: int = 200, latency: float = 0.005) -> Dict:
+    """Compare sequential per-lookup scans against the fan-out index."""
+    clients = {f'server-{i}': StandInMCPClient(f'server-{i}', latency=latency)
+               for i in range(num_servers)}
+    names = [f'server-{i % num_servers}_tool_{i % 50}' for i in range(lookups)]
+
+    # Previous behaviour: list_tools() on every server, in order, per lookup
+    def sequential_find_tool(tool_name: str) -> Optional[Dict]:
+        for server_id, client in clients.items():
+            matching = [t for t in client.list_tools() if t.get('name') == tool_name]
+            if matching:
+                return {'server_id': server_id, 'tool': matching[0]}
+        return None
+
+    sample = names[:max(1, lookups // 20)]
+    start = time.perf_counter()
+    for name in sample:
+        sequential_find_tool(name)
+    sequential_per_lookup = (time.perf_counter() - start) / len(sample)
+
+    client = MultiServerMCPClient(clients=clients, deadline=1.0)
+    start = time.perf_counter()
+    client.list_all_tools()
+    fan_out_listing = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in names:
+        client.find_tool(name)
+    indexed_per_lookup = (time.perf_counter() - start) / lookups
+
+    start = time.perf_counter()
+    client.handle_notification('server-3', {'method': 'notifications/tools/list_changed'})
+    client.find_tool('server-3_tool_1')
+    refresh_after_change = time.perf_counter() - start
+
+    return {
+        'servers': num_servers,
+        'sequential_lookup_ms': round(sequential_per_lookup * 1000, 3),
+        'fan_out_list_all_ms': round(fan_out_listing * 1000, 3),
+        'indexed_lookup_us': round(indexed_per_lookup * 1_000_000, 3),
+        'lookup_after_list_changed_ms': round(refresh_after_change * 1000, 3)
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_lookups())
@@ -1,71 +1,286 @@
 # 📖 Chapter: Chapter 9: Advanced MCP Patterns
 # 📖 Section: 9.1 Multi-Server Architectures
 
+import json
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AbstractSet, Any, Dict, List, Set
+
+# ${step} or ${step.field.0}
+REFERENCE_PATTERN = re.compile(r'\$\{([A-Za-z0-9_\-]+)((?:\.[A-Za-z0-9_\-]+)*)\}')
+
+class StepReference:
+    """Pointer into another step's result, resolved without re-serializing."""
+
+    def __init__(self, step_id: str, path: List[str]):
+        self.step_id = step_id
+        self.path = path
+
+    def resolve(self, context: Dict) -> Any:
+        value = context[self.step_id]
+        for part in self.path:
+            if isinstance(value, list):
+                value = value[int(part)]
+            else:
+                value = value[part]
+        return value
+
+class InterpolatedString:
+    """String with embedded references, e.g. "report for ${user.name}"."""
+
+    def __init__(self, parts: List[Any]):
+        self.parts = parts
+
+    def resolve(self, context: Dict) -> str:
+        return ''.join(
+            self._text(part.resolve(context)) if isinstance(part, StepReference) else part
+            for part in self.parts
+        )
+
+    @staticmethod
+    def _text(value: Any) -> str:
+        # Embedded objects and numbers appear as JSON, as the old substitution wrote them
+        return value if isinstance(value, str) else json.dumps(value)
+
 class ChainedMCPWorkflow:
     """Execute workflows across multiple chained servers."""
-    
-    def __init__(self, multi_client: MultiServerMCPClient):
+
+    def __init__(self, multi_client: 'MultiServerMCPClient', max_parallel: int = 8):
         self.multi_client = multi_client
+        self.max_parallel = max_parallel
+        self.executor = ThreadPoolExecutor(max_workers=max_parallel)
         self.workflow_cache: Dict[str, Dict] = {}
-    
+
     def execute_chain(self, chain_definition: List[Dict]) -> Dict:
-        """Execute a chain of operations across servers."""
-        results = []
-        context = {}
-        
-        for step in chain_definition:
-            step_id = step['id']
-            server_id = step['server_id']
-            operation = step['operation']
-            params = step.get('params', {})
-            
-            # Substitute context variables
-            params = self._substitute_context(params, context)
-            
-            try:
-                if operation == 'call_tool':
-                    tool_name = step['tool_name']
-                    result = self.multi_client.servers[server_id].call_tool(
-                        tool_name, params
-                    )
-                elif operation == 'read_resource':
-                    uri = step['resource_uri']
-                    result = self.multi_client.servers[server_id].read_resource(uri)
-                else:
-                    result = {'error': f'Unknown operation: {operation}'}
-                
+        """Execute a chain of operations across servers, independent steps in parallel."""
+        steps = {step['id']: step for step in chain_definition}
+        templates = {
+            step_id: self._compile_template(step.get('params', {}), steps.keys())
+            for step_id, step in steps.items()
+        }
+        dependencies = self._build_dependencies(steps, templates)
+
+        dependents: Dict[str, Set[str]] = {step_id: set() for step_id in steps}
+        for step_id, deps in dependencies.items():
+            for dep in deps:
+                dependents[dep].add(step_id)
+
+        waiting = {step_id: len(deps) for step_id, deps in dependencies.items()}
+        ready = [step_id for step_id, count in waiting.items() if count == 0]
+        outcomes: Dict[str, Dict] = {}
+        context: Dict[str, Any] = {}
+        running = {}
+        failed = False
+        # Results of steps marked 'cache': True, shared only within this run
+        run_cache: Dict[str, Any] = {}
+
+        while ready or running:
+            # Stop launching new steps once one has failed
+            while ready and not failed:
+                step_id = ready.pop(0)
+                try:
+                    params = self._resolve(templates[step_id], context)
+                except (KeyError, IndexError, ValueError, TypeError) as e:
+                    outcomes[step_id] = {'step_id': step_id, 'status': 'error',
+                                         'error': f'Cannot resolve params: {e!r}'}
+                    failed = True
+                    continue
+                future = self.executor.submit(self._run_step, steps[step_id], params, run_cache)
+                running[future] = step_id
+            ready.clear()
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step_id = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    outcomes[step_id] = {'step_id': step_id, 'status': 'error', 'error': str(e)}
+                    failed = True
+                    continue
+
                 # Store result in context
                 context[step_id] = result
-                results.append({
-                    'step_id': step_id,
-                    'status': 'success',
-                    'result': result
-                })
-                
-            except Exception as e:
-                results.append({
-                    'step_id': step_id,
-                    'status': 'error',
-                    'error': str(e)
-                })
-                break  # Stop chain on error
-        
+                outcomes[step_id] = {'step_id': step_id, 'status': 'success', 'result': result}
+                for dependent in dependents[step_id]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        ready.append(dependent)
+
+        results = [
+            outcomes.get(step_id, {'step_id': step_id, 'status': 'skipped'})
+            for step_id in steps
+        ]
+
         return {
             'chain_id': chain_definition[0].get('chain_id', 'default'),
             'steps': results,
             'final_context': context
         }
-    
-    def _substitute_context(self, params: Dict, context: Dict) -> Dict:
-        """Substitute context variables in parameters."""
-        import json
-        import re
-        
-        params_str = json.dumps(params)
-        
-        for key, value in context.items():
-            # Replace ${key} with JSON-serialized value
-            pattern = f'\\$\\{{{key}\\}}'
-            params_str = re.sub(pattern, json.dumps(value), params_str)
-        
-        return json.loads(params_str)
\ No newline at end of file
+
+    def _run_step(self, step: Dict, params: Dict, run_cache: Dict[str, Any]) -> Any:
+        """Execute one step; steps marked 'cache': True reuse identical results within the run."""
+        server_id = step['server_id']
+        operation = step['operation']
+
+        cache_key = None
+        if step.get('cache', False):
+            cache_key = json.dumps(
+                [server_id, operation, step.get('tool_name'), step.get('resource_uri'), params],
+                sort_keys=True,
+                default=str
+            )
+            if cache_key in run_cache:
+                return run_cache[cache_key]
+
+        client = self.multi_client.servers[server_id]
+        if operation == 'call_tool':
+            result = client.call_tool(step['tool_name'], params)
+        elif operation == 'read_resource':
+            result = client.read_resource(step['resource_uri'])
+        else:
+            result = {'error': f'Unknown operation: {operation}'}
+
+        if cache_key is not None:
+            run_cache[cache_key] = result
+        return result
+
+    def _build_dependencies(self, steps: Dict[str, Dict],
+                            templates: Dict[str, Any]) -> Dict[str, Set[str]]:
+        """Dependency sets from ${step} references plus explicit depends_on.
+
+        References always name a known step; only depends_on can be unknown.
+        """
+        dependencies = {}
+        for step_id, step in steps.items():
+            deps = set(step.get('depends_on', []))
+            deps.update(ref.step_id for ref in self._references(templates[step_id]))
+
+            unknown = deps - steps.keys()
+            if unknown:
+                raise ValueError(f"Step {step_id} references unknown steps: {sorted(unknown)}")
+            dependencies[step_id] = deps
+
+        # Kahn's algorithm: anything never released sits on a cycle
+        dependents: Dict[str, List[str]] = {step_id: [] for step_id in steps}
+        for step_id, deps in dependencies.items():
+            for dep in deps:
+                dependents[dep].append(step_id)
+
+        waiting = {step_id: len(deps) for step_id, deps in dependencies.items()}
+        ready = [step_id for step_id, count in waiting.items() if count == 0]
+        released = 0
+        while ready:
+            done = ready.pop()
+            released += 1
+            for step_id in dependents[done]:
+                waiting[step_id] -= 1
+                if waiting[step_id] == 0:
+                    ready.append(step_id)
+        if released < len(steps):
+            cycle = sorted(step_id for step_id, count in waiting.items() if count > 0)
+            raise ValueError(f"Workflow has a dependency cycle: {cycle}")
+
+        return dependencies
+
+    def _compile_template(self, params: Any, step_ids: AbstractSet[str]) -> Any:
+        """Parse ${...} placeholders once into reference objects.
+
+        Only placeholders naming a step are references; others (${HOME}, a
+        template meant for the tool) are left as literal text.
+        """
+        if isinstance(params, dict):
+            return {key: self._compile_template(value, step_ids) for key, value in params.items()}
+        if isinstance(params, list):
+            return [self._compile_template(value, step_ids) for value in params]
+        if not isinstance(params, str) or '${' not in params:
+            return params
+
+        match = REFERENCE_PATTERN.fullmatch(params)
+        if match:
+            return self._reference(match) if match.group(1) in step_ids else params
+
+        parts: List[Any] = []
+        last = 0
+        for match in REFERENCE_PATTERN.finditer(params):
+            if match.group(1) not in step_ids:
+                continue
+            parts.append(params[last:match.start()])
+            parts.append(self._reference(match))
+            last = match.end()
+        if not parts:
+            return params
+        parts.append(params[last:])
+        return InterpolatedString(parts)
+
+    def _reference(self, match: 're.Match') -> StepReference:
+        path = [part for part in match.group(2).split('.') if part]
+        return StepReference(match.group(1), path)
+
+    def _references(self, template: Any):
+        if isinstance(template, StepReference):
+            yield template
+        elif isinstance(template, InterpolatedString):
+            for part in template.parts:
+                if isinstance(part, StepReference):
+                    yield part
+        elif isinstance(template, dict):
+            for value in template.values():
+                yield from self._references(value)
+        elif isinstance(template, list):
+            for value in template:
+                yield from self._references(value)
+
+    def _resolve(self, template: Any, context: Dict) -> Any:
+        """Bind references to context values; whole-value references are not copied."""
+        if isinstance(template, (StepReference, InterpolatedString)):
+            return template.resolve(context)
+        if isinstance(template, dict):
+            return {key: self._resolve(value, context) for key, value in template.items()}
+        if isinstance(template, list):
+            return [self._resolve(value, context) for value in template]
+        return template
+
+
+def benchmark_wide_workflow(width: int = 16, latency: float = 0.05) -> Dict:
+    """Fan-out/fan-in workflow against stand-in servers with simulated latency."""
+    class StandInServer:
+        def call_tool(self, name: str, arguments: Dict) -> Dict:
+            time.sleep(latency)
+            return {'tool': name, 'rows': [{'id': i} for i in range(1000)]}
+
+    class StandInMultiClient:
+        servers = {f'server-{i}': StandInServer() for i in range(4)}
+
+    chain = [{'id': 'seed', 'server_id': 'server-0', 'operation': 'call_tool',
+              'tool_name': 'seed', 'params': {}}]
+    for i in range(width):
+        chain.append({'id': f'fetch_{i}', 'server_id': f'server-{i % 4}',
+                      'operation': 'call_tool', 'tool_name': 'fetch',
+                      'params': {'rows': '${seed.rows}', 'label': 'shard ${seed.tool}'}})
+    chain.append({'id': 'merge', 'server_id': 'server-0', 'operation': 'call_tool',
+                  'tool_name': 'merge',
+                  'params': {'parts': [f'${{fetch_{i}}}' for i in range(width)]}})
+
+    timings = {}
+    for max_parallel in (1, width):
+        workflow = ChainedMCPWorkflow(StandInMultiClient(), max_parallel=max_parallel)
+        start = time.perf_counter()
+        result = workflow.execute_chain(chain)
+        timings[max_parallel] = time.perf_counter() - start
+        assert all(step['status'] == 'success' for step in result['steps'])
+
+    return {
+        'steps': len(chain),
+        'sequential_s': round(timings[1], 3),
+        'parallel_s': round(timings[width], 3),
+        'speedup': round(timings[1] / timings[width], 1)
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_wide_workflow())
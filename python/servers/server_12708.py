@@ -1,88 +1,213 @@
 # 📖 Chapter: Chapter 9: Advanced MCP Patterns
 # 📖 Section: 9.1 Multi-Server Architectures
 
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+class CapabilityTrieNode:
+    __slots__ = ("children", "servers")
+
+    def __init__(self):
+        self.children: Dict[str, 'CapabilityTrieNode'] = {}
+        # server_id -> number of its capabilities in this subtree
+        self.servers: Dict[str, int] = {}
+
+class CapabilityTrie:
+    """Prefix tree over capability strings, tracking which servers sit under each prefix."""
+
+    def __init__(self):
+        self.root = CapabilityTrieNode()
+
+    def add(self, capability: str, server_id: str):
+        node = self.root
+        node.servers[server_id] = node.servers.get(server_id, 0) + 1
+        for char in capability:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = CapabilityTrieNode()
+            node = child
+            node.servers[server_id] = node.servers.get(server_id, 0) + 1
+
+    def remove(self, capability: str, server_id: str):
+        """Remove one server's capability and prune branches left empty."""
+        path = [(None, None, self.root)]
+        node = self.root
+        for char in capability:
+            node = node.children.get(char)
+            if node is None:
+                return
+            path.append((path[-1][2], char, node))
+
+        for parent, char, node in reversed(path):
+            count = node.servers.get(server_id, 0) - 1
+            if count > 0:
+                node.servers[server_id] = count
+            else:
+                node.servers.pop(server_id, None)
+            if parent is not None and not node.servers:
+                del parent.children[char]
+
+    def servers_with_prefix(self, prefix: str) -> Dict[str, int]:
+        """Servers having at least one capability that starts with prefix."""
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return {}
+        return node.servers
+
 class SmartMCPRouter:
     """Route requests to appropriate MCP servers based on capability."""
-    
-    def __init__(self, multi_client: MultiServerMCPClient):
+
+    def __init__(self, multi_client: 'MultiServerMCPClient'):
         self.multi_client = multi_client
         self.server_capabilities: Dict[str, set] = {}
+        # capability -> servers providing it
+        self.capability_index: Dict[str, Set[str]] = {}
+        self.capability_trie = CapabilityTrie()
+        # Per-server capability sources, refreshed independently
+        self._tool_capabilities: Dict[str, set] = {}
+        self._resource_capabilities: Dict[str, set] = {}
+        # Registration order keeps routing deterministic when several servers match
+        self._server_rank: Dict[str, int] = {}
         self._build_capability_map()
-    
+
     def _build_capability_map(self):
         """Build map of server capabilities."""
         all_tools = self.multi_client.list_all_tools()
         all_resources = self.multi_client.list_all_resources()
-        
+
         for server_id, tools in all_tools.items():
-            capabilities = set()
-            
-            # Add tool capabilities
-            for tool in tools:
-                capabilities.add(f"tool:{tool['name']}")
-                if 'description' in tool:
-                    # Extract keywords from description
-                    keywords = self._extract_keywords(tool['description'])
-                    capabilities.update(keywords)
-            
-            # Add resource capabilities
-            for resource in all_resources.get(server_id, []):
-                uri = resource.get('uri', '')
-                if uri.startswith('file://'):
-                    capabilities.add('resource:filesystem')
-                elif uri.startswith('db://'):
-                    capabilities.add('resource:database')
-                elif uri.startswith('api://'):
-                    capabilities.add('resource:api')
-            
-            self.server_capabilities[server_id] = capabilities
-    
+            self._tool_capabilities[server_id] = self._capabilities_from_tools(tools)
+            self._resource_capabilities[server_id] = self._capabilities_from_resources(
+                all_resources.get(server_id, [])
+            )
+            self._update_server(server_id)
+
+    def _capabilities_from_tools(self, tools: List[Dict]) -> set:
+        capabilities = set()
+
+        # Add tool capabilities
+        for tool in tools:
+            capabilities.add(f"tool:{tool['name']}")
+            if 'description' in tool:
+                # Extract keywords from description
+                keywords = self._extract_keywords(tool['description'])
+                capabilities.update(keywords)
+
+        return capabilities
+
+    def _capabilities_from_resources(self, resources: List[Dict]) -> set:
+        capabilities = set()
+
+        # Add resource capabilities
+        for resource in resources:
+            uri = resource.get('uri', '')
+            if uri.startswith('file://'):
+                capabilities.add('resource:filesystem')
+            elif uri.startswith('db://'):
+                capabilities.add('resource:database')
+            elif uri.startswith('api://'):
+                capabilities.add('resource:api')
+
+        return capabilities
+
     def _extract_keywords(self, text: str) -> set:
         """Extract capability keywords from text."""
         keywords = {
             'search', 'query', 'database', 'file', 'web', 'api',
             'email', 'calendar', 'document', 'code', 'test'
         }
-        
+
         text_lower = text.lower()
         found = set()
-        
+
         for keyword in keywords:
             if keyword in text_lower:
                 found.add(keyword)
-        
+
         return found
-    
+
+    def handle_notification(self, server_id: str, notification: Dict):
+        """Refresh one server's capabilities on list_changed notifications."""
+        method = notification.get('method')
+        client = self.multi_client.servers[server_id]
+
+        if method == 'notifications/tools/list_changed':
+            self._tool_capabilities[server_id] = self._capabilities_from_tools(client.list_tools())
+            self._update_server(server_id)
+        elif method == 'notifications/resources/list_changed':
+            self._resource_capabilities[server_id] = self._capabilities_from_resources(
+                client.list_resources()
+            )
+            self._update_server(server_id)
+
+    def remove_server(self, server_id: str):
+        """Drop a server from the routing index."""
+        self._tool_capabilities.pop(server_id, None)
+        self._resource_capabilities.pop(server_id, None)
+        self._apply_diff(server_id, self.server_capabilities.pop(server_id, set()), set())
+        self._server_rank.pop(server_id, None)
+
+    def _update_server(self, server_id: str):
+        """Apply only the capabilities that changed for one server."""
+        self._server_rank.setdefault(server_id, len(self._server_rank))
+        new = self._tool_capabilities.get(server_id, set()) | \
+            self._resource_capabilities.get(server_id, set())
+        old = self.server_capabilities.get(server_id, set())
+
+        self._apply_diff(server_id, old - new, new - old)
+        self.server_capabilities[server_id] = new
+
+    def _apply_diff(self, server_id: str, removed: Iterable[str], added: Iterable[str]):
+        for capability in removed:
+            servers = self.capability_index.get(capability)
+            if servers is None or server_id not in servers:
+                continue
+            servers.discard(server_id)
+            self.capability_trie.remove(capability, server_id)
+            if not servers:
+                del self.capability_index[capability]
+
+        for capability in added:
+            servers = self.capability_index.get(capability)
+            if servers is None:
+                servers = self.capability_index[capability] = set()
+            if server_id not in servers:
+                servers.add(server_id)
+                self.capability_trie.add(capability, server_id)
+
+    def _first_server(self, servers: Iterable[str]) -> Optional[str]:
+        return min(servers, key=self._server_rank.__getitem__, default=None)
+
     def route_request(self, capability: str, operation: str = None) -> Optional[str]:
         """Route request to server with required capability."""
         # Exact capability match
-        for server_id, capabilities in self.server_capabilities.items():
-            if capability in capabilities:
-                return server_id
-            
-            # Check if operation-specific capability exists
-            if operation:
-                op_capability = f"{operation}:{capability}"
-                if op_capability in capabilities:
-                    return server_id
-        
-        # Fuzzy match
-        for server_id, capabilities in self.server_capabilities.items():
-            if any(cap.startswith(capability) for cap in capabilities):
-                return server_id
-        
-        return None
-    
+        candidates = self.capability_index.get(capability, set())
+
+        # Check if operation-specific capability exists
+        if operation:
+            op_capability = f"{operation}:{capability}"
+            if op_capability in self.capability_index:
+                candidates = candidates | self.capability_index[op_capability]
+
+        if candidates:
+            return self._first_server(candidates)
+
+        # Fuzzy match: first registered server with any capability under the prefix
+        return self._first_server(self.capability_trie.servers_with_prefix(capability))
+
     def route_tool_call(self, tool_name: str, arguments: Dict) -> Dict:
         """Route tool call to appropriate server."""
         server_id = self.route_request(f"tool:{tool_name}")
-        
+
         if not server_id:
             return {
                 'status': 'error',
                 'message': f'No server found with tool: {tool_name}'
             }
-        
+
         try:
             result = self.multi_client.servers[server_id].call_tool(
                 tool_name, arguments
@@ -97,4 +222,83 @@ class SmartMCPRouter:
                 'status': 'error',
                 'server_id': server_id,
                 'error': str(e)
-            }
\ No newline at end of file
+            }
+
+
+def benchmark_routing(num_servers: int = 500, tools_per_server: int = 200,
+                      decisions: int = 100_000) -> Dict:
+    """Route decisions per second with an in-memory catalog."""
+    rng = random.Random(7)
+    catalog = {
+        f'server-{s}': [
+            {'name': f'svc{s}_tool_{t}', 'description': rng.choice(['search docs', 'query database', 'send email'])}
+            for t in range(tools_per_server)
+        ]
+        for s in range(num_servers)
+    }
+
+    class StandInClient:
+        def __init__(self, server_id: str):
+            self.server_id = server_id
+
+        def list_tools(self):
+            return catalog[self.server_id]
+
+    class StandInMultiClient:
+        servers = {server_id: StandInClient(server_id) for server_id in catalog}
+
+        def list_all_tools(self):
+            return catalog
+
+        def list_all_resources(self):
+            return {}
+
+    start = time.perf_counter()
+    router = SmartMCPRouter(StandInMultiClient())
+    build_seconds = time.perf_counter() - start
+
+    queries = []
+    for _ in range(decisions):
+        s, t = rng.randrange(num_servers), rng.randrange(tools_per_server)
+        queries.append(rng.choice([f'tool:svc{s}_tool_{t}', f'tool:svc{s}_to', 'tool:missing']))
+
+    start = time.perf_counter()
+    for query in queries:
+        router.route_request(query)
+    indexed_seconds = time.perf_counter() - start
+
+    # Previous behaviour: scan every server's capability set, then a startswith pass
+    def linear_route(capability: str) -> Optional[str]:
+        for server_id, capabilities in router.server_capabilities.items():
+            if capability in capabilities:
+                return server_id
+        for server_id, capabilities in router.server_capabilities.items():
+            if any(cap.startswith(capability) for cap in capabilities):
+                return server_id
+        return None
+
+    sample = queries[:200]
+    start = time.perf_counter()
+    for query in sample:
+        linear_route(query)
+    linear_seconds = time.perf_counter() - start
+
+    # Incremental refresh of one server after tools/list_changed
+    catalog['server-0'] = catalog['server-0'][:-1] + [{'name': 'svc0_new_tool'}]
+    start = time.perf_counter()
+    router.handle_notification('server-0', {'method': 'notifications/tools/list_changed'})
+    refresh_seconds = time.perf_counter() - start
+    assert router.route_request('tool:svc0_new_tool') == 'server-0'
+
+    return {
+        'servers': num_servers,
+        'tools_per_server': tools_per_server,
+        'index_build_s': round(build_seconds, 3),
+        'indexed_decisions_per_s': round(decisions / indexed_seconds),
+        'linear_decisions_per_s': round(len(sample) / linear_seconds, 1),
+        'incremental_refresh_ms': round(refresh_seconds * 1000, 3)
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_routing())
@@ -1,58 +1,83 @@
 # 📖 Chapter: Chapter 7: Building Your First MCP Server
 # 📖 Section: 7.4 Advanced Testing Strategies
 
-import time
-import statistics
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from typing import Dict
+
+from utils.load_generator import (
+    CallableTarget, OpenLoopLoadGenerator, Operation, Scenario
+)
+
+def client_target(client: 'MCPClient') -> CallableTarget:
+    """Expose a synchronous MCPClient as a load-generator target."""
+    def dispatch(method: str, params: Dict):
+        if method == "tools/call":
+            return client.call_tool(params["name"], params.get("arguments", {}))
+        if method == "resources/read":
+            return client.read_resource(params["uri"])
+        if method == "tools/list":
+            return client.list_tools()
+        if method == "resources/list":
+            return client.list_resources()
+        raise ValueError(f"Unsupported method: {method}")
+
+    return CallableTarget(dispatch)
 
 class PerformanceTestSuite:
     """Performance testing for MCP server."""
-    
-    def __init__(self, client: 'MCPClient'):
-        self.client = client
-    
-    def test_concurrent_requests(self, num_requests: int = 100) -> Dict:
-        """Test concurrent request handling."""
-        latencies = []
-        
-        def make_request():
-            start = time.time()
-            self.client.call_tool("read_file", {"path": "test.txt"})
-            latencies.append(time.time() - start)
-        
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = [
-                executor.submit(make_request)
-                for _ in range(num_requests)
-            ]
-            
-            for future in futures:
-                future.result()
-        
+
+    def __init__(self, client: 'MCPClient', workers: int = 10):
+        self.target = client_target(client)
+        self.workers = workers
+        self.operation = Operation(
+            "tools/call", {"name": "read_file", "arguments": {"path": "test.txt"}}
+        )
+
+    def test_concurrent_requests(self, rate: float = 100.0,
+                                 duration_seconds: float = 10.0) -> Dict:
+        """Test latency at a fixed offered rate (open loop)."""
+        scenario = Scenario(
+            [self.operation],
+            mode="constant",
+            rate=rate,
+            duration=duration_seconds,
+            workers=self.workers
+        )
+        results = self._run(scenario)
+        latency = results["overall"]["response_time"]
+
         return {
-            "total_requests": num_requests,
-            "mean_latency": statistics.mean(latencies),
-            "median_latency": statistics.median(latencies),
-            "p95_latency": statistics.quantiles(latencies, n=20)[18],
-            "p99_latency": statistics.quantiles(latencies, n=100)[98],
-            "min_latency": min(latencies),
-            "max_latency": max(latencies)
+            "total_requests": results["requests_scheduled"],
+            "failed_requests": results["requests_failed"],
+            "mean_latency": latency["mean_ms"] / 1000,
+            "median_latency": latency["p50_ms"] / 1000,
+            "p99_latency": latency["p99_ms"] / 1000,
+            "p999_latency": latency["p99.9_ms"] / 1000,
+            "min_latency": latency["min_ms"] / 1000,
+            "max_latency": latency["max_ms"] / 1000,
+            "report": results
         }
-    
-    def test_throughput(self, duration_seconds: int = 10) -> Dict:
-        """Test request throughput."""
-        requests_completed = 0
-        start_time = time.time()
-        end_time = start_time + duration_seconds
-        
-        while time.time() < end_time:
-            self.client.call_tool("read_file", {"path": "test.txt"})
-            requests_completed += 1
-        
-        actual_duration = time.time() - start_time
-        
+
+    def test_throughput(self, start_rate: float = 10.0, end_rate: float = 1000.0,
+                        duration_seconds: float = 10.0) -> Dict:
+        """Ramp the offered rate to find where throughput stops tracking it."""
+        scenario = Scenario(
+            [self.operation],
+            mode="ramp",
+            start_rate=start_rate,
+            end_rate=end_rate,
+            duration=duration_seconds,
+            workers=self.workers
+        )
+        results = self._run(scenario)
+
         return {
-            "requests_completed": requests_completed,
-            "duration_seconds": actual_duration,
-            "requests_per_second": requests_completed / actual_duration
-        }
\ No newline at end of file
+            "requests_completed": results["requests_completed"],
+            "duration_seconds": results["duration_seconds"],
+            "requests_per_second": results["throughput_rps"],
+            "p99_latency": results["overall"]["response_time"]["p99_ms"] / 1000,
+            "report": results
+        }
+
+    def _run(self, scenario: Scenario) -> Dict:
+        return asyncio.run(OpenLoopLoadGenerator(self.target, scenario).run())
@@ -1,75 +1,72 @@
 # 📖 Chapter: Chapter 7: Building Your First MCP Server
 # 📖 Section: 7.4 Advanced Testing Strategies
 
+import asyncio
+from typing import Dict, List
+
+from servers.server_9801 import client_target
+from utils.load_generator import OpenLoopLoadGenerator, Scenario
+
 class LoadTestRunner:
     """Load testing for MCP server."""
-    
+
     def __init__(self, client: 'MCPClient'):
-        self.client = client
-    
-    def run_load_test(self, 
-                     concurrent_users: int = 50,
-                     requests_per_user: int = 100,
-                     ramp_up_seconds: int = 10) -> Dict:
-        """Run load test simulation."""
-        results = {
-            "successful_requests": 0,
-            "failed_requests": 0,
-            "total_latency": 0,
-            "errors": []
-        }
-        
-        def user_simulation(user_id: int):
-            """Simulate user behavior."""
-            user_results = {
-                "successful": 0,
-                "failed": 0,
-                "errors": []
-            }
-            
-            for i in range(requests_per_user):
-                try:
-                    start = time.time()
-                    result = self.client.call_tool("read_file", {"path": f"user_{user_id}_file_{i}.txt"})
-                    latency = time.time() - start
-                    
-                    user_results["successful"] += 1
-                    results["successful_requests"] += 1
-                    results["total_latency"] += latency
-                except Exception as e:
-                    user_results["failed"] += 1
-                    results["failed_requests"] += 1
-                    results["errors"].append(str(e))
-                
-                # Small delay between requests
-                time.sleep(0.01)
-            
-            return user_results
-        
-        # Ramp up users gradually
-        with ThreadPoolExecutor(max_workers=concurrent_users) as executor:
-            futures = []
-            
-            for user_id in range(concurrent_users):
-                # Stagger user start times
-                delay = (user_id / concurrent_users) * ramp_up_seconds
-                time.sleep(delay / concurrent_users)
-                
-                future = executor.submit(user_simulation, user_id)
-                futures.append(future)
-            
-            # Wait for all users to complete
-            for future in futures:
-                future.result()
-        
-        results["average_latency"] = (
-            results["total_latency"] / results["successful_requests"]
-            if results["successful_requests"] > 0 else 0
+        self.target = client_target(client)
+
+    def run_load_test(self,
+                     scenario: Scenario = None,
+                     target_rate: float = 500.0,
+                     duration_seconds: float = 60.0,
+                     ramp_up_seconds: float = 10.0,
+                     workers: int = 50) -> Dict:
+        """Run an open-loop load test, ramping up before holding target_rate."""
+        if scenario is None:
+            scenario = Scenario.from_dict({
+                "name": "read_file",
+                "operations": [{
+                    "method": "tools/call",
+                    "params": {"name": "read_file", "arguments": {"path": "test.txt"}}
+                }]
+            })
+
+        # Ramp phase is recorded separately so it doesn't skew steady-state numbers
+        ramp = Scenario(
+            scenario.operations,
+            mode="ramp",
+            start_rate=max(1.0, target_rate / 20),
+            end_rate=target_rate,
+            duration=ramp_up_seconds,
+            workers=workers,
+            timeout=scenario.timeout,
+            name=f"{scenario.name}-ramp"
         )
-        results["error_rate"] = (
-            results["failed_requests"] / 
-            (results["successful_requests"] + results["failed_requests"])
-            if (results["successful_requests"] + results["failed_requests"]) > 0 else 0
+        steady = Scenario(
+            scenario.operations,
+            mode="constant",
+            rate=target_rate,
+            duration=duration_seconds,
+            workers=workers,
+            timeout=scenario.timeout,
+            seed=scenario.seed,
+            name=scenario.name
         )
-        
-        return results
\ No newline at end of file
+
+        phases: List[Dict] = []
+        for phase in (ramp, steady):
+            if phase.duration > 0:
+                phases.append(asyncio.run(OpenLoopLoadGenerator(self.target, phase).run()))
+
+        results = phases[-1]
+        return {
+            "successful_requests": results["requests_completed"],
+            "failed_requests": results["requests_failed"],
+            "average_latency": results["overall"]["response_time"]["mean_ms"] / 1000,
+            "p99_latency": results["overall"]["response_time"]["p99_ms"] / 1000,
+            "error_rate": results["error_rate"],
+            "errors": {
+                label: data["errors"]
+                for label, data in results["operations"].items()
+                if data["errors"]
+            },
+            "phases": phases
+        }
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples"))
+
+from example_13198 import MCPWorkflowEngine  # noqa: E402
+
+DOCUMENTS = 10
+
+
+class FlakyClient:
+    """Echoes the document; fails once on the given (tool, document) call."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = []
+
+    async def call_tool_async(self, server_id, tool_name, arguments):
+        self.calls.append((tool_name, arguments["doc"]))
+        if (tool_name, arguments["doc"]) == self.fail_on:
+            self.fail_on = None
+            raise RuntimeError(f"{tool_name} failed on document {arguments['doc']}")
+        await asyncio.sleep(0)
+        return {"doc": arguments["doc"]}
+
+
+def two_stage_workflow(stream):
+    index_doc = "${entry.result.doc}" if stream else "${entry.doc}"
+    return {"steps": [
+        {"id": "extract", "type": "parallel_loop", "loop_variable": "doc", "items": "${docs}",
+         "stream": stream, "max_concurrency": 4,
+         "body": {"server_id": "etl", "operation": "call_tool", "tool_name": "extract",
+                  "params": {"doc": "${doc}"}}},
+        {"id": "index", "type": "parallel_loop", "loop_variable": "entry",
+         "items": "${extract}" if stream else "${extract.results}", "max_concurrency": 4,
+         "body": {"server_id": "etl", "operation": "call_tool", "tool_name": "index",
+                  "params": {"doc": index_doc}}}
+    ]}
+
+
+def run_twice(tmp_path, stream):
+    client = FlakyClient(fail_on=("index", 5))
+    engine = MCPWorkflowEngine(client, checkpoint_dir=str(tmp_path))
+    engine.register_workflow("etl", two_stage_workflow(stream))
+
+    async def scenario():
+        context = {"docs": list(range(DOCUMENTS))}
+        first = await engine.execute_workflow("etl", dict(context), run_id="nightly")
+        calls_before_resume = len(client.calls)
+        second = await engine.execute_workflow("etl", dict(context), run_id="nightly")
+        return first, second, client.calls[calls_before_resume:]
+
+    return asyncio.run(scenario())
+
+
+def test_resumed_stream_feeds_every_item_to_the_next_loop(tmp_path):
+    first, second, resumed_calls = run_twice(tmp_path, stream=True)
+
+    assert first["status"] == "failed"
+    assert second["status"] == "completed", second["execution_log"]
+    indexed = second["final_context"]["index"]["results"]
+    assert sorted(result["doc"] for result in indexed) == list(range(DOCUMENTS))
+    # The checkpointed extract loop is not run again
+    assert all(tool == "index" for tool, _ in resumed_calls)
+
+
+def test_resumed_loop_results_feed_the_next_loop(tmp_path):
+    first, second, resumed_calls = run_twice(tmp_path, stream=False)
+
+    assert first["status"] == "failed"
+    assert second["status"] == "completed", second["execution_log"]
+    indexed = second["final_context"]["index"]["results"]
+    assert [result["doc"] for result in indexed] == list(range(DOCUMENTS))
+    assert all(tool == "index" for tool, _ in resumed_calls)
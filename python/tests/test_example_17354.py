@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples"))
+
+from example_17354 import EnterpriseAPIMCP, HTTPResponseCache, RateLimiter  # noqa: E402
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    """200 with the route's headers; 304 carrying only the ETag on a match."""
+
+    protocol_version = "HTTP/1.1"
+    routes = {}
+    hits = []
+
+    def do_GET(self):
+        path = self.path.strip("/")
+        route = self.routes[path]
+        self.hits.append((path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == route["etag"]:
+            self.send_response(304)
+            self.send_header("ETag", route["etag"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(route["body"]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", route["etag"])
+        for name, value in route.get("headers", {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api():
+    StubAPI.routes = {}
+    StubAPI.hits = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, StubAPI
+    server.shutdown()
+    server.server_close()
+
+
+def make_api(server, cache_dir=None) -> EnterpriseAPIMCP:
+    return EnterpriseAPIMCP({
+        "base_url": f"http://127.0.0.1:{server.server_address[1]}",
+        "rate_limit": 600_000,
+        "cache_dir": cache_dir
+    })
+
+
+def test_fresh_response_is_served_from_cache(stub_api):
+    server, handler = stub_api
+    handler.routes["items"] = {"etag": '"v1"', "body": {"v": 1},
+                               "headers": {"Cache-Control": "max-age=60"}}
+    api = make_api(server)
+
+    assert json.loads(api.read_resource("api://items")) == {"v": 1}
+    assert json.loads(api.read_resource("api://items")) == {"v": 1}
+    assert len(handler.hits) == 1
+
+
+def test_304_keeps_original_cache_control(stub_api):
+    server, handler = stub_api
+    handler.routes["items"] = {"etag": '"v1"', "body": {"v": 1},
+                               "headers": {"Cache-Control": "max-age=60"}}
+    api = make_api(server)
+    api.read_resource("api://items")
+
+    # Age the entry past max-age so the next read revalidates
+    entry = api.http_cache.get(f"{api.base_url}/items")
+    entry.stored_at -= 120
+    assert api.read_resource("api://items") == entry.body
+    assert handler.hits[-1] == ("items", '"v1"')
+
+    refreshed = api.http_cache.get(f"{api.base_url}/items")
+    assert refreshed.cache_control == "max-age=60"
+    assert refreshed.is_fresh(time.time())
+    api.read_resource("api://items")
+    assert len(handler.hits) == 2
+
+
+def test_304_keeps_original_expires():
+    cache = HTTPResponseCache()
+    expires = "Wed, 21 Oct 2099 07:28:00 GMT"
+    entry = cache.store("http://api/items", "{}", {"ETag": '"v1"', "Expires": expires})
+    refreshed = cache.refresh("http://api/items", entry, {"ETag": '"v1"'})
+
+    assert refreshed.expires == expires
+    assert refreshed.is_fresh(time.time())
+
+
+def test_304_headers_override_stored_ones():
+    cache = HTTPResponseCache()
+    entry = cache.store("http://api/items", "{}", {"ETag": '"v1"', "Cache-Control": "max-age=60"})
+    refreshed = cache.refresh("http://api/items", entry, {"Cache-Control": "no-cache"})
+
+    assert refreshed.cache_control == "no-cache"
+    assert refreshed.etag == '"v1"'
+    assert not refreshed.is_fresh(time.time())
+
+
+def test_cache_survives_restart(stub_api, tmp_path):
+    server, handler = stub_api
+    handler.routes["items"] = {"etag": '"v1"', "body": {"v": 1},
+                               "headers": {"Cache-Control": "max-age=60"}}
+    make_api(server, str(tmp_path)).read_resource("api://items")
+
+    restarted = make_api(server, str(tmp_path))
+    assert restarted.http_cache.stats["loaded"] == 1
+    assert restarted.http_cache.get(f"{restarted.base_url}/items").cache_control == "max-age=60"
+    restarted.read_resource("api://items")
+    assert len(handler.hits) == 1
+
+
+def test_load_skips_unrecognised_files(tmp_path):
+    foreign = tmp_path / "settings.json"
+    foreign.write_text('{"theme": "dark"}')
+    torn = tmp_path / "torn.json"
+    torn.write_text('{"url": "http://api/items", "bo')
+
+    cache = HTTPResponseCache(directory=str(tmp_path))
+
+    assert cache.stats["loaded"] == 0
+    assert foreign.exists() and torn.exists()
+
+
+def test_cancelled_acquire_refunds_its_tokens():
+    limiter = RateLimiter(60, burst=1)
+
+    async def scenario():
+        assert limiter.try_acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+    # Only the first call's interval remains reserved
+    assert limiter.buckets[None].delay(time.monotonic()) <= 1.0
+
+
+def test_default_burst_is_one_minute_of_calls():
+    limiter = RateLimiter(120)
+    assert all(limiter.try_acquire() for _ in range(120))
+    assert not limiter.try_acquire()
@@ -0,0 +1,85 @@
+import os
+import statistics
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "servers"))
+
+from server_10212 import HealthCheckManager  # noqa: E402
+
+PROBES = 2000
+
+
+class StandInServer:
+    """Catalog of a given size; listing it costs time proportional to the size."""
+
+    def __init__(self, size: int):
+        self.start_time = time.time()
+        self.active_sessions = {}
+        self.size = size
+        self.list_calls = 0
+
+    def list_resources(self):
+        self.list_calls += 1
+        return [{"uri": f"file:///data/{i}"} for i in range(self.size)]
+
+    def list_tools(self):
+        self.list_calls += 1
+        return [{"name": f"tool_{i}"} for i in range(min(self.size, 1000))]
+
+    def get_metrics(self):
+        return {"avg_latency_ms": 5, "error_rate": 0.0}
+
+
+def p99_seconds(probe) -> float:
+    samples = []
+    for _ in range(PROBES):
+        started = time.perf_counter()
+        probe()
+        samples.append(time.perf_counter() - started)
+    return statistics.quantiles(samples, n=100)[98]
+
+
+@pytest.fixture(scope="module", params=[10, 10_000, 1_000_000])
+def checked_manager(request):
+    server = StandInServer(request.param)
+    manager = HealthCheckManager(server, interval=60)
+    manager.perform_health_check()
+    return manager
+
+
+def test_liveness_p99_under_1ms(checked_manager):
+    assert p99_seconds(checked_manager.liveness) < 0.001
+
+
+def test_readiness_p99_under_1ms(checked_manager):
+    assert checked_manager.readiness()["ready"]
+    assert p99_seconds(checked_manager.readiness) < 0.001
+
+
+def test_probes_do_not_list_the_catalog(checked_manager):
+    calls = checked_manager.server.list_calls
+    checked_manager.liveness()
+    checked_manager.readiness()
+    assert checked_manager.server.list_calls == calls
+
+
+def test_ready_as_soon_as_started():
+    manager = HealthCheckManager(StandInServer(10), interval=60)
+    assert not manager.readiness()["ready"]
+    manager.start()
+    try:
+        assert manager.readiness()["ready"]
+    finally:
+        manager.stop()
+
+
+def test_stale_results_are_not_ready():
+    manager = HealthCheckManager(StandInServer(10), interval=60, max_staleness=0.05)
+    manager.perform_health_check()
+    time.sleep(0.1)
+    readiness = manager.readiness()
+    assert not readiness["ready"]
+    assert readiness["status"] == "unknown"
@@ -1,12 +1,16 @@
 # Utility modules for MCP implementations
 from .jsonrpc import JSONRPCRequest, JSONRPCResponse, JSONRPCNotification, MCPMessageHandler
 from .session_state import MCPSessionState
+from .load_generator import LatencyHistogram, OpenLoopLoadGenerator, Scenario
 
 __all__ = [
     'JSONRPCRequest',
     'JSONRPCResponse',
     'JSONRPCNotification',
     'MCPMessageHandler',
-    'MCPSessionState'
+    'MCPSessionState',
+    'LatencyHistogram',
+    'OpenLoopLoadGenerator',
+    'Scenario'
 ]
 
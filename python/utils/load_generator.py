@@ -0,0 +1,695 @@
+# 📁 File: python/utils/load_generator.py
+# 📖 Chapter 7, Section 7.4: Advanced Testing Strategies
+# 🔗 GitHub: https://github.com/mabualzait/Model-Context-Protocol/blob/main/python/utils/load_generator.py
+
+"""
+Open-loop load generator for MCP servers.
+
+Requests are issued on a fixed schedule (constant rate or linear ramp) that
+does not depend on how fast the server answers. Latency is measured from the
+*intended* send time, so a stalled server shows up as queueing delay instead
+of silently lowering the offered load (coordinated omission).
+
+Usage:
+    python -m utils.load_generator scenario.json --stdio "python server.py" \\
+        --json results.json --csv results.csv
+    python -m utils.load_generator scenario.json --http http://localhost:8080/mcp \\
+        --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import math
+import random
+import shlex
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+PROTOCOL_VERSION = "2024-11-05"
+REPORTED_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """HDR-style histogram: fixed relative error, constant-time record."""
+
+    def __init__(self, significant_digits: int = 3):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("significant_digits must be between 1 and 5")
+
+        self.significant_digits = significant_digits
+        # Smallest power of two able to resolve 10^digits distinct values
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self._sub_bucket_count = 1 << self._sub_bucket_bits
+        self._sub_bucket_half = self._sub_bucket_count >> 1
+        self.counts: Dict[int, int] = {}
+        self.total_count = 0
+        self.total_us = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+
+    def record(self, seconds: float, count: int = 1):
+        """Record a latency given in seconds."""
+        value = max(0, int(seconds * 1_000_000))
+        index = self._index_for(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += count
+        self.total_us += value * count
+        if self.min_us is None or value < self.min_us:
+            self.min_us = value
+        if value > self.max_us:
+            self.max_us = value
+
+    def merge(self, other: 'LatencyHistogram'):
+        """Add another histogram's samples into this one."""
+        if other.significant_digits != self.significant_digits:
+            raise ValueError("Cannot merge histograms with different precision")
+
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += other.total_count
+        self.total_us += other.total_us
+        if other.min_us is not None and (self.min_us is None or other.min_us < self.min_us):
+            self.min_us = other.min_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, percentile: float) -> float:
+        """Value at percentile, in milliseconds."""
+        if self.total_count == 0:
+            return 0.0
+
+        target = max(1, math.ceil(self.total_count * percentile / 100.0))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max_us) / 1000.0
+
+        return self.max_us / 1000.0
+
+    def mean(self) -> float:
+        """Mean latency in milliseconds."""
+        if self.total_count == 0:
+            return 0.0
+        return self.total_us / self.total_count / 1000.0
+
+    def summary(self) -> Dict[str, float]:
+        """Percentile summary in milliseconds."""
+        summary = {
+            "count": self.total_count,
+            "mean_ms": round(self.mean(), 3),
+            "min_ms": round((self.min_us or 0) / 1000.0, 3),
+            "max_ms": round(self.max_us / 1000.0, 3)
+        }
+        for p in REPORTED_PERCENTILES:
+            summary[f"p{p:g}_ms"] = round(self.percentile(p), 3)
+        return summary
+
+    def _index_for(self, value: int) -> int:
+        magnitude = max(0, value.bit_length() - self._sub_bucket_bits)
+        return magnitude * self._sub_bucket_half + (value >> magnitude)
+
+    def _highest_equivalent(self, index: int) -> int:
+        if index < self._sub_bucket_count:
+            return index
+        magnitude = index // self._sub_bucket_half - 1
+        sub_index = index - magnitude * self._sub_bucket_half
+        return (sub_index << magnitude) + (1 << magnitude) - 1
+
+
+class Operation:
+    """One weighted request type in a scenario."""
+
+    def __init__(self, method: str, params: Dict = None, weight: float = 1.0,
+                 label: str = None):
+        self.method = method
+        self.params = params or {}
+        self.weight = weight
+
+        if label is None:
+            label = method
+            if method == "tools/call" and "name" in self.params:
+                label = f"{method}:{self.params['name']}"
+        self.label = label
+
+
+class Scenario:
+    """
+    Load scenario, usually loaded from a JSON file:
+
+        {
+          "name": "mixed",
+          "mode": "ramp",             # "constant" or "ramp"
+          "rate": 200,                # requests/second (constant mode)
+          "start_rate": 10,           # ramp mode
+          "end_rate": 500,            # ramp mode
+          "duration": 30,             # seconds of measured load
+          "warmup": 2,                # seconds sent but not recorded
+          "arrival": "uniform",       # or "poisson"
+          "workers": 64,
+          "timeout": 10,
+          "seed": 1,
+          "operations": [
+            {"method": "tools/call", "weight": 6,
+             "params": {"name": "read_file", "arguments": {"path": "test.txt"}}},
+            {"method": "resources/read", "weight": 3, "params": {"uri": "file:///tmp/a"}},
+            {"method": "tools/list", "weight": 1}
+          ]
+        }
+    """
+
+    def __init__(self, operations: List[Operation], mode: str = "constant",
+                 rate: float = 100.0, start_rate: float = None, end_rate: float = None,
+                 duration: float = 10.0, warmup: float = 0.0, arrival: str = "uniform",
+                 workers: int = 32, timeout: float = 10.0, seed: int = None,
+                 name: str = "scenario"):
+        if not operations:
+            raise ValueError("Scenario needs at least one operation")
+        if mode not in ("constant", "ramp"):
+            raise ValueError(f"Unknown mode: {mode}")
+        if arrival not in ("uniform", "poisson"):
+            raise ValueError(f"Unknown arrival process: {arrival}")
+
+        self.name = name
+        self.operations = operations
+        self.mode = mode
+        self.rate = rate
+        self.start_rate = start_rate if start_rate is not None else rate
+        self.end_rate = end_rate if end_rate is not None else rate
+        self.duration = duration
+        self.warmup = warmup
+        self.arrival = arrival
+        self.workers = workers
+        self.timeout = timeout
+        self.seed = seed
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Scenario':
+        """Build scenario from parsed JSON."""
+        operations = [
+            Operation(op["method"], op.get("params"), op.get("weight", 1.0), op.get("label"))
+            for op in data.get("operations", [])
+        ]
+        options = {k: v for k, v in data.items() if k != "operations"}
+        return cls(operations, **options)
+
+    @classmethod
+    def load(cls, path: str) -> 'Scenario':
+        """Load scenario from a JSON file."""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def rate_at(self, elapsed: float) -> float:
+        """Offered rate (requests/second) at a point in the run."""
+        if self.mode == "constant":
+            return self.rate
+
+        total = self.warmup + self.duration
+        fraction = min(1.0, elapsed / total) if total > 0 else 1.0
+        return self.start_rate + (self.end_rate - self.start_rate) * fraction
+
+    def schedule(self) -> List[Tuple[float, Operation]]:
+        """Intended send offsets (seconds from start) for every request."""
+        rng = random.Random(self.seed)
+        weights = [op.weight for op in self.operations]
+        total = self.warmup + self.duration
+
+        schedule = []
+        offset = 0.0
+        while offset < total:
+            op = rng.choices(self.operations, weights)[0]
+            schedule.append((offset, op))
+
+            rate = max(self.rate_at(offset), 1e-6)
+            if self.arrival == "poisson":
+                offset += rng.expovariate(rate)
+            else:
+                offset += 1.0 / rate
+
+        return schedule
+
+
+class StdioMCPTarget:
+    """MCP server spawned as a subprocess speaking newline-delimited JSON-RPC."""
+
+    def __init__(self, command: List[str], env: Dict[str, str] = None):
+        self.command = command
+        self.env = env
+        self.process = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._reader_task = None
+
+    async def open(self):
+        """Start the server and perform the initialize handshake."""
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=self.env,
+            limit=64 * 1024 * 1024
+        )
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+        await self.request("initialize", {
+            "protocolVersion": PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "mcp-load-generator", "version": "1.0.0"}
+        })
+        await self._write({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+    async def request(self, method: str, params: Dict = None) -> Any:
+        """Send request and wait for its response."""
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params:
+            message["params"] = params
+
+        try:
+            await self._write(message)
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self):
+        """Stop the server process."""
+        if self.process is None:
+            return
+
+        if self.process.stdin:
+            self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+        if self._reader_task:
+            self._reader_task.cancel()
+
+    async def _write(self, message: Dict):
+        self.process.stdin.write(json.dumps(message).encode() + b"\n")
+        await self.process.stdin.drain()
+
+    async def _read_responses(self):
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                break
+
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            future = self._pending.get(message.get("id"))
+            if future is None or future.done():
+                continue
+
+            if "error" in message:
+                future.set_exception(MCPRequestError(message["error"]))
+            else:
+                future.set_result(message.get("result"))
+
+        # Server went away: fail everything still waiting
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("MCP server closed stdout"))
+
+
+class HTTPMCPTarget:
+    """MCP server reached over HTTP POST, one keep-alive connection per worker."""
+
+    def __init__(self, url: str, headers: Dict[str, str] = None):
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError("Only plain http:// endpoints are supported")
+
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or "/"
+        self.headers = headers or {}
+        self.session_id: Optional[str] = None
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._next_id = 0
+
+    async def open(self):
+        """Perform the initialize handshake."""
+        await self.request("initialize", {
+            "protocolVersion": PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "mcp-load-generator", "version": "1.0.0"}
+        })
+
+    async def request(self, method: str, params: Dict = None) -> Any:
+        """POST one JSON-RPC request and return its result."""
+        self._next_id += 1
+        message = {"jsonrpc": "2.0", "id": self._next_id, "method": method}
+        if params:
+            message["params"] = params
+        body = json.dumps(message).encode()
+
+        if self._idle:
+            reader, writer = self._idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+
+        try:
+            headers = {
+                "Host": f"{self.host}:{self.port}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "Content-Length": str(len(body)),
+                **self.headers
+            }
+            if self.session_id:
+                headers["Mcp-Session-Id"] = self.session_id
+
+            head = f"POST {self.path} HTTP/1.1\r\n"
+            head += "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+            writer.write(head.encode() + b"\r\n" + body)
+            await writer.drain()
+
+            status, response_headers, payload = await self._read_response(reader)
+        except BaseException:
+            writer.close()
+            raise
+
+        if response_headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self._idle.append((reader, writer))
+
+        if "mcp-session-id" in response_headers:
+            self.session_id = response_headers["mcp-session-id"]
+        if status >= 400:
+            raise MCPRequestError({"code": status, "message": f"HTTP {status}"})
+
+        response = json.loads(payload)
+        if "error" in response:
+            raise MCPRequestError(response["error"])
+        return response.get("result")
+
+    async def close(self):
+        """Close pooled connections."""
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def _read_response(self, reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str], bytes]:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            return status, headers, b"".join(chunks)
+
+        length = int(headers.get("content-length", 0))
+        return status, headers, await reader.readexactly(length)
+
+
+class CallableTarget:
+    """Adapt an in-process handler or synchronous client to the target interface."""
+
+    def __init__(self, handler: Callable[[str, Dict], Any], blocking: bool = True):
+        self.handler = handler
+        self.blocking = blocking
+
+    async def open(self):
+        pass
+
+    async def request(self, method: str, params: Dict = None) -> Any:
+        if asyncio.iscoroutinefunction(self.handler):
+            return await self.handler(method, params or {})
+        if self.blocking:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.handler, method, params or {})
+        return self.handler(method, params or {})
+
+    async def close(self):
+        pass
+
+
+class MCPRequestError(Exception):
+    """JSON-RPC error returned by the server under test."""
+
+    def __init__(self, error: Dict):
+        self.error = error
+        super().__init__(f"{error.get('code')}: {error.get('message')}")
+
+
+class OpenLoopLoadGenerator:
+    """Drive a target with a scenario and collect per-operation histograms."""
+
+    def __init__(self, target, scenario: Scenario):
+        self.target = target
+        self.scenario = scenario
+        self.response_times: Dict[str, LatencyHistogram] = {}
+        self.service_times: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, Counter] = {}
+        self.max_dispatch_lag = 0.0
+
+    async def run(self) -> Dict:
+        """Run the scenario and return a results report."""
+        scenario = self.scenario
+        for op in scenario.operations:
+            self.response_times.setdefault(op.label, LatencyHistogram())
+            self.service_times.setdefault(op.label, LatencyHistogram())
+            self.errors.setdefault(op.label, Counter())
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        schedule = scenario.schedule()
+
+        start = loop.time()
+        measure_from = start + scenario.warmup
+        workers = [
+            asyncio.create_task(self._worker(queue, measure_from))
+            for _ in range(scenario.workers)
+        ]
+
+        # The dispatcher never waits on responses: late servers cause queueing,
+        # and queueing time is charged to the request that waited.
+        for offset, op in schedule:
+            intended = start + offset
+            delay = intended - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.max_dispatch_lag = max(self.max_dispatch_lag, -delay)
+            queue.put_nowait((intended, op))
+
+        for _ in workers:
+            queue.put_nowait(None)
+        await asyncio.gather(*workers)
+
+        elapsed = loop.time() - measure_from
+        return self._report(elapsed, len(schedule))
+
+    async def _worker(self, queue: asyncio.Queue, measure_from: float):
+        loop = asyncio.get_running_loop()
+        timeout = self.scenario.timeout
+
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+
+            intended, op = item
+            sent = loop.time()
+            error = None
+            try:
+                await asyncio.wait_for(self.target.request(op.method, op.params), timeout)
+            except asyncio.TimeoutError:
+                error = "timeout"
+            except MCPRequestError as e:
+                error = f"rpc:{e.error.get('code')}"
+            except Exception as e:
+                error = type(e).__name__
+            done = loop.time()
+
+            if intended < measure_from:
+                continue
+
+            if error:
+                self.errors[op.label][error] += 1
+            else:
+                self.response_times[op.label].record(done - intended)
+                self.service_times[op.label].record(done - sent)
+
+    def _report(self, elapsed: float, scheduled: int) -> Dict:
+        overall_response = LatencyHistogram()
+        overall_service = LatencyHistogram()
+        operations = {}
+        total_errors = 0
+
+        for label in self.response_times:
+            response = self.response_times[label]
+            service = self.service_times[label]
+            errors = self.errors[label]
+            overall_response.merge(response)
+            overall_service.merge(service)
+            total_errors += sum(errors.values())
+
+            operations[label] = {
+                "response_time": response.summary(),
+                "service_time": service.summary(),
+                "errors": dict(errors)
+            }
+
+        completed = overall_response.total_count
+        return {
+            "scenario": self.scenario.name,
+            "mode": self.scenario.mode,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "duration_seconds": round(elapsed, 3),
+            "requests_scheduled": scheduled,
+            "requests_completed": completed,
+            "requests_failed": total_errors,
+            "throughput_rps": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+            "error_rate": round(total_errors / (completed + total_errors), 5)
+                          if completed + total_errors else 0.0,
+            "max_dispatch_lag_ms": round(self.max_dispatch_lag * 1000, 3),
+            "overall": {
+                "response_time": overall_response.summary(),
+                "service_time": overall_service.summary()
+            },
+            "operations": operations
+        }
+
+
+async def run_scenario(target, scenario: Scenario) -> Dict:
+    """Open target, run scenario, close target."""
+    await target.open()
+    try:
+        return await OpenLoopLoadGenerator(target, scenario).run()
+    finally:
+        await target.close()
+
+
+def write_json(results: Dict, path: str):
+    """Write results report as JSON."""
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def write_csv(results: Dict, path: str):
+    """Write one row per operation (plus overall) for spreadsheet comparison."""
+    percentile_keys = [f"p{p:g}_ms" for p in REPORTED_PERCENTILES]
+    fields = ["scenario", "timestamp", "operation", "count", "errors",
+              "mean_ms", "min_ms", *percentile_keys, "max_ms"]
+
+    rows = [("overall", results["overall"]["response_time"], results["requests_failed"])]
+    for label, data in results["operations"].items():
+        rows.append((label, data["response_time"], sum(data["errors"].values())))
+
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for label, summary, errors in rows:
+            writer.writerow({
+                "scenario": results["scenario"],
+                "timestamp": results["timestamp"],
+                "operation": label,
+                "errors": errors,
+                **{k: summary[k] for k in fields if k in summary}
+            })
+
+
+def compare_results(baseline: Dict, candidate: Dict) -> Dict[str, Dict[str, float]]:
+    """Percent change of response-time percentiles, per operation."""
+    keys = ["mean_ms", *[f"p{p:g}_ms" for p in REPORTED_PERCENTILES], "max_ms"]
+    comparison = {}
+
+    labels = ["overall", *candidate["operations"]]
+    for label in labels:
+        if label == "overall":
+            before = baseline["overall"]["response_time"]
+            after = candidate["overall"]["response_time"]
+        elif label in baseline["operations"]:
+            before = baseline["operations"][label]["response_time"]
+            after = candidate["operations"][label]["response_time"]
+        else:
+            continue
+
+        comparison[label] = {
+            key: round((after[key] - before[key]) / before[key] * 100, 1) if before[key] else 0.0
+            for key in keys
+        }
+
+    return comparison
+
+
+def _print_report(results: Dict):
+    print(f"{results['scenario']} ({results['mode']}): "
+          f"{results['requests_completed']} ok, {results['requests_failed']} failed, "
+          f"{results['throughput_rps']} req/s, "
+          f"max dispatch lag {results['max_dispatch_lag_ms']} ms")
+
+    header = f"{'operation':<32}{'count':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'p99.9':>10}{'max':>10}"
+    print(header)
+    rows = [("overall", results["overall"]["response_time"])]
+    rows += [(label, data["response_time"]) for label, data in results["operations"].items()]
+    for label, s in rows:
+        print(f"{label:<32}{s['count']:>8}{s['p50_ms']:>10}{s['p90_ms']:>10}"
+              f"{s['p99_ms']:>10}{s['p99.9_ms']:>10}{s['max_ms']:>10}")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Open-loop MCP load generator")
+    parser.add_argument("scenario", help="Scenario JSON file")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--stdio", help="Command line that starts a stdio MCP server")
+    target.add_argument("--http", help="URL of an HTTP MCP endpoint")
+    parser.add_argument("--json", help="Write results as JSON")
+    parser.add_argument("--csv", help="Write results as CSV")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    scenario = Scenario.load(args.scenario)
+    if args.stdio:
+        server = StdioMCPTarget(shlex.split(args.stdio))
+    else:
+        server = HTTPMCPTarget(args.http)
+
+    results = asyncio.run(run_scenario(server, scenario))
+    _print_report(results)
+
+    if args.json:
+        write_json(results, args.json)
+    if args.csv:
+        write_csv(results, args.csv)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for label, deltas in compare_results(baseline, results).items():
+            changes = ", ".join(f"{k} {v:+.1f}%" for k, v in deltas.items())
+            print(f"{label}: {changes}")
+
+
+if __name__ == "__main__":
+    main()